@@ -0,0 +1,213 @@
+import hashlib
+import io
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from heatmap import add_track_to_heatmap
+from insights import record_workout
+from records import update_records
+from routes import assign_route
+from segments import match_workout
+from sensors import save_sensors
+from track_clean import CLEAN_VERSION, clean_track
+from track_reader import Track, read_track
+from track_store import save_track
+from utils import TrackMetrics, date_keys, fit_zoom, route_polyline, track_metrics
+
+
+# Parsed uploads kept in memory, most recently used last
+PARSE_CACHE_SIZE = 16
+
+log = logging.getLogger(__name__)
+
+
+class ParsedActivity(NamedTuple):
+    sha256: str
+    track: Track
+    metrics: TrackMetrics
+    zoom: int
+    polyline: list        # simplified [(lat, lon), ...] for the map
+
+
+# ==========================================================
+# CONTENT HASH + PARSE CACHE
+# Streamlit reruns the page on every widget change; keyed by
+# the file's SHA-256 an upload is parsed once, not per rerun.
+# ==========================================================
+def file_sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+class _LRUCache:
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+_parse_cache = _LRUCache(PARSE_CACHE_SIZE)
+
+
+def parse_activity(data, name=".gpx", sha256=None):
+    """Track, metrics and map polyline for raw file bytes, cached by content hash."""
+    sha256 = sha256 or file_sha256(data)
+    cached = _parse_cache.get(sha256)
+    if cached is not None:
+        return cached
+
+    track = read_track(io.BytesIO(data), name=name)
+    metrics = track_metrics(
+        track.lat, track.lon, track.ele, track.time, track.segment
+    )
+    zoom = fit_zoom(track.lat, track.lon) if len(track.lat) else 13
+    polyline = route_polyline(track.lat, track.lon, zoom=zoom) if len(track.lat) else []
+
+    parsed = ParsedActivity(sha256, track, metrics, zoom, polyline)
+    _parse_cache.put(sha256, parsed)
+    return parsed
+
+
+def clean_activity(parsed, sport, smooth=False):
+    """parse_activity's result after GPS cleaning for a sport, also cached."""
+    key = (parsed.sha256, sport, smooth)
+    cached = _parse_cache.get(key)
+    if cached is not None:
+        return cached
+
+    track = clean_track(parsed.track, sport, smooth)
+    metrics = track_metrics(
+        track.lat, track.lon, track.ele, track.time, track.segment
+    )
+    polyline = route_polyline(track.lat, track.lon, zoom=parsed.zoom) if len(track.lat) else []
+
+    cleaned = ParsedActivity(parsed.sha256, track, metrics, parsed.zoom, polyline)
+    _parse_cache.put(key, cleaned)
+    return cleaned
+
+
+def find_by_sha256(conn, user_id, sha256):
+    """The user's workout already saved from this exact file, or None."""
+    return conn.execute(
+        "SELECT id, title, date FROM workouts WHERE user_id=? AND file_sha256=?",
+        (user_id, sha256)
+    ).fetchone()
+
+
+def known_sha256(conn, user_id):
+    """{sha256: workout_id} for every file the user has imported."""
+    rows = conn.execute(
+        "SELECT file_sha256, id FROM workouts WHERE user_id=? AND file_sha256 IS NOT NULL",
+        (user_id,)
+    )
+    return {sha: workout_id for sha, workout_id in rows}
+
+
+# ==========================================================
+# SAVE A RECORDED ACTIVITY
+# Shared by the GPX page and the bulk importer: one workouts
+# row plus its point stream, on the caller's transaction.
+# Features derived from the track (heatmap, segment efforts,
+# route cluster, PRs) each run in their own savepoint: all of
+# them can be rebuilt from stored tracks by their batch jobs,
+# so one failing is logged and undone instead of losing the save.
+# ==========================================================
+def _derive(conn, feature, workout_id, func, *args):
+    conn.execute("SAVEPOINT derive")
+    try:
+        func(conn, *args)
+    except Exception:
+        conn.execute("ROLLBACK TO derive")
+        log.exception("%s failed for workout %s", feature, workout_id)
+    conn.execute("RELEASE derive")
+
+
+def track_start(track):
+    """Naive UTC datetime of the first timestamped point, or None."""
+    timed = track.time[np.isfinite(track.time)]
+    if not len(timed):
+        return None
+    return datetime.fromtimestamp(timed[0], timezone.utc).replace(tzinfo=None)
+
+
+def save_activity(conn, user_id, track, title, sport, duration_min=None,
+                  started_at=None, notes="Imported from GPX", metrics=None,
+                  cleaned=None, file_sha256=None):
+    """Insert a workout and its track without committing; returns the workout id.
+
+    The raw track is stored; distance, ascent, segment efforts and PRs
+    come from the cleaned track (and its metrics) when given, else from clean_track.
+    With file_sha256 set, saving the same file twice for one user raises
+    sqlite3.IntegrityError; check find_by_sha256 first.
+    """
+    if cleaned is None:
+        cleaned = clean_track(track, sport)
+    if metrics is None:
+        metrics = track_metrics(
+            cleaned.lat, cleaned.lon, cleaned.ele, cleaned.time, cleaned.segment
+        )
+    if started_at is None:
+        started_at = track_start(track) or datetime.now()
+    if duration_min is None and metrics.elapsed_s:
+        duration_min = round(metrics.elapsed_s / 60, 1)
+
+    day, ts = date_keys(started_at)
+    distance_km = round(metrics.distance_km, 2)
+    cur = conn.execute(
+        """
+        INSERT INTO workouts
+        (user_id, title, sport, date, day, ts, distance_km, duration_min, ascent_m,
+         notes, file_sha256, raw_distance_km, clean_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (
+            user_id,
+            title,
+            sport,
+            started_at.isoformat(),
+            day,
+            ts,
+            distance_km,
+            duration_min,
+            round(metrics.ascent_m, 1),
+            notes,
+            file_sha256,
+            round(track.distance_km, 2),
+            CLEAN_VERSION
+        )
+    )
+
+    workout_id = cur.lastrowid
+    record_workout(conn, user_id, day,
+                   {"distance_km": distance_km, "duration_min": duration_min})
+    save_track(conn, user_id, workout_id, track)
+    save_sensors(conn, user_id, workout_id, track)
+
+    _derive(conn, "heatmap", workout_id, add_track_to_heatmap,
+            user_id, workout_id, track.lat, track.lon)
+    _derive(conn, "segments", workout_id, match_workout, user_id, workout_id, cleaned)
+    _derive(conn, "routes", workout_id, assign_route, user_id, workout_id, track)
+    _derive(conn, "records", workout_id, update_records, user_id, workout_id, sport, cleaned)
+    return workout_id
@@ -1,28 +1,317 @@
+import atexit
 import os
+import queue
 import sqlite3
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import get_context
+
 import bcrypt
+import numpy as np
+
+from utils import date_keys
 
 DB_PATH = os.path.join("data", "fittrack.db")
 
+# Idle connections kept around between reruns. Checkouts beyond this
+# open a fresh connection, which is simply closed again on release.
+POOL_SIZE = 8
+
+BUSY_TIMEOUT_MS = 5000
+CACHE_SIZE_KIB = 16 * 1024
+MMAP_SIZE = 128 * 1024 * 1024
+
+# Write-behind batching is opt-in: by default enqueue_write()
+# executes and commits synchronously. Set FITTRACK_WRITE_BEHIND=1
+# to batch writes on a background thread instead.
+WRITE_BEHIND = os.environ.get("FITTRACK_WRITE_BEHIND", "0") != "0"
+WRITE_BATCH_SIZE = 256
+WRITE_FLUSH_INTERVAL = 0.05
+
 
 # ==========================================================
-# CONNECTION
+# NUMPY ADAPTERS
+# pandas hands back numpy scalars; without these sqlite3 either
+# rejects them or, for older drivers, stores raw bytes as BLOBs.
 # ==========================================================
-def get_conn():
-    os.makedirs("data", exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+for _type in (np.int8, np.int16, np.int32, np.int64,
+              np.uint8, np.uint16, np.uint32, np.uint64):
+    sqlite3.register_adapter(_type, int)
+for _type in (np.float16, np.float32, np.float64):
+    sqlite3.register_adapter(_type, float)
+sqlite3.register_adapter(np.bool_, bool)
+
+
+# ==========================================================
+# CONNECTION POOL
+# ==========================================================
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() hands it back to the pool."""
+
+    def close(self):
+        _release(self)
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+
+_pool = queue.LifoQueue(maxsize=POOL_SIZE)
+
+
+def _connect():
+    os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=BUSY_TIMEOUT_MS / 1000,
+        check_same_thread=False,
+        factory=PooledConnection
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     conn.execute("PRAGMA foreign_keys = ON")
+    conn.db_path = DB_PATH
     return conn
 
 
+def _release(conn):
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        if conn.db_path == DB_PATH:
+            conn.row_factory = sqlite3.Row
+            _pool.put_nowait(conn)
+            return
+    except (sqlite3.Error, queue.Full):
+        pass
+    conn.discard()
+
+
+def get_conn():
+    while True:
+        try:
+            conn = _pool.get_nowait()
+        except queue.Empty:
+            return _connect()
+
+        if conn.db_path == DB_PATH:
+            return conn
+        conn.discard()
+
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; it is returned even on early exit."""
+    conn = get_conn()
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def close_pool():
+    while True:
+        try:
+            _pool.get_nowait().discard()
+        except queue.Empty:
+            return
+
+
+def process_pool(workers=None, **kwargs):
+    """ProcessPoolExecutor for batch jobs; workers open their own connections.
+
+    Workers are spawned rather than forked: a forked child inherits
+    this process's pooled connections, and SQLite connections must
+    never be used across fork().
+    """
+    return ProcessPoolExecutor(workers, mp_context=get_context("spawn"), **kwargs)
+
+
 # ==========================================================
-# SCHEMA
+# WRITE-BEHIND QUEUE
+# Small, high-frequency writes (glasses of water, habit ticks,
+# mood and meal logs) from every session are coalesced into one
+# transaction per batch on a background thread, so a burst of
+# clicks costs one fsync instead of one per click.
 # ==========================================================
-def ensure_schema():
-    conn = get_conn()
-    c = conn.cursor()
+class WriteTicket:
+    def __init__(self, sql=None, params=()):
+        self.sql = sql
+        self.params = params
+        self.error = None
+        self._done = threading.Event()
 
+    def done(self, error=None):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        if not self._done.wait(timeout):
+            raise TimeoutError("queued write not committed in time")
+        if self.error is not None:
+            raise self.error
+
+
+class _WriteBehind:
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._errors = {}
+        self._thread = None
+        self._broken = None   # set if the writer thread cannot connect
+
+    def submit(self, sql, params, key):
+        ticket = WriteTicket(sql, params)
+        with self._lock:
+            self._latest[key] = ticket
+            if self._broken is not None:
+                self._fail_ticket(key, ticket, self._broken)
+                return ticket
+            self._start()
+            # Queued under the lock so _fail() cannot miss it
+            self._queue.put((key, ticket))
+        return ticket
+
+    def wait(self, key, timeout=None):
+        with self._lock:
+            ticket = self._latest.get(key)
+        if ticket is not None:
+            if not ticket._done.wait(timeout):
+                # Still pending: keep it so a later wait() can see it commit
+                raise TimeoutError("queued write not committed in time")
+            with self._lock:
+                if self._latest.get(key) is ticket:
+                    del self._latest[key]
+                error = self._errors.pop(key, None)
+            if error is not None:
+                raise error
+
+    def flush(self, timeout=None):
+        with self._lock:
+            if self._thread is None or self._broken is not None:
+                return
+            marker = WriteTicket()
+            self._queue.put((None, marker))
+        marker._done.wait(timeout)
+
+    def _start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(
+                target=self._run, name="fittrack-write-behind", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        try:
+            conn = _connect()
+        except Exception as e:
+            self._fail(e)
+            return
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+            while len(batch) < WRITE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._commit(conn, batch)
+
+    def _commit(self, conn, batch):
+        writes = [(key, t) for key, t in batch if t.sql is not None]
+        failed = []
+        try:
+            with conn:
+                for _, ticket in writes:
+                    conn.execute(ticket.sql, ticket.params)
+        except Exception:
+            # Replay one by one so a single bad row cannot sink the batch
+            for key, ticket in writes:
+                try:
+                    with conn:
+                        conn.execute(ticket.sql, ticket.params)
+                except Exception as e:
+                    ticket.error = e
+                    failed.append((key, e))
+
+        with self._lock:
+            for key, error in failed:
+                self._errors.setdefault(key, error)
+        for _, ticket in batch:
+            ticket.done(ticket.error)
+
+    def _fail(self, error):
+        # Fail everything queued now and, via submit(), everything after
+        with self._lock:
+            self._broken = error
+            while True:
+                try:
+                    key, ticket = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                self._fail_ticket(key, ticket, error)
+
+    def _fail_ticket(self, key, ticket, error):
+        # Caller holds self._lock
+        if ticket.sql is not None:
+            self._errors.setdefault(key, error)
+        ticket.done(error)
+
+
+_writer = _WriteBehind()
+
+
+def enqueue_write(sql, params=(), key=None):
+    """Queue a single INSERT/UPDATE; key groups writes for wait_for_writes()."""
+    if not WRITE_BEHIND:
+        ticket = WriteTicket(sql, params)
+        with connection() as conn:
+            conn.execute(sql, params)
+            conn.commit()
+        ticket.done()
+        return ticket
+    return _writer.submit(sql, params, key)
+
+
+def wait_for_writes(key, timeout=None):
+    """Read-your-writes: block until every write queued under key is committed."""
+    _writer.wait(key, timeout)
+
+
+def flush_writes(timeout=None):
+    _writer.flush(timeout)
+
+
+atexit.register(flush_writes, 10)
+
+
+# ==========================================================
+# SCHEMA MIGRATIONS
+# Each migration runs exactly once; PRAGMA user_version records
+# how many have been applied to the database file.
+# ==========================================================
+def _columns(c, table):
+    return {row[1] for row in c.execute(f"PRAGMA table_info({table})")}
+
+
+def _add_column(c, table, column, decl):
+    if column not in _columns(c, table):
+        c.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+
+
+def _m001_base_schema(c):
     # USERS
     c.execute("""
     CREATE TABLE IF NOT EXISTS users(
@@ -155,7 +444,7 @@ def ensure_schema():
     )
     """)
 
-        # ==========================================================
+    # ==========================================================
     # WORKOUT GPS POINTS (For Workout Map)
     # ==========================================================
     c.execute("""
@@ -183,42 +472,663 @@ def ensure_schema():
     )
     """)
 
-    conn.commit()
 
 
-    # ----------------------------------------------------------
-    # CREATE DEFAULT ADMIN USER (if not exists)
-    # ----------------------------------------------------------
+def _m002_default_admin(c):
     c.execute("SELECT * FROM users WHERE username='admin'")
     if not c.fetchone():
         hashed = bcrypt.hashpw("admin123".encode(), bcrypt.gensalt())
         c.execute("INSERT INTO users(username,password_hash) VALUES (?,?)",
                   ("admin", hashed))
-        conn.commit()
 
-    conn.close()
+
+def _m003_workout_columns(c):
+    # Written by the map planner but never part of the original schema
+    _add_column(c, "workouts", "calories", "REAL")
+    _add_column(c, "workouts", "file_path", "TEXT")
+
+
+def _m004_user_date_indexes(c):
+    # Covers the dashboard / analytics / predictive reads without
+    # touching the table rows.
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_workouts_user_date
+    ON workouts(user_id, date, distance_km, duration_min)
+    """)
+
+    for table in ("journals", "events", "sleep", "nutrition",
+                  "habits", "hydration", "bmi_records"):
+        c.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{table}_user_date
+        ON {table}(user_id, date)
+        """)
+
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_goals_user_end
+    ON goals(user_id, end_date)
+    """)
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_workout_points_workout
+    ON workout_points(workout_id)
+    """)
+
+
+# Tables whose rows carry integer day (epoch day) and ts (epoch
+# seconds) keys alongside the free-form ISO "date" column.
+TIME_SERIES_TABLES = (
+    "workouts", "journals", "sleep", "nutrition",
+    "hydration", "habits", "bmi_records"
+)
+
+
+def _m005_date_keys(c):
+    for table in TIME_SERIES_TABLES:
+        _add_column(c, table, "ts", "INTEGER")
+        _add_column(c, table, "day", "INTEGER")
+
+        # Same rules as utils.date_keys: naive values are taken as UTC,
+        # offsets are honoured, unparseable dates stay NULL.
+        c.execute(f"""
+        UPDATE {table}
+        SET ts = CAST(strftime('%s', date) AS INTEGER)
+        WHERE ts IS NULL
+        """)
+        c.execute(f"""
+        UPDATE {table}
+        SET day = ts / 86400
+        WHERE day IS NULL AND ts IS NOT NULL
+        """)
+
+        c.execute(f"""
+        CREATE INDEX IF NOT EXISTS idx_{table}_user_day
+        ON {table}(user_id, day)
+        """)
+
+
+def _m006_hydration_unique_day(c):
+    # Glasses written as numpy int64 ended up as 8-byte BLOBs
+    rows = c.execute(
+        "SELECT id, glasses FROM hydration WHERE typeof(glasses)='blob'"
+    ).fetchall()
+    for row_id, raw in rows:
+        c.execute("UPDATE hydration SET glasses=? WHERE id=?",
+                  (int.from_bytes(raw, byteorder="little"), row_id))
+
+    # Racing tabs could insert the same day twice; keep the fullest row
+    c.execute("""
+    DELETE FROM hydration
+    WHERE id NOT IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY user_id, date
+                ORDER BY glasses DESC, id
+            ) AS rn
+            FROM hydration
+        )
+        WHERE rn = 1
+    )
+    """)
+
+    c.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_hydration_user_date
+    ON hydration(user_id, date)
+    """)
+
+
+def _m007_workout_point_streams(c):
+    # Full GPX streams: numeric epoch seconds instead of TEXT timestamps
+    _add_column(c, "workout_points", "elevation", "REAL")
+    _add_column(c, "workout_points", "ts", "REAL")
+    _add_column(c, "workout_points", "segment", "INTEGER DEFAULT 0")
+
+
+def _m008_workout_tracks(c):
+    # One encoded BLOB per workout; see track_store.encode_track
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS workout_tracks(
+        workout_id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        n_points INTEGER,
+        data BLOB NOT NULL,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_workout_tracks_user
+    ON workout_tracks(user_id)
+    """)
+
+
+def _m009_workout_geometry(c):
+    # Cached per-point RDP importance for map rendering
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS workout_geometry(
+        workout_id INTEGER PRIMARY KEY,
+        importance BLOB NOT NULL,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    )
+    """)
+
+
+def _m010_workout_file_hash(c):
+    # SHA-256 of the uploaded file; one workout per file per user
+    _add_column(c, "workouts", "file_sha256", "TEXT")
+    c.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_workouts_user_sha
+    ON workouts(user_id, file_sha256) WHERE file_sha256 IS NOT NULL
+    """)
+
+
+# Frozen copies of the track_store blob layout and utils geohash
+# that _m011 was written against; migrations never import live
+# application code, so later changes there cannot alter them.
+_M011_TRACK_HEADER = struct.Struct("<4sBIxxxd")  # magic, flags, n, t0
+_M011_GEOHASH_BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+
+
+def _m011_blob_bounds(blob):
+    # (min_lat, max_lat, min_lon, max_lon) of an encoded track, or None
+    magic, flags, n, _ = _M011_TRACK_HEADER.unpack_from(blob)
+    if magic != b"FTK1" or not n:
+        return None
+    body = memoryview(blob)[_M011_TRACK_HEADER.size:]
+    if flags & 1:
+        body = zlib.decompress(body)
+    deltas = np.frombuffer(body, dtype="<i4", count=2 * n).reshape(2, n)
+    lat, lon = (np.cumsum(d, dtype=np.int32) / 1e7 for d in deltas)
+    return lat.min(), lat.max(), lon.min(), lon.max()
+
+
+def _m011_geohash(lat, lon, precision=7):
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    x = np.clip(((lon + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    y = np.clip(((lat + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+
+    code = np.zeros(len(lat), dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = _M011_GEOHASH_BASE32[(code[:, None] >> shifts) & 31]
+    return np.frombuffer(chars.tobytes(), dtype=f"S{precision}").astype(str)
+
+
+def _m011_spatial_index(c):
+    # Per-workout bounding boxes; rtree has no FKs, so a trigger cleans up
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS workout_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon, +user_id INTEGER
+    )
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS workouts_rtree_delete
+    AFTER DELETE ON workouts BEGIN
+        DELETE FROM workout_rtree WHERE id = old.id;
+    END
+    """)
+
+    _add_column(c, "workout_points", "geohash", "TEXT")
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_workout_points_user_geohash "
+        "ON workout_points(user_id, geohash)"
+    )
+
+    c.execute("""
+    INSERT OR REPLACE INTO workout_rtree
+    SELECT workout_id, MIN(latitude), MAX(latitude),
+           MIN(longitude), MAX(longitude), MAX(user_id)
+    FROM workout_points
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    GROUP BY workout_id
+    """)
+
+    for workout_id, user_id, blob in c.execute(
+        "SELECT workout_id, user_id, data FROM workout_tracks"
+    ).fetchall():
+        bounds = _m011_blob_bounds(blob)
+        if bounds:
+            c.execute(
+                "INSERT OR REPLACE INTO workout_rtree VALUES (?, ?, ?, ?, ?, ?)",
+                (workout_id, *bounds, user_id)
+            )
+
+    rows = c.execute("""
+    SELECT id, latitude, longitude FROM workout_points
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+    """).fetchall()
+    if rows:
+        ids, lat, lon = (np.array(col) for col in zip(*rows))
+        c.executemany(
+            "UPDATE workout_points SET geohash=? WHERE id=?",
+            zip(_m011_geohash(lat, lon).tolist(), ids.tolist())
+        )
+
+
+def _m012_heatmap(c):
+    # Sparse per-user route counts per grid cell (see heatmap.py);
+    # existing tracks are counted by heatmap.backfill_heatmap
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS heatmap_cells(
+        user_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        cx INTEGER NOT NULL,
+        cy INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY(user_id, level, cx, cy)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS heatmap_workouts(
+        workout_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    )
+    """)
+
+
+def _m013_segments(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS segments(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        name TEXT NOT NULL,
+        points TEXT NOT NULL,
+        length_km REAL,
+        backfilled INTEGER DEFAULT 0,
+        created_at TEXT DEFAULT (datetime('now')),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE SET NULL
+    )
+    """)
+    c.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS segment_rtree USING rtree(
+        id, min_lat, max_lat, min_lon, max_lon
+    )
+    """)
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS segments_rtree_delete
+    AFTER DELETE ON segments BEGIN
+        DELETE FROM segment_rtree WHERE id = old.id;
+    END
+    """)
+
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS segment_efforts(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        segment_id INTEGER NOT NULL,
+        workout_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        start_idx INTEGER NOT NULL,
+        end_idx INTEGER NOT NULL,
+        elapsed_s REAL NOT NULL,
+        start_ts REAL,
+        UNIQUE(segment_id, workout_id, start_idx),
+        FOREIGN KEY(segment_id) REFERENCES segments(id) ON DELETE CASCADE,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_segment_efforts_rank "
+        "ON segment_efforts(segment_id, user_id, elapsed_s)"
+    )
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_segment_efforts_workout "
+        "ON segment_efforts(workout_id)"
+    )
+
+
+def _m014_personal_records(c):
+    # Current best per user, sport and standard distance/duration
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS personal_records(
+        user_id INTEGER NOT NULL,
+        sport TEXT NOT NULL,
+        label TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        target REAL NOT NULL,
+        value REAL NOT NULL,
+        workout_id INTEGER,
+        start_idx INTEGER,
+        end_idx INTEGER,
+        achieved_ts REAL,
+        PRIMARY KEY(user_id, sport, label),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE SET NULL
+    )
+    """)
+
+
+def _m015_cleaned_metrics(c):
+    # distance_km is from the cleaned track; the raw sum is kept beside it
+    _add_column(c, "workouts", "raw_distance_km", "REAL")
+    _add_column(c, "workouts", "clean_version", "INTEGER")
+
+
+def _m016_workout_sensors(c):
+    # Heart rate / cadence / power streams (see sensors.py). Files
+    # imported before this keep no sensor data, so nothing to backfill.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS workout_sensors(
+        workout_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        n_points INTEGER NOT NULL,
+        data BLOB NOT NULL,
+        hr_seconds BLOB NOT NULL,
+        avg_hr REAL,
+        max_hr REAL,
+        avg_cadence REAL,
+        avg_power REAL,
+        np_power REAL,
+        drift_pct REAL,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_workout_sensors_user "
+        "ON workout_sensors(user_id)"
+    )
+
+
+def _m017_route_clusters(c):
+    # Recurring routes (see routes.py); history is signed by
+    # "python routes.py cluster", not here
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS route_clusters(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT,
+        created_at TEXT DEFAULT (datetime('now')),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS workout_routes(
+        workout_id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        cluster_id INTEGER,
+        signature BLOB,
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE,
+        FOREIGN KEY(cluster_id) REFERENCES route_clusters(id) ON DELETE SET NULL
+    )
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_workout_routes_cluster "
+        "ON workout_routes(cluster_id)"
+    )
+
+    # MinHash LSH band buckets
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS route_buckets(
+        workout_id INTEGER NOT NULL,
+        band INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        bucket INTEGER NOT NULL,
+        PRIMARY KEY(workout_id, band),
+        FOREIGN KEY(workout_id) REFERENCES workouts(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    c.execute(
+        "CREATE INDEX IF NOT EXISTS idx_route_buckets_lookup "
+        "ON route_buckets(user_id, band, bucket)"
+    )
+
+
+def _m018_data_versions(c):
+    # Per-user counter bumped by every workout insert, update and
+    # delete, so caches keyed on it never serve stale results
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS user_data_versions(
+        user_id INTEGER PRIMARY KEY,
+        workouts_version INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+    bump = """
+        INSERT INTO user_data_versions (user_id, workouts_version)
+        SELECT {uid}, 1 WHERE {uid} IS NOT NULL{extra}
+        ON CONFLICT(user_id) DO UPDATE SET workouts_version = workouts_version + 1;
+    """
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS workouts_version_insert
+    AFTER INSERT ON workouts BEGIN
+        {bump.format(uid="new.user_id", extra="")}
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS workouts_version_update
+    AFTER UPDATE ON workouts BEGIN
+        {bump.format(uid="new.user_id", extra="")}
+        {bump.format(uid="old.user_id", extra=" AND old.user_id IS NOT new.user_id")}
+    END
+    """)
+    c.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS workouts_version_delete
+    AFTER DELETE ON workouts BEGIN
+        {bump.format(uid="old.user_id", extra="")}
+    END
+    """)
+
+
+def _m019_trend_stats(c):
+    # Online least-squares trend sums per user, metric and half-life
+    # (see insights.py); built on first use, so nothing to backfill
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS trend_stats(
+        user_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        half_life REAL NOT NULL,
+        origin_day INTEGER NOT NULL,
+        ref_day INTEGER NOT NULL,
+        n REAL NOT NULL,
+        sx REAL NOT NULL,
+        sy REAL NOT NULL,
+        sxy REAL NOT NULL,
+        sxx REAL NOT NULL,
+        workouts_version INTEGER NOT NULL,
+        PRIMARY KEY(user_id, metric, half_life)
+    ) WITHOUT ROWID
+    """)
+
+
+def _m020_predictions(c):
+    # Batch forecasts (python insights.py forecast)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS predictions(
+        user_id INTEGER NOT NULL,
+        metric TEXT NOT NULL,
+        model TEXT NOT NULL,
+        week_ahead INTEGER NOT NULL,
+        value REAL NOT NULL,
+        PRIMARY KEY(user_id, metric, model, week_ahead)
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS forecast_status(
+        user_id INTEGER PRIMARY KEY,
+        workouts_version INTEGER NOT NULL,
+        n_workouts INTEGER NOT NULL,
+        computed_at TEXT NOT NULL
+    )
+    """)
+
+
+def _m021_weekly_forecasts(c):
+    # Weekly Holt forecasts carry an interval and a backtest error
+    _add_column(c, "predictions", "lower", "REAL")
+    _add_column(c, "predictions", "upper", "REAL")
+    _add_column(c, "predictions", "backtest_mae", "REAL")
+    _add_column(c, "forecast_status", "week_start", "INTEGER")
+    c.execute("DELETE FROM predictions WHERE model != 'weekly'")
+    c.execute("DELETE FROM forecast_status")
+
+
+def _m022_drop_duplicate_hydration_index(c):
+    # Same columns as _m006's unique index; keeping both doubles every write
+    c.execute("DROP INDEX IF EXISTS idx_hydration_user_date")
+
+
+def _m023_backfill_point_ts(c):
+    # Rows written before _m007 only have the TEXT timestamp
+    c.execute("""
+    UPDATE workout_points
+    SET ts = CAST(strftime('%s', timestamp) AS REAL)
+    WHERE ts IS NULL AND timestamp IS NOT NULL
+    """)
+
+
+def _m024_heatmap_ownership(c):
+    # Cells now belong to their user, and every counted workout keeps
+    # the cells it added so deleting or re-counting it subtracts them.
+    # Existing counts cannot be traced back to workouts, so they are
+    # dropped and heatmap.backfill_heatmap recounts all history.
+    c.execute("DELETE FROM heatmap_workouts")
+    c.execute("DROP TABLE IF EXISTS heatmap_cells")
+    c.execute("""
+    CREATE TABLE heatmap_cells(
+        user_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        cx INTEGER NOT NULL,
+        cy INTEGER NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY(user_id, level, cx, cy),
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS heatmap_workout_cells(
+        workout_id INTEGER NOT NULL,
+        level INTEGER NOT NULL,
+        cx INTEGER NOT NULL,
+        cy INTEGER NOT NULL,
+        PRIMARY KEY(workout_id, level, cx, cy)
+    ) WITHOUT ROWID
+    """)
+    # Fires for direct deletes and for the cascade from workouts
+    c.execute("""
+    CREATE TRIGGER IF NOT EXISTS heatmap_workouts_delete
+    AFTER DELETE ON heatmap_workouts BEGIN
+        UPDATE heatmap_cells SET count = count - 1
+        FROM heatmap_workout_cells w
+        WHERE w.workout_id = old.workout_id
+          AND heatmap_cells.user_id = old.user_id
+          AND heatmap_cells.level = w.level
+          AND heatmap_cells.cx = w.cx
+          AND heatmap_cells.cy = w.cy;
+        DELETE FROM heatmap_cells
+        WHERE user_id = old.user_id AND count <= 0
+          AND (level, cx, cy) IN (
+              SELECT level, cx, cy FROM heatmap_workout_cells
+              WHERE workout_id = old.workout_id
+          );
+        DELETE FROM heatmap_workout_cells WHERE workout_id = old.workout_id;
+    END
+    """)
+
+
+# Append only: never reorder or edit a migration that has shipped.
+MIGRATIONS = [
+    _m001_base_schema,
+    _m002_default_admin,
+    _m003_workout_columns,
+    _m004_user_date_indexes,
+    _m005_date_keys,
+    _m006_hydration_unique_day,
+    _m007_workout_point_streams,
+    _m008_workout_tracks,
+    _m009_workout_geometry,
+    _m010_workout_file_hash,
+    _m011_spatial_index,
+    _m012_heatmap,
+    _m013_segments,
+    _m014_personal_records,
+    _m015_cleaned_metrics,
+    _m016_workout_sensors,
+    _m017_route_clusters,
+    _m018_data_versions,
+    _m019_trend_stats,
+    _m020_predictions,
+    _m021_weekly_forecasts,
+    _m022_drop_duplicate_hydration_index,
+    _m023_backfill_point_ts,
+    _m024_heatmap_ownership,
+]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def ensure_schema():
+    with connection() as conn:
+        if schema_version(conn) >= len(MIGRATIONS):
+            return
+
+        # IMMEDIATE takes the write lock up front so concurrent app
+        # processes queue here instead of migrating twice.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            version = schema_version(conn)
+            c = conn.cursor()
+            for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+                migration(c)
+                c.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+# ==========================================================
+# DATA VERSIONS
+# ==========================================================
+def workouts_version(conn, user_id):
+    """Changes whenever any of the user's workouts is added, edited or removed."""
+    row = conn.execute(
+        "SELECT workouts_version FROM user_data_versions WHERE user_id=?", (user_id,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+# ==========================================================
+# HYDRATION
+# ==========================================================
+HYDRATION_INCREMENT_SQL = """
+INSERT INTO hydration (user_id, date, day, ts, glasses)
+VALUES (?, ?, ?, ?, MAX(?, 0))
+ON CONFLICT(user_id, date) DO UPDATE SET glasses = MAX(glasses + ?, 0)
+"""
+
+
+def add_glasses(user_id, on_date, delta=1):
+    """Atomically add delta (may be negative) to a day's glasses, never below 0."""
+    day, ts = date_keys(on_date)
+    return enqueue_write(
+        HYDRATION_INCREMENT_SQL,
+        (user_id, on_date.isoformat(), day, ts, delta, delta),
+        key=user_id
+    )
 
 
 # ==========================================================
 # USER FUNCTIONS
 # ==========================================================
 def create_user(username, password):
-    conn = get_conn()
-    c = conn.cursor()
     hashed = bcrypt.hashpw(password.encode(), bcrypt.gensalt())
-    c.execute("INSERT INTO users(username,password_hash) VALUES (?,?)",
-              (username, hashed))
-    conn.commit()
-    conn.close()
+    with connection() as conn:
+        conn.execute("INSERT INTO users(username,password_hash) VALUES (?,?)",
+                     (username, hashed))
+        conn.commit()
 
 
 def get_user(username):
-    conn = get_conn()
-    c = conn.cursor()
-    c.execute("SELECT * FROM users WHERE username=?", (username,))
-    row = c.fetchone()
-    conn.close()
-    return row
+    with connection() as conn:
+        return conn.execute("SELECT * FROM users WHERE username=?",
+                            (username,)).fetchone()
 
 
 def verify_password(password, hash_):
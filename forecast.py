@@ -0,0 +1,172 @@
+from typing import NamedTuple
+
+import numpy as np
+
+
+FORECAST_WEEKS = 5
+
+# Fewest weeks of history (first workout to now) worth forecasting
+MIN_WEEKS = 4
+
+# Smoothing grid searched per series: alpha for the level, and the
+# trend's beta as a share of alpha (ETS form, so beta <= alpha)
+ALPHAS = np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9])
+BETA_SHARES = np.array([0.0, 0.05, 0.1, 0.3])
+
+# Two-sided prediction interval
+INTERVAL_LEVEL = 80
+INTERVAL_Z = 1.2816
+
+
+class WeeklyForecast(NamedTuple):
+    weeks: np.ndarray        # (T,) epoch day each week starts (Monday)
+    history: np.ndarray      # (U, T) weekly totals, NaN before a series starts
+    fitted: np.ndarray       # (U, T) one-step-ahead fits
+    forecast: np.ndarray     # (U, H) H weeks from end_day's, NaN if too little history
+    lower: np.ndarray        # (U, H)
+    upper: np.ndarray        # (U, H)
+    alpha: np.ndarray        # (U,)
+    beta: np.ndarray         # (U,)
+    backtest_mae: np.ndarray  # (U,) error of forecasting the last H weeks
+
+
+# ==========================================================
+# WEEKLY SERIES
+# ==========================================================
+def week_start(days):
+    # Epoch day 0 was a Thursday
+    return (np.asarray(days, dtype=np.int64) + 3) // 7 * 7 - 3
+
+
+def weekly_matrix(series, days, values, n_series, end_day):
+    """(weeks, Y[n_series, T]) of weekly sums over the full weeks before end_day's.
+
+    series holds each workout's row index. Weeks before a series'
+    first workout are NaN; later weeks without workouts are 0. The
+    week containing end_day is still in progress, so it is left out
+    and becomes the first forecast week.
+    """
+    series = np.asarray(series, dtype=np.int64)
+    days = np.asarray(days, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    last = int(week_start(end_day)) - 7
+    ok = np.isfinite(values) & (days < last + 7)
+    series, days, values = series[ok], days[ok], values[ok]
+
+    first = int(week_start(days.min())) if len(days) else last
+    weeks = np.arange(first, last + 1, 7)
+
+    col = (week_start(days) - first) // 7
+    Y = np.zeros((n_series, len(weeks)))
+    np.add.at(Y, (series, col), values)
+
+    starts = np.full(n_series, len(weeks))
+    np.minimum.at(starts, series, col)
+    Y[np.arange(len(weeks)) < starts[:, None]] = np.nan
+    return weeks, Y
+
+
+# ==========================================================
+# HOLT'S LINEAR METHOD
+# Additive level + trend exponential smoothing in error form:
+#   e = y - (l + b);  l += b + alpha e;  b += beta e
+# It runs week by week, but every series and every (alpha, beta)
+# of the grid is one row of a 2D array, so the whole search is
+# T vectorized steps. Each series keeps the pair with the lowest
+# one-step-ahead squared error, and intervals use the closed-form
+# h-step variance of ETS(A,A,N).
+# ==========================================================
+def _grid():
+    alpha = np.repeat(ALPHAS, len(BETA_SHARES))
+    return alpha, alpha * np.tile(BETA_SHARES, len(ALPHAS))
+
+
+def _smooth(Y, alpha, beta, keep_fitted=False):
+    """Run the filter with alpha/beta broadcast against the series axis.
+
+    alpha and beta are (G, 1) for a grid over all series or (U,) for
+    one pair per series. Returns level, trend, sse, n, fitted.
+    """
+    U, T = Y.shape
+    shape = np.broadcast_shapes(np.shape(alpha), (U,))
+    level = np.zeros(shape)
+    trend = np.zeros(shape)
+    sse = np.zeros(shape)
+    fitted = np.full(shape + (T,), np.nan) if keep_fitted else None
+    n = np.zeros(U)
+    steps = np.zeros(U)
+    seen = np.zeros(U, dtype=bool)
+
+    for t in range(T):
+        y = Y[:, t]
+        has = np.isfinite(y)
+        active = seen & has
+        pred = level + trend
+        if keep_fitted:
+            fitted[..., t] = np.where(active, pred, np.nan)
+
+        e = np.where(active, y - pred, 0.0)
+        level = np.where(active, pred + alpha * e, level)
+        trend = np.where(active, trend + beta * e, trend)
+
+        # The first error only reflects the flat starting trend
+        scored = active & (steps >= 1)
+        sse += np.where(scored, e * e, 0.0)
+        n += scored
+        steps += active
+
+        start = has & ~seen
+        level = np.where(start, y, level)
+        seen |= has
+
+    return level, trend, sse, n, fitted
+
+
+def fit_holt(Y, horizon=FORECAST_WEEKS):
+    """Best-fit Holt forecast per row of Y.
+
+    Returns forecast, lower, upper (U, H), alpha, beta (U,) and the
+    one-step-ahead fitted values (U, T).
+    """
+    alpha, beta = _grid()
+    sse = _smooth(Y, alpha[:, None], beta[:, None])[2]
+
+    # Re-run once with each series' winning pair to keep its fit
+    best = np.argmin(sse, axis=0)
+    a, b = alpha[best], beta[best]
+    level, trend, sse, n, fitted = _smooth(Y, a, b, keep_fitted=True)
+
+    h = np.arange(1, horizon + 1)
+    forecast = np.maximum(level[:, None] + h * trend[:, None], 0)
+
+    sigma2 = sse / np.maximum(n - 2, 1)
+    var = sigma2[:, None] * (
+        1 + (h - 1) * (a[:, None] ** 2 + a[:, None] * b[:, None] * h
+                       + b[:, None] ** 2 * h * (2 * h - 1) / 6)
+    )
+    spread = INTERVAL_Z * np.sqrt(var)
+
+    short = np.isfinite(Y).sum(axis=1) < MIN_WEEKS
+    forecast[short] = np.nan
+    spread[short] = np.nan
+
+    return forecast, np.maximum(forecast - spread, 0), forecast + spread, a, b, fitted
+
+
+def backtest_mae(Y, horizon=FORECAST_WEEKS):
+    """Mean absolute error forecasting each series' last horizon weeks."""
+    mae = np.full(len(Y), np.nan)
+    if Y.shape[1] <= horizon:
+        return mae
+    error = np.abs(fit_holt(Y[:, :-horizon], horizon)[0] - Y[:, -horizon:])
+    ok = np.isfinite(error).all(axis=1)
+    mae[ok] = error[ok].mean(axis=1)
+    return mae
+
+
+def forecast_weekly(series, days, values, n_series, end_day, horizon=FORECAST_WEEKS):
+    """WeeklyForecast for many series at once from per-workout arrays."""
+    weeks, Y = weekly_matrix(series, days, values, n_series, end_day)
+    forecast, lower, upper, alpha, beta, fitted = fit_holt(Y, horizon)
+    return WeeklyForecast(weeks, Y, fitted, forecast, lower, upper, alpha, beta,
+                          backtest_mae(Y, horizon))
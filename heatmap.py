@@ -0,0 +1,237 @@
+import argparse
+import math
+import sys
+
+import numpy as np
+
+
+# Web Mercator grid levels: a level-L cell is 1/2^L of the world's
+# width (level 18 ~ 150 m, 16 ~ 600 m, 14 ~ 2.4 km at the equator).
+HEATMAP_LEVELS = (14, 16, 18)
+
+# Grid cells per screen pixel side the renderer aims for
+CELL_PX = 8
+
+# Largest overlay image side; wider views are binned down
+MAX_IMAGE_PX = 512
+
+
+# ==========================================================
+# GRID CELLS
+# Each workout adds 1 to every cell its route touches, so a
+# cell's count is the number of routes through it. The cells a
+# workout added are kept in heatmap_workout_cells, and removing
+# the workout from heatmap_workouts subtracts them again.
+# ==========================================================
+def _mercator(lat, lon):
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -85.05112878, 85.05112878)
+    x = (np.asarray(lon, dtype=np.float64) + 180) / 360
+    s = np.sin(np.radians(lat))
+    y = 0.5 - np.log((1 + s) / (1 - s)) / (4 * math.pi)
+    return x, y
+
+
+def _lat_from_y(y):
+    return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y))))
+
+
+def track_cells(lat, lon, level):
+    """Unique (cx, cy) cells at level crossed by the route, gaps filled in."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    if not ok.any():
+        return np.empty((0, 2), dtype=np.int64)
+
+    scale = 1 << level
+    x, y = _mercator(lat[ok], lon[ok])
+    x, y = x * scale, y * scale
+
+    # Sample each hop at least once per half cell so sparse routes
+    # (e.g. planner clicks) still paint a continuous line
+    if len(x) > 1:
+        steps = np.maximum(np.ceil(np.hypot(np.diff(x), np.diff(y)) * 2), 1).astype(np.int64)
+        start = np.repeat(np.arange(len(x) - 1), steps)
+        frac = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+        frac = frac / np.repeat(steps, steps)
+        x = np.append(x[start] + frac * (x[start + 1] - x[start]), x[-1])
+        y = np.append(y[start] + frac * (y[start + 1] - y[start]), y[-1])
+
+    cells = np.column_stack([x, y]).astype(np.int64)
+    cells = np.clip(cells, 0, scale - 1)
+    return np.unique(cells, axis=0)
+
+
+def add_track_to_heatmap(conn, user_id, workout_id, lat, lon):
+    """Count a workout's route into the user's grid (no commit).
+
+    A workout counted before is subtracted first (the delete trigger
+    on heatmap_workouts), so a re-saved track replaces its old cells.
+    """
+    conn.execute("DELETE FROM heatmap_workouts WHERE workout_id=?", (workout_id,))
+    conn.execute(
+        "INSERT INTO heatmap_workouts (workout_id, user_id) VALUES (?, ?)",
+        (workout_id, user_id)
+    )
+    for level in HEATMAP_LEVELS:
+        cells = [(level, cx, cy) for cx, cy in track_cells(lat, lon, level).tolist()]
+        conn.executemany(
+            """
+            INSERT INTO heatmap_workout_cells (workout_id, level, cx, cy)
+            VALUES (?, ?, ?, ?)
+            """,
+            ((workout_id, *cell) for cell in cells)
+        )
+        conn.executemany(
+            """
+            INSERT INTO heatmap_cells (user_id, level, cx, cy, count)
+            VALUES (?, ?, ?, ?, 1)
+            ON CONFLICT(user_id, level, cx, cy) DO UPDATE SET count = count + 1
+            """,
+            ((user_id, *cell) for cell in cells)
+        )
+
+
+def rebuild_heatmap(conn, user_id=None, progress=None):
+    """Recount grids from stored tracks (all users by default); no commit."""
+    from track_store import load_track, workouts_with_points
+
+    if user_id is None:
+        users = [r[0] for r in conn.execute("SELECT id FROM users")]
+    else:
+        users = [user_id]
+
+    for uid in users:
+        conn.execute("DELETE FROM heatmap_cells WHERE user_id=?", (uid,))
+        conn.execute("DELETE FROM heatmap_workouts WHERE user_id=?", (uid,))
+        for row in workouts_with_points(conn, uid):
+            track = load_track(conn, row["id"])
+            add_track_to_heatmap(conn, uid, row["id"], track.lat, track.lon)
+        if progress:
+            progress(uid)
+
+
+def backfill_heatmap(conn, progress=None):
+    """Count every stored track not yet in its owner's grid (no commit).
+
+    Migrations only create the tables; this fills them from existing
+    history and is a no-op once every track has been counted.
+    """
+    from track_store import load_track
+
+    rows = conn.execute(
+        """
+        SELECT w.id, w.user_id FROM workouts w
+        WHERE w.user_id IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM heatmap_workouts h WHERE h.workout_id = w.id)
+          AND (EXISTS (SELECT 1 FROM workout_tracks t WHERE t.workout_id = w.id)
+            OR EXISTS (SELECT 1 FROM workout_points p WHERE p.workout_id = w.id))
+        """
+    ).fetchall()
+    for done, (workout_id, user_id) in enumerate(rows, 1):
+        track = load_track(conn, workout_id)
+        add_track_to_heatmap(conn, user_id, workout_id, track.lat, track.lon)
+        if progress:
+            progress(done, len(rows))
+    return len(rows)
+
+
+# ==========================================================
+# RENDERING
+# Only the cells inside the viewport are read, so the cost
+# follows the size of the visible grid, not the GPS history.
+# ==========================================================
+def pick_level(zoom):
+    """Grid level whose cells are about CELL_PX screen pixels at this zoom."""
+    target = zoom + 8 - int(math.log2(CELL_PX))
+    return min(HEATMAP_LEVELS, key=lambda level: abs(level - target))
+
+
+def heatmap_image(conn, user_id, bounds, zoom):
+    """RGBA overlay for (south, west, north, east) at a map zoom.
+
+    Returns (image, [[south, west], [north, east]]) snapped to the
+    grid, or None when the user has no routes in view.
+    """
+    level = pick_level(zoom)
+    scale = 1 << level
+    south, west, north, east = bounds
+
+    (x0, x1), (y1, y0) = _mercator([south, north], [west, east])
+    cx0, cx1 = int(x0 * scale), min(int(x1 * scale), scale - 1)
+    cy0, cy1 = int(y0 * scale), min(int(y1 * scale), scale - 1)
+
+    rows = conn.execute(
+        """
+        SELECT cx, cy, count FROM heatmap_cells
+        WHERE user_id=? AND level=? AND cx BETWEEN ? AND ? AND cy BETWEEN ? AND ?
+        """,
+        (user_id, level, cx0, cx1, cy0, cy1)
+    ).fetchall()
+    if not rows:
+        return None
+
+    cells = np.array(rows, dtype=np.int64)
+    factor = max(1, math.ceil(max(cx1 - cx0 + 1, cy1 - cy0 + 1) / MAX_IMAGE_PX))
+    width = (cx1 - cx0) // factor + 1
+    height = (cy1 - cy0) // factor + 1
+
+    grid = np.zeros((height, width))
+    np.maximum.at(
+        grid,
+        ((cells[:, 1] - cy0) // factor, (cells[:, 0] - cx0) // factor),
+        cells[:, 2]
+    )
+
+    # Log scale so one favourite loop doesn't wash out everything else
+    heat = np.log1p(grid) / np.log1p(grid.max())
+    image = np.zeros((height, width, 4), dtype=np.uint8)
+    image[..., 0] = 255
+    image[..., 1] = (220 * (1 - heat)).astype(np.uint8)
+    image[..., 3] = np.where(grid > 0, 90 + 165 * heat, 0).astype(np.uint8)
+
+    snapped = [
+        [_lat_from_y((cy0 + height * factor) / scale), (cx0 / scale) * 360 - 180],
+        [_lat_from_y(cy0 / scale), ((cx0 + width * factor) / scale) * 360 - 180],
+    ]
+    return image, snapped
+
+
+# ==========================================================
+# CLI
+#   python heatmap.py rebuild [--user NAME]
+#   python heatmap.py backfill
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Personal route heatmap grids")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild = sub.add_parser("rebuild", help="recount grids from stored tracks")
+    rebuild.add_argument("--user", help="username (default: everyone)")
+    sub.add_parser("backfill", help="count tracks not yet in any grid")
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    with db.connection() as conn:
+        if args.command == "backfill":
+            n = backfill_heatmap(conn)
+            conn.commit()
+            print(f"Counted {n} workouts")
+            return 0
+
+        user_id = None
+        if args.user:
+            user = db.get_user(args.user)
+            if user is None:
+                print(f"No such user: {args.user}", file=sys.stderr)
+                return 1
+            user_id = user["id"]
+
+        rebuild_heatmap(conn, user_id, progress=lambda uid: print(f"user {uid} done"))
+        conn.commit()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
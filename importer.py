@@ -0,0 +1,254 @@
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time as timer
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import NamedTuple
+
+from activities import file_sha256, known_sha256, save_activity
+from track_clean import clean_track
+from track_reader import activity_format, read_track
+from utils import track_metrics
+
+
+# Parsed activities written per transaction
+COMMIT_BATCH = 100
+
+
+class ImportReport(NamedTuple):
+    imported: int
+    errors: list          # [(file name, message), ...]
+    seconds: float
+    duplicates: list      # [(file name, existing workout id), ...]
+
+
+# ==========================================================
+# SOURCES
+# A job is (label, path, member): member is None for plain
+# files, otherwise the entry inside the zip at path. Workers
+# open files themselves so the archive is never pickled.
+# ==========================================================
+def collect_jobs(source):
+    if os.path.isdir(source):
+        jobs = []
+        for root, _, files in os.walk(source):
+            for name in sorted(files):
+                if activity_format(name):
+                    path = os.path.join(root, name)
+                    jobs.append((os.path.relpath(path, source), path, None))
+        return jobs
+
+    if zipfile.is_zipfile(source):
+        with zipfile.ZipFile(source) as archive:
+            return [
+                (info.filename, source, info.filename)
+                for info in archive.infolist()
+                if not info.is_dir() and activity_format(info.filename)
+            ]
+
+    if activity_format(source):
+        return [(os.path.basename(source), source, None)]
+
+    raise ValueError(f"{source} is not a directory, zip archive or activity file")
+
+
+def _title(label):
+    name = os.path.basename(label)
+    for ext in (".gz", ".gpx", ".tcx", ".fit"):
+        if name.lower().endswith(ext):
+            name = name[:-len(ext)]
+    return name or "Imported Activity"
+
+
+# ==========================================================
+# WORKER (runs in a child process)
+# Returns (label, sha256, (track, cleaned, metrics) or None,
+# error). Files whose hash is already stored are not parsed.
+# ==========================================================
+_known_sha256 = frozenset()
+_sport = None
+
+
+def _init_worker(known, sport):
+    global _known_sha256, _sport
+    _known_sha256 = known
+    _sport = sport
+
+
+def parse_job(job):
+    label, path, member = job
+    sha = None
+    try:
+        if member is None:
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            with zipfile.ZipFile(path) as archive:
+                data = archive.read(member)
+
+        sha = file_sha256(data)
+        if sha in _known_sha256:
+            return label, sha, None, None
+
+        track = read_track(io.BytesIO(data), name=label)
+        if not len(track.lat):
+            return label, sha, None, "no GPS points"
+
+        cleaned = clean_track(track, _sport)
+        metrics = track_metrics(
+            cleaned.lat, cleaned.lon, cleaned.ele, cleaned.time, cleaned.segment
+        )
+        return label, sha, (track, cleaned, metrics), None
+    except Exception as e:
+        return label, sha, None, f"{type(e).__name__}: {e}"
+
+
+# ==========================================================
+# IMPORT
+# ==========================================================
+def bulk_import(user_id, source, sport="Running", workers=None,
+                batch_size=COMMIT_BATCH, progress=None):
+    """Import every GPX/TCX/FIT file in a directory or zip for user_id.
+
+    Files are parsed in a process pool; results are written in
+    batches of batch_size workouts per transaction. Files already
+    imported (same SHA-256) are linked to their existing workout
+    instead. progress, if given, is called as progress(done, total, label).
+    """
+    from db import connection, process_pool
+
+    start = timer.perf_counter()
+    jobs = collect_jobs(source)
+    errors = []
+    duplicates = []
+    imported = 0
+    done = 0
+    pending = []
+
+    def flush():
+        nonlocal imported
+        with connection() as conn:
+            # Savepoints nest inside one batch transaction; released
+            # outside one, each would commit on its own
+            conn.execute("BEGIN")
+            for label, sha, (track, cleaned, metrics) in pending:
+                # One bad row is reported and rolled back on its own
+                conn.execute("SAVEPOINT import_item")
+                try:
+                    known[sha] = save_activity(
+                        conn, user_id, track,
+                        title=_title(label),
+                        sport=sport,
+                        notes=f"Bulk import: {label}",
+                        metrics=metrics,
+                        cleaned=cleaned,
+                        file_sha256=sha
+                    )
+                except Exception as e:
+                    conn.execute("ROLLBACK TO import_item")
+                    errors.append((label, f"{type(e).__name__}: {e}"))
+                else:
+                    imported += 1
+                conn.execute("RELEASE import_item")
+            conn.commit()
+        pending.clear()
+
+    def collect(running):
+        nonlocal done
+        finished, running = wait(running, return_when=FIRST_COMPLETED)
+        for future in finished:
+            label, sha, parsed, error = future.result()
+            if error:
+                errors.append((label, error))
+            elif sha in known:
+                # Stored before, or an identical file earlier in this run
+                duplicates.append((label, sha))
+            else:
+                known[sha] = None
+                pending.append((label, sha, parsed))
+                if len(pending) >= batch_size:
+                    flush()
+
+            done += 1
+            if progress:
+                progress(done, len(jobs), label)
+        return running
+
+    with connection() as conn:
+        known = known_sha256(conn, user_id)
+
+    with process_pool(workers, initializer=_init_worker,
+                      initargs=(frozenset(known), sport)) as pool:
+        # Only a bounded window of parsed tracks is held at once;
+        # finished futures are dropped as soon as they are read
+        limit = 2 * (workers or os.cpu_count() or 1)
+        running = set()
+        for job in jobs:
+            running.add(pool.submit(parse_job, job))
+            while len(running) >= limit:
+                running = collect(running)
+
+        while running:
+            running = collect(running)
+
+    if pending:
+        flush()
+
+    # A duplicate of a file whose save failed has no workout id
+    duplicates = [(label, known[sha]) for label, sha in duplicates]
+    return ImportReport(imported, errors, timer.perf_counter() - start, duplicates)
+
+
+def import_upload(user_id, uploaded_file, **kwargs):
+    """bulk_import for an in-memory upload (e.g. Streamlit's UploadedFile)."""
+    suffix = os.path.splitext(uploaded_file.name)[1] or ".zip"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        tmp.write(uploaded_file.getbuffer())
+    try:
+        return bulk_import(user_id, tmp.name, **kwargs)
+    finally:
+        os.unlink(tmp.name)
+
+
+# ==========================================================
+# CLI
+#   python importer.py --user admin export.zip [--workers 8]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import GPX/TCX/FIT activities")
+    parser.add_argument("source", help="directory, zip archive or single file")
+    parser.add_argument("--user", required=True, help="username to import for")
+    parser.add_argument("--sport", default="Running")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=COMMIT_BATCH)
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    user = db.get_user(args.user)
+    if user is None:
+        print(f"No such user: {args.user}", file=sys.stderr)
+        return 1
+
+    report = bulk_import(
+        user["id"], args.source,
+        sport=args.sport,
+        workers=args.workers,
+        batch_size=args.batch,
+        progress=lambda done, total, label: print(f"\r{done}/{total} {label[:60]:<60}", end="")
+    )
+
+    print(f"\nImported {report.imported} activities in {report.seconds:.1f}s")
+    if report.duplicates:
+        print(f"Skipped {len(report.duplicates)} files already imported")
+    for label, error in report.errors:
+        print(f"  {label}: {error}")
+    return 0 if not report.errors else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
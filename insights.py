@@ -0,0 +1,431 @@
+import argparse
+import math
+import os
+import sys
+import time as timer
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import date
+from itertools import groupby
+from typing import NamedTuple
+
+import numpy as np
+
+from db import workouts_version
+from forecast import FORECAST_WEEKS, forecast_weekly, week_start
+from utils import epoch_day
+
+
+MIN_WORKOUTS = 5
+
+# Batch forecast: workout rows fetched per read, users per worker task
+BATCH_FETCH_ROWS = 10_000
+BATCH_USERS_PER_TASK = 200
+
+# Metrics with an online trend, and the half-lives (days) they are
+# kept at: 0 weighs all history equally, the other is "recent form"
+TREND_METRICS = ("distance_km", "duration_min")
+RECENT_FORM_HALF_LIFE = 28
+TREND_HALF_LIVES = (0, RECENT_FORM_HALF_LIFE)
+
+
+def distance_series(conn, user_id):
+    """(days, distance_km) arrays of the user's dated workouts."""
+    rows = conn.execute(
+        """
+        SELECT day, distance_km FROM workouts
+        WHERE user_id=? AND day IS NOT NULL AND distance_km IS NOT NULL
+        """,
+        (user_id,)
+    ).fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+    return data[:, 0], data[:, 1]
+
+
+def weekly_distance_forecast(conn, user_id, today):
+    """WeeklyForecast (single row) of the user's weekly distance."""
+    days, km = distance_series(conn, user_id)
+    return forecast_weekly(np.zeros(len(days), dtype=np.int64), days, km, 1, today)
+
+
+# ==========================================================
+# ONLINE TREND
+# Least-squares line of a metric on the workout day, kept as
+# weighted sufficient statistics (n, Σx, Σy, Σxy, Σx²) so a new
+# workout is folded in with O(1) work and the fitted line is
+# read straight from the sums. x is days since origin_day.
+#
+# With a half-life, weights decay with age: sums are held as of
+# ref_day, and a later workout first scales them down by the
+# days elapsed, an earlier one is added at its reduced weight.
+# ==========================================================
+class TrendState(NamedTuple):
+    origin_day: int
+    ref_day: int
+    n: float
+    sx: float
+    sy: float
+    sxy: float
+    sxx: float
+
+
+def _decay(days, half_life):
+    return 0.5 ** (days / half_life) if half_life else 1.0
+
+
+def trend_add(state, day, y, half_life=0):
+    """State with one (day, y) observation added."""
+    if state is None or state.n == 0:
+        state = TrendState(day, day, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+    n, sx, sy, sxy, sxx = state[2:]
+    ref_day, w = state.ref_day, 1.0
+    if day > ref_day:
+        f = _decay(day - ref_day, half_life)
+        n, sx, sy, sxy, sxx = n * f, sx * f, sy * f, sxy * f, sxx * f
+        ref_day = day
+    else:
+        w = _decay(ref_day - day, half_life)
+
+    x = day - state.origin_day
+    return TrendState(state.origin_day, ref_day,
+                      n + w, sx + w * x, sy + w * y, sxy + w * x * y, sxx + w * x * x)
+
+
+def trend_fit(days, y, half_life=0):
+    """TrendState for whole arrays at once (same sums as repeated trend_add)."""
+    days = np.asarray(days, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if not len(days):
+        return None
+
+    origin, ref = int(days.min()), int(days.max())
+    x = days - origin
+    w = 0.5 ** ((ref - days) / half_life) if half_life else np.ones_like(x)
+    return TrendState(origin, ref, float(w.sum()), float(w @ x), float(w @ y),
+                      float(w @ (x * y)), float(w @ (x * x)))
+
+
+def trend_line(state):
+    """(slope per day, intercept at origin_day), flat when x has no spread."""
+    if state is None or state.n <= 0:
+        return None
+    denom = state.n * state.sxx - state.sx ** 2
+    if denom <= 1e-9 * max(state.n * state.sxx, 1.0):
+        return 0.0, state.sy / state.n
+    slope = (state.n * state.sxy - state.sx * state.sy) / denom
+    return slope, (state.sy - slope * state.sx) / state.n
+
+
+def trend_predict(state, days):
+    slope, intercept = trend_line(state)
+    return intercept + slope * (np.asarray(days, dtype=np.float64) - state.origin_day)
+
+
+# ==========================================================
+# STORAGE
+# Rows remember the workouts_version they reflect. A save that
+# finds them exactly one version behind (its own insert) updates
+# them in place; anything else (edits, deletes, old rows) rebuilds
+# the user's states from their workouts once.
+# ==========================================================
+def _load_states(conn, user_id):
+    rows = conn.execute(
+        """
+        SELECT metric, half_life, origin_day, ref_day, n, sx, sy, sxy, sxx,
+               workouts_version
+        FROM trend_stats WHERE user_id=?
+        """,
+        (user_id,)
+    ).fetchall()
+    states = {(r[0], r[1]): TrendState(*r[2:9]) for r in rows}
+    versions = {r[9] for r in rows}
+    return states, versions
+
+
+def _store_states(conn, user_id, states, version):
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO trend_stats
+        (user_id, metric, half_life, origin_day, ref_day, n, sx, sy, sxy, sxx,
+         workouts_version)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(user_id, metric, half_life, *state, version)
+         for (metric, half_life), state in states.items() if state is not None]
+    )
+
+
+def rebuild_trend_states(conn, user_id):
+    """Recompute the user's trend states from all their workouts (no commit)."""
+    rows = conn.execute(
+        f"""
+        SELECT day, {", ".join(TREND_METRICS)} FROM workouts
+        WHERE user_id=? AND day IS NOT NULL
+        """,
+        (user_id,)
+    ).fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(-1, 1 + len(TREND_METRICS))
+
+    states = {}
+    for i, metric in enumerate(TREND_METRICS, 1):
+        ok = np.isfinite(data[:, i])
+        for half_life in TREND_HALF_LIVES:
+            states[(metric, half_life)] = trend_fit(data[ok, 0], data[ok, i], half_life)
+
+    conn.execute("DELETE FROM trend_stats WHERE user_id=?", (user_id,))
+    _store_states(conn, user_id, states, workouts_version(conn, user_id))
+    return states
+
+
+def record_workout(conn, user_id, day, values):
+    """Fold a just-inserted workout's {metric: value} into the trends (no commit)."""
+    version = workouts_version(conn, user_id)
+    states, versions = _load_states(conn, user_id)
+    if versions != {version - 1}:
+        return rebuild_trend_states(conn, user_id)
+
+    for metric in TREND_METRICS:
+        y = values.get(metric)
+        if y is None or not math.isfinite(y):
+            continue
+        for half_life in TREND_HALF_LIVES:
+            states[(metric, half_life)] = trend_add(
+                states.get((metric, half_life)), day, y, half_life
+            )
+
+    _store_states(conn, user_id, states, version)
+    return states
+
+
+def trend_states(conn, user_id):
+    """{(metric, half_life): TrendState or None}, rebuilt first if stale (no commit)."""
+    states, versions = _load_states(conn, user_id)
+    if versions != {workouts_version(conn, user_id)}:
+        states = rebuild_trend_states(conn, user_id)
+    return states
+
+
+# ==========================================================
+# BATCH FORECAST
+# Precomputes every user's weekly forecast (forecast.py) into
+# predictions so dashboards can read it without fitting anything. Workouts are
+# streamed grouped by user, fitted in a process pool, and written
+# per task with executemany. forecast_status records the
+# workouts_version and week each user was forecast at, so a rerun
+# (or a resumed one) only redoes users whose workouts changed or
+# whose forecast is from an earlier week.
+# ==========================================================
+def _forecast_chunk(users, today):
+    # All of the task's users go through the weekly engine as one 2D batch
+    series = np.concatenate([np.full(len(data), i) for i, (_, _, data) in enumerate(users)])
+    data = np.vstack([data for _, _, data in users])
+    week = int(week_start(today))
+
+    predictions = []
+    for i, metric in enumerate(TREND_METRICS, 1):
+        f = forecast_weekly(series, data[:, 0], data[:, i], len(users), today)
+        for row, (user_id, _, _) in enumerate(users):
+            if not np.isfinite(f.forecast[row, 0]):
+                continue
+            mae = f.backtest_mae[row]
+            predictions.extend(
+                (user_id, metric, "weekly", h, round(float(f.forecast[row, h - 1]), 3),
+                 round(float(f.lower[row, h - 1]), 3), round(float(f.upper[row, h - 1]), 3),
+                 round(float(mae), 3) if np.isfinite(mae) else None)
+                for h in range(1, FORECAST_WEEKS + 1)
+            )
+
+    status = [(user_id, version, len(d), week) for user_id, version, d in users]
+    return predictions, status
+
+
+def _pending_users(conn, week, force):
+    rows = conn.execute(
+        """
+        SELECT u.user_id, COALESCE(v.workouts_version, 0), s.workouts_version, s.week_start
+        FROM (SELECT DISTINCT user_id FROM workouts WHERE user_id IS NOT NULL) u
+        LEFT JOIN user_data_versions v ON v.user_id = u.user_id
+        LEFT JOIN forecast_status s ON s.user_id = u.user_id
+        """
+    ).fetchall()
+    return {
+        uid: version for uid, version, done, done_week in rows
+        if force or done != version or done_week != week
+    }
+
+
+def _stream_users(pending):
+    """(user_id, version, array[day, *TREND_METRICS]) per pending user, in chunks.
+
+    Rows are paged by (user_id, day, id), the order of the
+    (user_id, day) index, each page on a briefly borrowed connection.
+    """
+    import db
+
+    chunk = []
+    partial = None
+    last = (-1, -1, -1)
+    while True:
+        with db.connection() as conn:
+            rows = conn.execute(
+                f"""
+                SELECT user_id, day, id, {", ".join(TREND_METRICS)} FROM workouts
+                WHERE user_id IS NOT NULL AND day IS NOT NULL
+                  AND (user_id, day, id) > (?, ?, ?)
+                ORDER BY user_id, day, id
+                LIMIT ?
+                """,
+                (*last, BATCH_FETCH_ROWS)
+            ).fetchall()
+        if not rows:
+            break
+        last = tuple(rows[-1][:3])
+        for user_id, group in groupby(rows, key=lambda r: r[0]):
+            if user_id not in pending:
+                continue
+            values = [(r[1], *r[3:]) for r in group]
+            # A user's rows may straddle two fetches
+            if partial and partial[0] == user_id:
+                partial[1].extend(values)
+                continue
+            if partial:
+                chunk.append(partial)
+            partial = (user_id, values)
+        if len(chunk) >= BATCH_USERS_PER_TASK:
+            yield _pack(chunk, pending)
+            chunk = []
+
+    if partial:
+        chunk.append(partial)
+    if chunk:
+        yield _pack(chunk, pending)
+
+
+def _pack(chunk, pending):
+    width = 1 + len(TREND_METRICS)
+    return [
+        (user_id, pending[user_id], np.array(values, dtype=np.float64).reshape(-1, width))
+        for user_id, values in chunk
+    ]
+
+
+def _write_forecasts(conn, predictions, status):
+    users = [(s[0],) for s in status]
+    conn.executemany("DELETE FROM predictions WHERE user_id=?", users)
+    conn.executemany(
+        """
+        INSERT INTO predictions
+        (user_id, metric, model, week_ahead, value, lower, upper, backtest_mae)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        predictions
+    )
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO forecast_status
+        (user_id, workouts_version, n_workouts, week_start, computed_at)
+        VALUES (?, ?, ?, ?, datetime('now'))
+        """,
+        status
+    )
+    conn.commit()
+
+
+def _collect(running):
+    # Write whichever tasks finish first; returns (still running, users done)
+    import db
+
+    finished, running = wait(running, return_when=FIRST_COMPLETED)
+    users = 0
+    for future in finished:
+        predictions, status = future.result()
+        with db.connection() as conn:
+            _write_forecasts(conn, predictions, status)
+        users += len(status)
+    return running, users
+
+
+def forecast_all(workers=None, force=False, today=None, progress=None):
+    """Forecast every user whose workouts changed, or whose forecast is
+    from an earlier week, since their last run.
+
+    Returns (users forecast, seconds).
+    """
+    import db
+
+    if today is None:
+        today = epoch_day(date.today())
+    start = timer.perf_counter()
+    done = 0
+    with db.connection() as conn:
+        pending = _pending_users(conn, int(week_start(today)), force)
+    if not pending:
+        return 0, timer.perf_counter() - start
+
+    # Bound the workout data held in flight
+    limit = 2 * (workers or os.cpu_count() or 1)
+    running = set()
+    with db.process_pool(workers) as pool:
+        for users in _stream_users(pending):
+            running.add(pool.submit(_forecast_chunk, users, today))
+            while len(running) >= limit:
+                running, n = _collect(running)
+                done += n
+                if progress:
+                    progress(done, len(pending), timer.perf_counter() - start)
+
+        while running:
+            running, n = _collect(running)
+            done += n
+            if progress:
+                progress(done, len(pending), timer.perf_counter() - start)
+
+    return done, timer.perf_counter() - start
+
+
+def stored_forecast(conn, user_id, metric="distance_km"):
+    """Precomputed weekly forecast rows for a user, or [] before the batch ran.
+
+    Week 1 is the week the batch ran in.
+    """
+    return conn.execute(
+        """
+        SELECT p.week_ahead, p.value, p.lower, p.upper, p.backtest_mae, s.week_start
+        FROM predictions p
+        JOIN forecast_status s ON s.user_id = p.user_id
+        WHERE p.user_id=? AND p.metric=? AND p.model='weekly'
+        ORDER BY p.week_ahead
+        """,
+        (user_id, metric)
+    ).fetchall()
+
+
+# ==========================================================
+# CLI
+#   python insights.py forecast [--workers N] [--force]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FitTrack forecasting")
+    sub = parser.add_subparsers(dest="command", required=True)
+    forecast = sub.add_parser("forecast", help="precompute forecasts for all users")
+    forecast.add_argument("--workers", type=int, default=None)
+    forecast.add_argument("--force", action="store_true",
+                          help="redo users whose workouts have not changed")
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    users, seconds = forecast_all(
+        args.workers, args.force,
+        progress=lambda done, total, s: print(
+            f"\r{done}/{total} users ({done / max(s, 1e-9):.0f} users/s)", end=""
+        )
+    )
+    print(f"\nForecast {users} users in {seconds:.1f}s "
+          f"({users / max(seconds, 1e-9):.0f} users/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,236 @@
+import argparse
+import sys
+import time as timer
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from utils import segment_distances_km
+
+
+# Fastest time over each distance (km) ...
+PR_DISTANCES = {
+    "400 m": 0.4,
+    "1 km": 1.0,
+    "5 km": 5.0,
+    "10 km": 10.0,
+    "Half Marathon": 21.0975,
+    "Marathon": 42.195,
+}
+
+# ... and furthest distance inside each duration (s)
+PR_DURATIONS = {
+    "5 min": 300,
+    "20 min": 1200,
+    "60 min": 3600,
+}
+
+# Workouts handed to one recompute worker task
+RECOMPUTE_CHUNK = 50
+
+# Summed haversine distances carry rounding error, so a window
+# within this many km of a target distance counts as covering it
+DISTANCE_EPS_KM = 1e-6
+
+
+# ==========================================================
+# BEST EFFORTS
+# Sliding windows over cumulative distance/time. The window
+# start only ever moves forward as the end advances, so for
+# every end point it is found with one searchsorted pass over
+# the whole array instead of a per-point Python loop.
+# ==========================================================
+def _timed_stream(track):
+    ok = np.isfinite(track.time) & np.isfinite(track.lat) & np.isfinite(track.lon)
+    if ok.sum() < 2:
+        return None, None, None
+
+    idx = np.flatnonzero(ok)
+    cum_km = np.concatenate(([0.0], np.cumsum(
+        segment_distances_km(track.lat[ok], track.lon[ok], track.segment[ok])
+    )))
+    # Guard against clocks stepping backwards
+    t = np.maximum.accumulate(track.time[ok])
+    return idx, cum_km, t
+
+
+def best_efforts(track):
+    """{label: (kind, target, value, start_idx, end_idx, start_ts)} for one track.
+
+    value is seconds for distance PRs and km for duration PRs.
+    """
+    idx, cum_km, t = _timed_stream(track)
+    if idx is None:
+        return {}
+
+    efforts = {}
+    for label, km in PR_DISTANCES.items():
+        if cum_km[-1] < km - DISTANCE_EPS_KM:
+            continue
+        # Latest start still at least km behind each end point
+        start = np.searchsorted(cum_km, cum_km - km + DISTANCE_EPS_KM, side="right") - 1
+        valid = np.flatnonzero(start >= 0)
+        elapsed = t[valid] - t[start[valid]]
+        best = int(np.argmin(elapsed))
+        i, j = start[valid[best]], valid[best]
+        if elapsed[best] > 0:
+            efforts[label] = ("distance", km, float(elapsed[best]),
+                              int(idx[i]), int(idx[j]), float(t[i]))
+
+    for label, seconds in PR_DURATIONS.items():
+        if t[-1] - t[0] < seconds:
+            continue
+        # Earliest start no more than seconds before each end point
+        start = np.searchsorted(t, t - seconds, side="left")
+        covered = cum_km - cum_km[start]
+        j = int(np.argmax(covered))
+        i = start[j]
+        efforts[label] = ("duration", seconds, float(covered[j]),
+                          int(idx[i]), int(idx[j]), float(t[i]))
+
+    return efforts
+
+
+# ==========================================================
+# STORAGE
+# ==========================================================
+UPSERT_RECORD_SQL = """
+    INSERT INTO personal_records
+    (user_id, sport, label, kind, target, value, workout_id, start_idx, end_idx, achieved_ts)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(user_id, sport, label) DO UPDATE SET
+        value = excluded.value,
+        workout_id = excluded.workout_id,
+        start_idx = excluded.start_idx,
+        end_idx = excluded.end_idx,
+        achieved_ts = excluded.achieved_ts
+    WHERE (excluded.kind = 'distance' AND excluded.value < personal_records.value)
+       OR (excluded.kind = 'duration' AND excluded.value > personal_records.value)
+"""
+
+
+def _record_rows(user_id, sport, workout_id, efforts):
+    return [
+        (user_id, sport or "Other", label, kind, target, value, workout_id, i, j, ts)
+        for label, (kind, target, value, i, j, ts) in efforts.items()
+    ]
+
+
+def update_records(conn, user_id, workout_id, sport, track):
+    """Fold a newly saved workout's best efforts into the user's PRs (no commit)."""
+    efforts = best_efforts(track)
+    conn.executemany(UPSERT_RECORD_SQL, _record_rows(user_id, sport, workout_id, efforts))
+    return efforts
+
+
+def personal_records(conn, user_id):
+    return conn.execute(
+        """
+        SELECT p.sport, p.label, p.kind, p.target, p.value, p.achieved_ts,
+               w.title, w.date
+        FROM personal_records p
+        LEFT JOIN workouts w ON w.id = p.workout_id
+        WHERE p.user_id=?
+        ORDER BY p.sport, p.kind, p.target
+        """,
+        (user_id,)
+    ).fetchall()
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"
+
+
+# ==========================================================
+# BATCH RECOMPUTE
+# Rebuilds PRs from every stored track, e.g. after a parsing
+# or cleaning change. Workers read; the parent writes.
+# ==========================================================
+def _efforts_chunk(db_path, workouts):
+    import db
+    from track_clean import clean_track
+    from track_store import load_track
+
+    db.DB_PATH = db_path
+    rows = []
+    with db.connection() as conn:
+        for workout_id, user_id, sport in workouts:
+            efforts = best_efforts(clean_track(load_track(conn, workout_id), sport))
+            rows.extend(_record_rows(user_id, sport, workout_id, efforts))
+    return rows
+
+
+def recompute_records(user_id=None, workers=None, progress=None):
+    """Recompute personal_records from all history (one user or everyone)."""
+    import db
+
+    with db.connection() as conn:
+        sql = """
+            SELECT w.id, w.user_id, w.sport FROM workouts w
+            WHERE (EXISTS (SELECT 1 FROM workout_tracks t WHERE t.workout_id = w.id)
+                OR EXISTS (SELECT 1 FROM workout_points p WHERE p.workout_id = w.id))
+        """
+        params = ()
+        if user_id is not None:
+            sql += " AND w.user_id = ?"
+            params = (user_id,)
+        workouts = [tuple(r) for r in conn.execute(sql, params)]
+
+    chunks = [workouts[i:i + RECOMPUTE_CHUNK]
+              for i in range(0, len(workouts), RECOMPUTE_CHUNK)]
+    rows = []
+    with db.process_pool(workers) as pool:
+        futures = [pool.submit(_efforts_chunk, db.DB_PATH, chunk) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            rows.extend(future.result())
+            if progress:
+                progress(done, len(chunks))
+
+    # Swap in the new bests in one transaction
+    with db.connection() as conn:
+        if user_id is None:
+            conn.execute("DELETE FROM personal_records")
+        else:
+            conn.execute("DELETE FROM personal_records WHERE user_id=?", (user_id,))
+        conn.executemany(UPSERT_RECORD_SQL, rows)
+        conn.commit()
+
+    return len(workouts)
+
+
+# ==========================================================
+# CLI
+#   python records.py recompute [--user NAME] [--workers N]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Personal record detection")
+    sub = parser.add_subparsers(dest="command", required=True)
+    recompute = sub.add_parser("recompute", help="rebuild PRs from stored tracks")
+    recompute.add_argument("--user", help="username (default: everyone)")
+    recompute.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    user_id = None
+    if args.user:
+        user = db.get_user(args.user)
+        if user is None:
+            print(f"No such user: {args.user}", file=sys.stderr)
+            return 1
+        user_id = user["id"]
+
+    start = timer.perf_counter()
+    n = recompute_records(user_id, args.workers)
+    print(f"Recomputed PRs from {n} workouts in {timer.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import argparse
+import sys
+import time as timer
+import zlib
+from collections import Counter
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from utils import geohash_code, segment_distances_km
+
+
+# A route is the set of geohash cells it passes through, sampled
+# every RESAMPLE_M along the path so recording rate doesn't matter.
+ROUTE_GEOHASH_PRECISION = 7   # ~153 m cells
+RESAMPLE_M = 30
+MIN_ROUTE_KM = 0.3
+
+# MinHash signature of the cell set, split into LSH bands. Two
+# routes become candidates when any band matches exactly; with
+# 16 bands of 4 that is likely from ~50 % cell overlap upwards.
+MINHASH_SIZE = 64
+LSH_BANDS = 16
+MINHASH_SEED = 2024
+
+# Estimated Jaccard similarity for two workouts to be the same route
+SAME_ROUTE_SIMILARITY = 0.6
+
+# Workouts handed to one signature worker task
+CLUSTER_CHUNK = 50
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.default_rng(MINHASH_SEED)
+_HASH_A = _rng.integers(1, _PRIME, MINHASH_SIZE, dtype=np.int64)
+_HASH_B = _rng.integers(0, _PRIME, MINHASH_SIZE, dtype=np.int64)
+
+
+# ==========================================================
+# SIGNATURES
+# ==========================================================
+def route_cells(track):
+    """Unique geohash cells along the route, or None if it is too short."""
+    ok = np.isfinite(track.lat) & np.isfinite(track.lon)
+    if ok.sum() < 2:
+        return None
+
+    lat, lon = track.lat[ok], track.lon[ok]
+    cum_m = np.concatenate(([0.0], np.cumsum(
+        segment_distances_km(lat, lon, track.segment[ok])
+    ))) * 1000
+    if cum_m[-1] < MIN_ROUTE_KM * 1000:
+        return None
+
+    at = np.append(np.arange(0, cum_m[-1], RESAMPLE_M), cum_m[-1])
+    return np.unique(geohash_code(
+        np.interp(at, cum_m, lat), np.interp(at, cum_m, lon),
+        ROUTE_GEOHASH_PRECISION
+    ))
+
+
+def minhash(cells):
+    """MINHASH_SIZE min-wise hashes of a set of int cells (uint32)."""
+    x = np.asarray(cells, dtype=np.int64) % _PRIME
+    hashed = (_HASH_A[:, None] * x[None, :] + _HASH_B[:, None]) % _PRIME
+    return hashed.min(axis=1).astype(np.uint32)
+
+
+def route_signature(track):
+    cells = route_cells(track)
+    return None if cells is None or not len(cells) else minhash(cells)
+
+
+def band_keys(signature):
+    """One bucket key per LSH band."""
+    bands = np.asarray(signature, dtype="<u4").reshape(LSH_BANDS, -1)
+    return [zlib.crc32(band.tobytes()) for band in bands]
+
+
+def similarity(signature, others):
+    """Estimated Jaccard similarity of signature to each row of others."""
+    return (np.asarray(others) == signature).mean(axis=-1)
+
+
+def _decode(blob):
+    return np.frombuffer(blob, dtype="<u4")
+
+
+# ==========================================================
+# STORAGE
+# ==========================================================
+def _store_signature(conn, user_id, workout_id, signature, cluster_id=None):
+    conn.execute("DELETE FROM route_buckets WHERE workout_id=?", (workout_id,))
+    conn.execute(
+        """
+        INSERT INTO workout_routes (workout_id, user_id, cluster_id, signature)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(workout_id) DO UPDATE SET
+            signature = excluded.signature,
+            cluster_id = CASE WHEN excluded.signature IS NULL THEN NULL
+                              ELSE COALESCE(excluded.cluster_id, workout_routes.cluster_id) END
+        """,
+        (workout_id, user_id, cluster_id,
+         None if signature is None else signature.astype("<u4").tobytes())
+    )
+    if signature is not None:
+        conn.executemany(
+            "INSERT INTO route_buckets (workout_id, band, user_id, bucket) VALUES (?, ?, ?, ?)",
+            [(workout_id, band, user_id, key) for band, key in enumerate(band_keys(signature))]
+        )
+
+
+def route_candidates(conn, user_id, signature):
+    """(workout_id, cluster_id, signature) of the user's routes sharing an LSH band."""
+    probe = ", ".join(["(?, ?)"] * LSH_BANDS)
+    params = [v for band, key in enumerate(band_keys(signature)) for v in (band, key)]
+    return conn.execute(
+        f"""
+        WITH probe(band, bucket) AS (VALUES {probe})
+        SELECT DISTINCT r.workout_id, r.cluster_id, r.signature
+        FROM probe p
+        JOIN route_buckets b ON b.user_id = ? AND b.band = p.band AND b.bucket = p.bucket
+        JOIN workout_routes r ON r.workout_id = b.workout_id
+        """,
+        params + [user_id]
+    ).fetchall()
+
+
+def assign_route(conn, user_id, workout_id, track):
+    """Put a newly saved workout into its route cluster (no commit).
+
+    Joins the cluster of the most similar LSH candidate, or starts a
+    new one. Returns the cluster id (None for too-short routes).
+    """
+    signature = route_signature(track)
+    if signature is None:
+        _store_signature(conn, user_id, workout_id, None)
+        return None
+
+    cluster_id, best = None, SAME_ROUTE_SIMILARITY
+    for other_id, other_cluster, blob in route_candidates(conn, user_id, signature):
+        if other_id == workout_id or other_cluster is None:
+            continue
+        score = similarity(signature, _decode(blob))
+        if score >= best:
+            cluster_id, best = other_cluster, score
+
+    if cluster_id is None:
+        cluster_id = conn.execute(
+            "INSERT INTO route_clusters (user_id) VALUES (?)", (user_id,)
+        ).lastrowid
+
+    _store_signature(conn, user_id, workout_id, signature, cluster_id)
+    return cluster_id
+
+
+# ==========================================================
+# QUERIES
+# ==========================================================
+def user_routes(conn, user_id, min_workouts=2):
+    """The user's recurring routes, most frequent first."""
+    return conn.execute(
+        """
+        SELECT c.id,
+               COALESCE(c.name, (
+                   SELECT w2.title FROM workout_routes r2
+                   JOIN workouts w2 ON w2.id = r2.workout_id
+                   WHERE r2.cluster_id = c.id
+                   ORDER BY w2.ts LIMIT 1
+               )) AS name,
+               COUNT(*) AS workouts,
+               AVG(w.distance_km) AS avg_km,
+               MAX(w.date) AS last_date
+        FROM route_clusters c
+        JOIN workout_routes r ON r.cluster_id = c.id
+        JOIN workouts w ON w.id = r.workout_id
+        WHERE c.user_id = ?
+        GROUP BY c.id
+        HAVING COUNT(*) >= ?
+        ORDER BY workouts DESC, last_date DESC
+        """,
+        (user_id, min_workouts)
+    ).fetchall()
+
+
+def route_history(conn, cluster_id):
+    return conn.execute(
+        """
+        SELECT w.id, w.title, w.date, w.ts, w.distance_km, w.duration_min
+        FROM workout_routes r
+        JOIN workouts w ON w.id = r.workout_id
+        WHERE r.cluster_id = ?
+        ORDER BY w.ts
+        """,
+        (cluster_id,)
+    ).fetchall()
+
+
+def rename_route(conn, cluster_id, name):
+    conn.execute(
+        "UPDATE route_clusters SET name=? WHERE id=?", (name.strip() or None, cluster_id)
+    )
+
+
+# ==========================================================
+# BATCH CLUSTERING
+# Signatures for history are computed in a process pool and
+# committed per chunk, so the slow part resumes where it stopped.
+# Clusters are then rebuilt per user as connected components of
+# verified LSH candidate pairs, keeping existing cluster ids (and
+# their names) where members stay together.
+# ==========================================================
+def _signature_chunk(db_path, workouts):
+    import db
+    from track_store import load_track
+
+    db.DB_PATH = db_path
+    rows = []
+    with db.connection() as conn:
+        for workout_id, user_id in workouts:
+            rows.append((workout_id, user_id, route_signature(load_track(conn, workout_id))))
+    return rows
+
+
+def _components(n, pairs):
+    parent = np.arange(n)
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, j in pairs:
+        a, b = find(i), find(j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    return np.array([find(i) for i in range(n)])
+
+
+def recluster_user(conn, user_id):
+    """Rebuild one user's clusters from stored signatures (no commit)."""
+    rows = conn.execute(
+        """
+        SELECT workout_id, cluster_id, signature FROM workout_routes
+        WHERE user_id=? AND signature IS NOT NULL
+        ORDER BY workout_id
+        """,
+        (user_id,)
+    ).fetchall()
+    if not rows:
+        conn.execute("DELETE FROM route_clusters WHERE user_id=?", (user_id,))
+        return 0
+
+    ids = np.array([r[0] for r in rows])
+    signatures = np.vstack([_decode(r[2]) for r in rows])
+    index = {workout_id: i for i, workout_id in enumerate(ids.tolist())}
+
+    buckets = {}
+    for band, bucket, workout_id in conn.execute(
+        "SELECT band, bucket, workout_id FROM route_buckets WHERE user_id=?", (user_id,)
+    ):
+        if workout_id in index:
+            buckets.setdefault((band, bucket), []).append(index[workout_id])
+
+    # Only pairs sharing a bucket are ever compared
+    pairs = set()
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        g = np.array(members)
+        sim = (signatures[g][:, None, :] == signatures[g][None, :, :]).mean(axis=-1)
+        i, j = np.nonzero(np.triu(sim >= SAME_ROUTE_SIMILARITY, k=1))
+        pairs.update(zip(g[i].tolist(), g[j].tolist()))
+
+    roots = _components(len(ids), pairs)
+
+    old = [r[1] for r in rows]
+    used, updates = set(), []
+    for root in np.unique(roots):
+        members = np.flatnonzero(roots == root)
+        votes = Counter(old[m] for m in members if old[m] is not None)
+        cluster_id = next((c for c, _ in votes.most_common() if c not in used), None)
+        if cluster_id is None:
+            cluster_id = conn.execute(
+                "INSERT INTO route_clusters (user_id) VALUES (?)", (user_id,)
+            ).lastrowid
+        used.add(cluster_id)
+        updates.extend((cluster_id, int(ids[m])) for m in members)
+
+    conn.executemany("UPDATE workout_routes SET cluster_id=? WHERE workout_id=?", updates)
+    conn.execute(
+        """
+        DELETE FROM route_clusters
+        WHERE user_id=? AND id NOT IN (
+            SELECT cluster_id FROM workout_routes WHERE cluster_id IS NOT NULL
+        )
+        """,
+        (user_id,)
+    )
+    return len(used)
+
+
+def cluster_routes(user_id=None, workers=None, rebuild=False, progress=None):
+    """Sign every unsigned workout with a track, then recluster each user.
+
+    Returns (workouts signed, clusters).
+    """
+    import db
+
+    with db.connection() as conn:
+        scope, params = "", ()
+        if user_id is not None:
+            scope, params = " AND w.user_id = ?", (user_id,)
+
+        # A rebuild re-signs everything but keeps cluster ids for reuse
+        unsigned = "" if rebuild else (
+            "NOT EXISTS (SELECT 1 FROM workout_routes r WHERE r.workout_id = w.id) AND"
+        )
+        workouts = [tuple(r) for r in conn.execute(
+            f"""
+            SELECT w.id, w.user_id FROM workouts w
+            WHERE {unsigned}
+                  (EXISTS (SELECT 1 FROM workout_tracks t WHERE t.workout_id = w.id)
+                OR EXISTS (SELECT 1 FROM workout_points p WHERE p.workout_id = w.id))
+              {scope}
+            """,
+            params
+        )]
+
+    chunks = [workouts[i:i + CLUSTER_CHUNK]
+              for i in range(0, len(workouts), CLUSTER_CHUNK)]
+    with db.process_pool(workers) as pool:
+        futures = [pool.submit(_signature_chunk, db.DB_PATH, chunk) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            with db.connection() as conn:
+                for workout_id, owner, signature in future.result():
+                    _store_signature(conn, owner, workout_id, signature)
+                conn.commit()
+            if progress:
+                progress(done, len(chunks))
+
+    with db.connection() as conn:
+        users = [user_id] if user_id is not None else [
+            r[0] for r in conn.execute("SELECT DISTINCT user_id FROM workout_routes")
+        ]
+        clusters = 0
+        for uid in users:
+            clusters += recluster_user(conn, uid)
+            conn.commit()
+
+    return len(workouts), clusters
+
+
+# ==========================================================
+# CLI
+#   python routes.py cluster [--user NAME] [--workers N] [--rebuild]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recurring route clustering")
+    sub = parser.add_subparsers(dest="command", required=True)
+    cluster = sub.add_parser("cluster", help="sign and cluster stored history")
+    cluster.add_argument("--user", help="username (default: everyone)")
+    cluster.add_argument("--workers", type=int, default=None)
+    cluster.add_argument("--rebuild", action="store_true",
+                         help="recompute signatures that already exist")
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    user_id = None
+    if args.user:
+        user = db.get_user(args.user)
+        if user is None:
+            print(f"No such user: {args.user}", file=sys.stderr)
+            return 1
+        user_id = user["id"]
+
+    start = timer.perf_counter()
+    signed, clusters = cluster_routes(
+        user_id, args.workers, args.rebuild,
+        progress=lambda done, total: print(f"\r{done}/{total}", end="")
+    )
+    print(f"\nSigned {signed} workouts into {clusters} routes "
+          f"in {timer.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
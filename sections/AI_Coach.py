@@ -2,18 +2,18 @@
 
 import streamlit as st
 import pandas as pd
-from db import get_conn
+from db import connection
 
 
 def show_ai_coach(uid):
     st.title("🤖 AI Fitness Coach")
 
-    conn = get_conn()
-    df = pd.read_sql_query(
-        "SELECT duration, calories FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 10",
-        conn,
-        params=(uid,)
-    )
+    with connection() as conn:
+        df = pd.read_sql_query(
+            "SELECT duration, calories FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 10",
+            conn,
+            params=(uid,)
+        )
 
     if df.empty:
         st.info("No workout data yet.")
@@ -1,7 +1,8 @@
 # sections/Achievements.py
 
 import streamlit as st
-from db import get_conn
+from db import connection
+from records import format_duration, personal_records
 import pandas as pd
 from datetime import datetime
 
@@ -9,18 +10,14 @@ from datetime import datetime
 def show_achievements(uid):
     st.title("🏆 Achievements & Progress")
 
-    conn = get_conn()
-    c = conn.cursor()
-
-    c.execute("""
-        SELECT COUNT(*), 
-               SUM(distance_km), 
-               SUM(duration_min)
-        FROM workouts 
-        WHERE user_id=?
-    """, (uid,))
-
-    row = c.fetchone()
+    with connection() as conn:
+        row = conn.execute("""
+            SELECT COUNT(*), 
+                   SUM(distance_km), 
+                   SUM(duration_min)
+            FROM workouts 
+            WHERE user_id=?
+        """, (uid,)).fetchone()
 
     total_workouts = row[0] or 0
     total_distance = row[1] or 0
@@ -79,25 +76,53 @@ def show_achievements(uid):
 
     st.markdown("---")
 
+    # ==========================================================
+    # PERSONAL RECORDS
+    # ==========================================================
+    st.subheader("🥇 Personal Records")
+
+    with connection() as conn:
+        records = personal_records(conn, uid)
+
+    if records:
+        by_sport = {}
+        for r in records:
+            by_sport.setdefault(r["sport"], []).append(r)
+
+        for sport, rows in by_sport.items():
+            st.write(f"**{sport}**")
+            cols = st.columns(min(len(rows), 4))
+            for i, r in enumerate(rows):
+                if r["kind"] == "distance":
+                    value = format_duration(r["value"])
+                else:
+                    value = f"{r['value']:.2f} km"
+                when = str(r["date"])[:10] if r["date"] else ""
+                cols[i % len(cols)].metric(f"🏅 {r['label']}", value, when,
+                                           delta_color="off")
+    else:
+        st.info("Upload GPS workouts to start setting personal records.")
+
+    st.markdown("---")
+
     # ==========================================================
     # STREAK SYSTEM
     # ==========================================================
     st.subheader("🔥 Activity Streak")
 
-    df = pd.read_sql_query(
-        "SELECT date FROM workouts WHERE user_id=? ORDER BY date",
-        conn,
-        params=(uid,)
-    )
-
-    conn.close()
+    with connection() as conn:
+        df = pd.read_sql_query(
+            """
+            SELECT DISTINCT day FROM workouts
+            WHERE user_id=? AND day IS NOT NULL
+            ORDER BY day
+            """,
+            conn,
+            params=(uid,)
+        )
 
     if not df.empty:
-        df["date"] = pd.to_datetime(df["date"], errors="coerce")
-        df = df.dropna()
-
-        df = df.sort_values("date")
-        df["diff"] = df["date"].diff().dt.days
+        df["diff"] = df["day"].diff()
 
         streak = 1
         max_streak = 1
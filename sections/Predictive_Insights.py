@@ -1,99 +1,130 @@
 # sections/Predictive_Insights.py
 
 import streamlit as st
-import pandas as pd
-from db import get_conn
-from sklearn.linear_model import LinearRegression
 import numpy as np
-import plotly.express as px
-
-
-def show_predictive_insights(uid):
-    st.title("📊 Predictive Insights")
+import pandas as pd
+from datetime import date, timedelta
+from db import connection, workouts_version
+from forecast import FORECAST_WEEKS, INTERVAL_LEVEL
+from insights import (
+    MIN_WORKOUTS, RECENT_FORM_HALF_LIFE, trend_predict, trend_states,
+    weekly_distance_forecast,
+)
+from utils import epoch_day
 
-    conn = get_conn()
 
-    df = pd.read_sql_query(
-        "SELECT date, duration_min, distance_km FROM workouts WHERE user_id=? ORDER BY date",
-        conn,
-        params=(uid,)
-    )
+# Fitted forecasts kept across reruns and sessions
+FORECAST_CACHE_ENTRIES = 256
 
-    conn.close()
 
-    df = df.dropna(subset=["distance_km"])
+@st.cache_data(max_entries=FORECAST_CACHE_ENTRIES, show_spinner=False)
+def cached_weekly_forecast(uid, version, today):
+    # version is only part of the cache key: it changes on every
+    # insert, update or delete of the user's workouts
+    with connection() as conn:
+        return weekly_distance_forecast(conn, uid, today)
 
-    if len(df) < 5:
-        st.warning("Need at least 5 workouts for prediction.")
-        return
 
-    # ✅ Proper date handling
-    df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    df = df.dropna(subset=["date"])
-    df = df.sort_values("date")
+def to_date(day):
+    return date(1970, 1, 1) + timedelta(days=int(day))
 
-    # Convert date to numeric days
-    df["days"] = (df["date"] - df["date"].min()).dt.days
 
-    X = df[["days"]]
-    y = df["distance_km"]
+def show_predictive_insights(uid):
+    st.title("📊 Predictive Insights")
 
-    model = LinearRegression()
-    model.fit(X, y)
+    today = epoch_day(date.today())
+    with connection() as conn:
+        version = workouts_version(conn, uid)
+        total_workouts = conn.execute(
+            "SELECT COUNT(*) FROM workouts WHERE user_id=? AND distance_km IS NOT NULL",
+            (uid,)
+        ).fetchone()[0]
+        # Per-workout recent form comes straight from the online sums
+        states = trend_states(conn, uid)
+        conn.commit()
+
+    f = cached_weekly_forecast(uid, version, today)
+
+    if total_workouts < MIN_WORKOUTS or not np.isfinite(f.forecast[0, 0]):
+        st.warning(f"Need at least {MIN_WORKOUTS} workouts over a few weeks for prediction.")
+        return
 
-    # Predict next workout (based on next day interval)
-    next_day = df["days"].max() + 7  # assume next workout in 7 days
-    prediction = model.predict([[next_day]])[0]
+    history = f.history[0]
+    started = np.isfinite(history)
+    weeks = [to_date(d) for d in f.weeks]
+    ahead = [to_date(f.weeks[-1] + 7 * h) for h in range(1, FORECAST_WEEKS + 1)]
+    forecast, lower, upper = f.forecast[0], f.lower[0], f.upper[0]
 
     # ==========================================================
     # METRICS
     # ==========================================================
-    col1, col2, col3 = st.columns(3)
-
-    col1.metric("Total Workouts", len(df))
-    col2.metric("Average Distance", f"{round(df['distance_km'].mean(),2)} km")
-    col3.metric("Predicted Next", f"{round(prediction,2)} km")
+    col1, col2, col3, col4 = st.columns(4)
+
+    col1.metric("Total Workouts", total_workouts)
+    col2.metric("Avg Weekly Distance", f"{np.nanmean(history):.2f} km")
+    col3.metric("This Week Forecast", f"{forecast[0]:.2f} km",
+                help=f"{INTERVAL_LEVEL}% interval {lower[0]:.1f}–{upper[0]:.1f} km")
+    if np.isfinite(f.backtest_mae[0]):
+        col4.metric("Backtest Error", f"±{f.backtest_mae[0]:.2f} km",
+                    help=f"Mean absolute error forecasting your last {FORECAST_WEEKS} weeks")
+
+    recent = states.get(("distance_km", RECENT_FORM_HALF_LIFE))
+    if recent is not None:
+        st.caption(
+            f"Recent form ({RECENT_FORM_HALF_LIFE}-day half-life): next workout around "
+            f"{trend_predict(recent, today + 1):.2f} km"
+        )
 
     st.markdown("---")
 
     # ==========================================================
-    # TREND GRAPH
+    # WEEKLY TREND GRAPH
     # ==========================================================
-    df["Predicted"] = model.predict(X)
-
-    fig = px.line(
-        df,
-        x="date",
-        y=["distance_km", "Predicted"],
-        title="Actual vs Predicted Trend",
-        labels={"value": "Distance (km)", "date": "Date"}
+    import plotly.graph_objects as go
+
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=[w for w, s in zip(weeks, started) if s], y=history[started],
+        name="Weekly distance"
+    ))
+    fig.add_trace(go.Scatter(
+        x=weeks, y=f.fitted[0], mode="lines", name="Smoothed"
+    ))
+    fig.add_trace(go.Scatter(
+        x=ahead + ahead[::-1], y=np.concatenate([upper, lower[::-1]]),
+        fill="toself", line={"width": 0}, opacity=0.3, name=f"{INTERVAL_LEVEL}% interval"
+    ))
+    fig.add_trace(go.Scatter(
+        x=ahead, y=forecast, mode="lines+markers", name="Forecast"
+    ))
+    fig.update_layout(
+        template="plotly_dark",
+        title="Weekly Distance: Actual, Smoothed and Forecast",
+        xaxis_title="Week", yaxis_title="Distance (km)"
     )
-
-    fig.update_layout(template="plotly_dark")
     st.plotly_chart(fig, use_container_width=True)
 
     # ==========================================================
     # PERFORMANCE ANALYSIS
     # ==========================================================
-    last_actual = df["distance_km"].iloc[-1]
-    growth = prediction - last_actual
+    last_week = history[-1]
+    growth = forecast[0] - last_week
 
     if growth > 0:
-        st.success(f"📈 You are improving! +{round(growth,2)} km expected.")
+        st.success(f"📈 You are improving! +{round(growth,2)} km expected this week.")
     elif growth < 0:
-        st.warning(f"📉 Slight drop predicted: {round(abs(growth),2)} km.")
+        st.warning(f"📉 Slight drop predicted: {round(abs(growth),2)} km this week.")
     else:
         st.info("📊 Performance stable.")
 
     # ==========================================================
     # NEXT 5 PREDICTIONS (WEEKLY)
     # ==========================================================
-    future_days = np.array([df["days"].max() + 7*i for i in range(1,6)]).reshape(-1,1)
-    future_preds = model.predict(future_days)
-
     future_df = pd.DataFrame({
-        "Week Ahead": range(1,6),
-        "Predicted Distance (km)": [round(p,2) for p in future_preds]
+        "Week Of": ahead,
+        "Predicted Distance (km)": np.round(forecast, 2),
+        "Low (km)": np.round(lower, 2),
+        "High (km)": np.round(upper, 2),
     })
 
     st.subheader("🔮 Next 5 Week Predictions")
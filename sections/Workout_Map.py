@@ -2,97 +2,253 @@
 
 import streamlit as st
 import folium
+import numpy as np
 from streamlit_folium import st_folium
-from db import get_conn
+from activities import save_activity
+from db import connection
+from heatmap import heatmap_image
+from segments import create_segment
+from spatial import workouts_in_bbox
+from track_reader import Track
+from track_store import cached_route_polyline
+from utils import haversine_km
 from datetime import datetime
-import math
 
 
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+# Past routes drawn over the planner, most recent first
+ROUTE_OVERLAY_LIMIT = 25
+ROUTE_OVERLAY_POINTS = 500
+
+DEFAULT_CENTER = (20.5937, 78.9629)
+DEFAULT_ZOOM = 5
 
-    a = math.sin(dphi/2)**2 + math.cos(phi1)*math.cos(phi2)*math.sin(dlambda/2)**2
-    return 2 * R * math.asin(math.sqrt(a))
 
+# ==========================================================
+# Planned Route State
+# Points plus the length of each hop between them, so adding,
+# undoing or moving a point only touches its own hops and the
+# running total instead of re-measuring the whole route.
+# ==========================================================
+def init_route():
+    if "route_hops" not in st.session_state:
+        route_reset()
+        st.session_state["handled_click"] = None
 
-def show_workout_map(uid):
-    st.title("🗺️ Workout Map Planner")
 
-    conn = get_conn()
-    c = conn.cursor()
+def route_add(point):
+    points = st.session_state["selected_points"]
+    if points:
+        hop = haversine_km(points[-1], point)
+        st.session_state["route_hops"].append(hop)
+        st.session_state["route_km"] += hop
+    points.append(point)
 
-    # ==========================================================
-    # Interactive Map
-    # ==========================================================
-    if "selected_points" not in st.session_state:
-        st.session_state["selected_points"] = []
 
-    m = folium.Map(location=[20.5937, 78.9629], zoom_start=5)
-    map_data = st_folium(m, width=900, height=500)
+def route_undo():
+    points = st.session_state["selected_points"]
+    if not points:
+        return
+    points.pop()
+    if st.session_state["route_hops"]:
+        st.session_state["route_km"] -= st.session_state["route_hops"].pop()
 
-    if map_data and map_data.get("last_clicked"):
-        lat = map_data["last_clicked"]["lat"]
-        lon = map_data["last_clicked"]["lng"]
 
-        if not st.session_state["selected_points"] or \
-           st.session_state["selected_points"][-1] != (lat, lon):
-            st.session_state["selected_points"].append((lat, lon))
+def route_move(i, point):
+    points = st.session_state["selected_points"]
+    hops = st.session_state["route_hops"]
+    points[i] = point
 
-    # Show selected points
-    if len(st.session_state["selected_points"]) >= 1:
-        st.write("📍 Selected Points:")
-        for i, p in enumerate(st.session_state["selected_points"]):
-            st.write(f"Point {i+1}: {p}")
+    # Only the hops into and out of point i change
+    for h in (i - 1, i):
+        if 0 <= h < len(hops):
+            new = haversine_km(points[h], points[h + 1])
+            st.session_state["route_km"] += new - hops[h]
+            hops[h] = new
 
-    # ==========================================================
-    # Distance Calculation
-    # ==========================================================
-    if len(st.session_state["selected_points"]) >= 2:
-        p1 = st.session_state["selected_points"][-2]
-        p2 = st.session_state["selected_points"][-1]
 
-        distance_km = haversine(p1[0], p1[1], p2[0], p2[1])
+def route_reset():
+    st.session_state["selected_points"] = []
+    st.session_state["route_hops"] = []
+    st.session_state["route_km"] = 0.0
+
+
+def route_track():
+    points = np.array(st.session_state["selected_points"], dtype=np.float64)
+    n = len(points)
+    return Track(
+        points[:, 0], points[:, 1],
+        np.full(n, np.nan), np.full(n, np.nan), np.zeros(n, np.int32),
+        distance_km=st.session_state["route_km"]
+    )
+
+
+# ==========================================================
+# Map Layers
+# ==========================================================
+@st.cache_resource
+def base_map():
+    # Built once; each rerun only sends the changing layers to it
+    return folium.Map(location=DEFAULT_CENTER, zoom_start=DEFAULT_ZOOM)
+
+
+def add_routes_in_view(layer, conn, uid, view):
+    south, west, north, east = view["bounds"]
+    rows = workouts_in_bbox(conn, uid, south, west, north, east,
+                            limit=ROUTE_OVERLAY_LIMIT)
+
+    for row in rows:
+        points = cached_route_polyline(
+            conn, row["id"], zoom=view["zoom"], max_points=ROUTE_OVERLAY_POINTS
+        )
+        if len(points) >= 2:
+            folium.PolyLine(
+                points, color="purple", weight=2, opacity=0.6,
+                tooltip=f"{row['title']} ({str(row['date'])[:10]})"
+            ).add_to(layer)
+
+    return len(rows)
 
-        st.success(f"Distance Between Last Two Points: {round(distance_km,2)} km")
 
+def add_heatmap_layer(layer, conn, uid, view):
+    overlay = heatmap_image(conn, uid, view["bounds"], view["zoom"])
+    if overlay is None:
+        return False
+
+    image, bounds = overlay
+    folium.raster_layers.ImageOverlay(
+        image=image, bounds=bounds, opacity=0.8, name="My Heatmap"
+    ).add_to(layer)
+    return True
+
+
+def add_planned_route(layer):
+    points = st.session_state["selected_points"]
+    if len(points) >= 2:
+        folium.PolyLine(points, color="blue", weight=4).add_to(layer)
+    for i, p in enumerate(points):
+        folium.CircleMarker(
+            p, radius=5, color="green" if i == 0 else "blue",
+            fill=True, tooltip=f"Point {i + 1}"
+        ).add_to(layer)
+
+
+def show_workout_map(uid):
+    st.title("🗺️ Workout Map Planner")
+
+    init_route()
+
+    # ==========================================================
+    # Interactive Map
+    # ==========================================================
+    # Last viewport reported by the map, so past routes can be
+    # fetched from the spatial index for just the visible area
+    view = st.session_state.get("map_view")
+
+    layer = folium.FeatureGroup(name="Planner")
+    if view:
+        col1, col2 = st.columns(2)
+        show_heatmap = col1.checkbox("Show my heatmap", value=False)
+        show_routes = col2.checkbox("Show my past routes in this area", value=True)
+
+        with connection() as conn:
+            if show_heatmap:
+                add_heatmap_layer(layer, conn, uid, view)
+            if show_routes:
+                shown = add_routes_in_view(layer, conn, uid, view)
+                conn.commit()
+                if shown:
+                    st.caption(f"{shown} past routes in view")
+
+    add_planned_route(layer)
+
+    points = st.session_state["selected_points"]
+    actions = ["Add point"] + [f"Move point {i + 1}" for i in range(len(points))]
+    action = st.radio("On map click", actions, horizontal=True)
+
+    map_data = st_folium(
+        base_map(),
+        center=view["center"] if view else DEFAULT_CENTER,
+        zoom=view["zoom"] if view else DEFAULT_ZOOM,
+        feature_group_to_add=layer,
+        key="planner_map",
+        width=900,
+        height=500
+    )
+
+    if map_data and map_data.get("bounds") and map_data.get("center"):
+        sw = map_data["bounds"]["_southWest"]
+        ne = map_data["bounds"]["_northEast"]
+        if sw.get("lat") is not None and ne.get("lat") is not None:
+            st.session_state["map_view"] = {
+                "bounds": (sw["lat"], sw["lng"], ne["lat"], ne["lng"]),
+                "center": (map_data["center"]["lat"], map_data["center"]["lng"]),
+                "zoom": map_data.get("zoom") or DEFAULT_ZOOM,
+            }
+
+    # The component keeps reporting its last click, so act on each once
+    click = map_data.get("last_clicked") if map_data else None
+    if click and (click["lat"], click["lng"]) != st.session_state["handled_click"]:
+        point = (click["lat"], click["lng"])
+        st.session_state["handled_click"] = point
+
+        if action == "Add point":
+            route_add(point)
+        else:
+            route_move(actions.index(action) - 1, point)
+        st.rerun()
+
+    col1, col2 = st.columns(2)
+    if col1.button("↩️ Undo Last Point"):
+        route_undo()
+        st.rerun()
+    if col2.button("🔄 Reset Points"):
+        route_reset()
+        st.rerun()
+
+    # ==========================================================
+    # Route Distance
+    # ==========================================================
+    if len(points) >= 2:
+        st.success(
+            f"Route: {len(points)} points, {st.session_state['route_km']:.2f} km"
+        )
+
+        title = st.text_input("Workout Title", value="Map Planned Workout")
+        sport = st.selectbox(
+            "Sport Type",
+            ["Running", "Cycling", "Hiking", "Walking", "Trail"]
+        )
         duration = st.number_input("Duration (minutes)", min_value=1)
 
         if st.button("💾 Save This Workout"):
-            # Insert workout
-            c.execute("""
-                INSERT INTO workouts 
-                (user_id, title, sport, date, distance_km, duration_min, ascent_m, calories, notes, file_path)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                uid,
-                "Map Planned Workout",
-                "Running",
-                datetime.utcnow().isoformat(),
-                round(distance_km, 2),
-                duration,
-                None,
-                None,
-                "Created via Map Planner",
-                ""
-            ))
-
-            workout_id = c.lastrowid
-
-            # Store both points in workout_points table
-            for point in [p1, p2]:
-                c.execute("""
-                    INSERT INTO workout_points (user_id, workout_id, latitude, longitude)
-                    VALUES (?, ?, ?, ?)
-                """, (uid, workout_id, point[0], point[1]))
-
-            conn.commit()
+            # Workout row and the whole route in one transaction
+            with connection() as conn:
+                save_activity(
+                    conn, uid, route_track(),
+                    title=title,
+                    sport=sport,
+                    duration_min=duration,
+                    started_at=datetime.utcnow(),
+                    notes="Created via Map Planner"
+                )
+                conn.commit()
             st.success("Workout saved successfully!")
 
-    if st.button("🔄 Reset Points"):
-        st.session_state["selected_points"] = []
-
-    conn.close()
+        # ==========================================================
+        # Save as Segment
+        # ==========================================================
+        with st.expander("🏁 Save these points as a segment"):
+            name = st.text_input("Segment Name", value="My Segment")
+
+            if st.button("Create Segment"):
+                # Past workouts are matched by the segment backfill job
+                with connection() as conn:
+                    create_segment(conn, uid, name, points)
+                    conn.commit()
+                st.success(
+                    "Segment created. New workouts are matched as they are saved; "
+                    "past workouts are added by the next segment backfill."
+                )
+
+    elif points:
+        st.info("Click at least one more point to build a route.")
@@ -0,0 +1,38 @@
+import importlib
+
+
+# ==========================================================
+# PAGE REGISTRY
+# Menu label -> (module, page function), in menu order. A page's
+# module is imported the first time it is opened, so a rerun only
+# pays for the plotly/folium/etc. imports of the page it renders.
+# ==========================================================
+SECTIONS = {
+    "Dashboard": ("sections.dashboard", "show_dashboard"),
+    "Workouts": ("sections.workouts", "show_workouts"),
+    "Workout Map": ("sections.Workout_Map", "show_workout_map"),
+    "Predictive Insights": ("sections.Predictive_Insights", "show_predictive_insights"),
+    "Achievements": ("sections.Achievements", "show_achievements"),
+    "GPX Upload": ("sections.gpx", "show_gpx"),
+    "Nutrition": ("sections.nutrition", "show_nutrition"),
+    "Goals": ("sections.goals", "show_goals"),
+    "BMI & Health": ("sections.bmi", "show_bmi"),
+    "Mood": ("sections.mood", "show_mood"),
+    "AI Coach": ("sections.ai_engine", "show_ai_engine"),
+    "Analytics": ("sections.analytics", "show_analytics"),
+    "Calendar": ("sections.calendar", "show_calendar"),
+    "Sleep": ("sections.sleep", "show_sleep"),
+    "Hydration": ("sections.hydration", "show_hydration"),
+    "Habits": ("sections.habits", "show_habits"),
+    "Stress Index": ("sections.stress", "show_stress"),
+    "Leaderboard": ("sections.leaderboard", "show_leaderboard"),
+    "News": ("sections.news", "show_news"),
+    "Export": ("sections.export", "show_export"),
+    "Admin Panel": ("sections.admin", "show_admin"),
+}
+
+
+def load_section(label):
+    # import_module returns the cached module after the first call
+    module, func = SECTIONS[label]
+    return getattr(importlib.import_module(module), func)
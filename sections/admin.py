@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
-from db import get_conn
+from db import connection
 
 
 def show_admin(uid):
-    conn = get_conn()
-
     # Only allow admin user
     if st.session_state.user["username"] != "admin":
         st.warning("Admin access only.")
@@ -23,7 +21,8 @@ def show_admin(uid):
     # TAB 1 — USERS
     # ==========================================================
     with tab1:
-        users = pd.read_sql_query("SELECT id, username FROM users", conn)
+        with connection() as conn:
+            users = pd.read_sql_query("SELECT id, username FROM users", conn)
 
         if users.empty:
             st.info("No users found.")
@@ -36,8 +35,9 @@ def show_admin(uid):
             )
 
             if st.button("Delete Selected User"):
-                conn.execute("DELETE FROM users WHERE username=?", (user_to_delete,))
-                conn.commit()
+                with connection() as conn:
+                    conn.execute("DELETE FROM users WHERE username=?", (user_to_delete,))
+                    conn.commit()
                 st.success("User deleted.")
                 st.rerun()
 
@@ -45,15 +45,16 @@ def show_admin(uid):
     # TAB 2 — WORKOUT RECORDS
     # ==========================================================
     with tab2:
-        workouts = pd.read_sql_query(
-            """
-            SELECT u.username, w.title, w.date, w.distance_km
-            FROM workouts w
-            JOIN users u ON w.user_id = u.id
-            ORDER BY w.date DESC
-            """,
-            conn
-        )
+        with connection() as conn:
+            workouts = pd.read_sql_query(
+                """
+                SELECT u.username, w.title, w.date, w.distance_km
+                FROM workouts w
+                JOIN users u ON w.user_id = u.id
+                ORDER BY w.date DESC
+                """,
+                conn
+            )
 
         if workouts.empty:
             st.info("No workout records.")
@@ -64,10 +65,11 @@ def show_admin(uid):
     # TAB 3 — DATABASE STATS
     # ==========================================================
     with tab3:
-        total_users = pd.read_sql_query("SELECT COUNT(*) as count FROM users", conn)["count"][0]
-        total_workouts = pd.read_sql_query("SELECT COUNT(*) as count FROM workouts", conn)["count"][0]
-        total_journals = pd.read_sql_query("SELECT COUNT(*) as count FROM journals", conn)["count"][0]
-        total_sleep = pd.read_sql_query("SELECT COUNT(*) as count FROM sleep", conn)["count"][0]
+        with connection() as conn:
+            total_users = pd.read_sql_query("SELECT COUNT(*) as count FROM users", conn)["count"][0]
+            total_workouts = pd.read_sql_query("SELECT COUNT(*) as count FROM workouts", conn)["count"][0]
+            total_journals = pd.read_sql_query("SELECT COUNT(*) as count FROM journals", conn)["count"][0]
+            total_sleep = pd.read_sql_query("SELECT COUNT(*) as count FROM sleep", conn)["count"][0]
 
         col1, col2 = st.columns(2)
         col3, col4 = st.columns(2)
@@ -76,5 +78,3 @@ def show_admin(uid):
         col2.metric("Total Workouts", total_workouts)
         col3.metric("Total Journals", total_journals)
         col4.metric("Total Sleep Records", total_sleep)
-
-    conn.close()
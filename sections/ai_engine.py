@@ -1,12 +1,10 @@
 import streamlit as st
 import pandas as pd
-from db import get_conn
+from db import connection
 from utils import mood_to_score
 
 
 def show_ai_engine(uid):
-    conn = get_conn()
-
     st.title("🤖 AI Recommendation Engine")
 
     st.markdown("Personalized insights generated from your activity, mood, sleep, BMI and nutrition.")
@@ -14,35 +12,36 @@ def show_ai_engine(uid):
     # ---------------------------------------------------------
     # FETCH DATA
     # ---------------------------------------------------------
-    workouts = pd.read_sql_query(
-        "SELECT date, duration_min FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    journals = pd.read_sql_query(
-        "SELECT mood FROM journals WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    sleep = pd.read_sql_query(
-        "SELECT hours FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    bmi = pd.read_sql_query(
-        "SELECT bmi FROM bmi_records WHERE user_id=? ORDER BY date DESC LIMIT 1",
-        conn,
-        params=(uid,)
-    )
-
-    nutrition = pd.read_sql_query(
-        "SELECT calories, protein FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
+    with connection() as conn:
+        workouts = pd.read_sql_query(
+            "SELECT date, duration_min FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        journals = pd.read_sql_query(
+            "SELECT mood FROM journals WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        sleep = pd.read_sql_query(
+            "SELECT hours FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        bmi = pd.read_sql_query(
+            "SELECT bmi FROM bmi_records WHERE user_id=? ORDER BY date DESC LIMIT 1",
+            conn,
+            params=(uid,)
+        )
+
+        nutrition = pd.read_sql_query(
+            "SELECT calories, protein FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
 
     st.markdown("---")
 
@@ -132,5 +131,3 @@ def show_ai_engine(uid):
             )
     else:
         st.info("Not enough data to generate insights yet.")
-
-    conn.close()
@@ -2,19 +2,23 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from db import get_conn
-from utils import mood_to_score, safe_to_datetime
+import numpy as np
+from datetime import date, timedelta
+from db import connection
+from routes import rename_route, route_history, user_routes
+from sensors import HR_ZONES, season_zone_seconds, user_max_hr
+from utils import epoch_day, mood_to_score
 
 
 def show_analytics(uid):
-    conn = get_conn()
-
     st.title("📈 Analytics Dashboard")
 
-    tab1, tab2, tab3 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5 = st.tabs([
         "Workout Trends",
         "Mood Correlation",
-        "Activity Heatmap"
+        "Activity Heatmap",
+        "Heart Rate Zones",
+        "My Routes"
     ])
 
     # ==========================================================
@@ -22,22 +26,41 @@ def show_analytics(uid):
     # ==========================================================
     with tab1:
 
-        df = pd.read_sql_query(
-            "SELECT date, distance_km, duration_min FROM workouts WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        trend_weeks = st.slider("Weeks shown", min_value=4, max_value=104, value=26,
+                                key="trend_weeks")
+        today = epoch_day(date.today())
+        start = epoch_day(date.today() - timedelta(weeks=trend_weeks))
+
+        with connection() as conn:
+            # Epoch day 0 was a Thursday, so weeks start on Monday
+            weekly = pd.read_sql_query(
+                """
+                SELECT (day + 3) / 7 * 7 - 3 AS week, SUM(distance_km) AS distance_km
+                FROM workouts
+                WHERE user_id=? AND day BETWEEN ? AND ?
+                GROUP BY week
+                ORDER BY week
+                """,
+                conn,
+                params=(uid, start, today)
+            )
+            daily = pd.read_sql_query(
+                """
+                SELECT day, SUM(duration_min) AS duration_min
+                FROM workouts
+                WHERE user_id=? AND day BETWEEN ? AND ?
+                GROUP BY day
+                ORDER BY day
+                """,
+                conn,
+                params=(uid, start, today)
+            )
 
-        if df.empty:
+        if weekly.empty:
             st.info("No workout data yet.")
         else:
-            df["date"] = safe_to_datetime(df["date"])
-
-            # Weekly total distance
-            df_week = df.copy()
-            df_week["week"] = df_week["date"].dt.to_period("W").astype(str)
-
-            weekly = df_week.groupby("week").sum(numeric_only=True).reset_index()
+            weekly["week"] = pd.to_datetime(weekly["week"], unit="D").dt.date
+            daily["date"] = pd.to_datetime(daily["day"], unit="D")
 
             st.subheader("Weekly Distance")
             fig = px.bar(weekly, x="week", y="distance_km")
@@ -45,7 +68,7 @@ def show_analytics(uid):
             st.plotly_chart(fig, use_container_width=True)
 
             st.subheader("Workout Duration Trend")
-            fig2 = px.line(df.sort_values("date"), x="date", y="duration_min", markers=True)
+            fig2 = px.line(daily, x="date", y="duration_min", markers=True)
             fig2.update_layout(template="plotly_dark")
             st.plotly_chart(fig2, use_container_width=True)
 
@@ -54,27 +77,31 @@ def show_analytics(uid):
     # ==========================================================
     with tab2:
 
-        workouts = pd.read_sql_query(
-            "SELECT date, duration_min FROM workouts WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            # Daily training load, matched to moods logged the same day
+            workouts = pd.read_sql_query(
+                """
+                SELECT day, SUM(duration_min) AS duration_min
+                FROM workouts
+                WHERE user_id=? AND day IS NOT NULL
+                GROUP BY day
+                """,
+                conn,
+                params=(uid,)
+            )
 
-        journals = pd.read_sql_query(
-            "SELECT date, mood FROM journals WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+            journals = pd.read_sql_query(
+                "SELECT day, mood FROM journals WHERE user_id=? AND day IS NOT NULL",
+                conn,
+                params=(uid,)
+            )
 
         if workouts.empty or journals.empty:
             st.info("Need both workout and mood data.")
         else:
-            workouts["date"] = safe_to_datetime(workouts["date"])
-            journals["date"] = safe_to_datetime(journals["date"])
-
             journals["mood_score"] = journals["mood"].apply(mood_to_score)
 
-            merged = pd.merge(workouts, journals, on="date", how="inner")
+            merged = pd.merge(workouts, journals, on="day", how="inner")
 
             if merged.empty:
                 st.info("No matching workout and mood dates.")
@@ -102,23 +129,29 @@ def show_analytics(uid):
     # ==========================================================
     with tab3:
 
-        df_heat = pd.read_sql_query(
-            """
-            SELECT date FROM workouts WHERE user_id=?
-            UNION ALL
-            SELECT date FROM journals WHERE user_id=?
-            """,
-            conn,
-            params=(uid, uid)
-        )
+        with connection() as conn:
+            # Entries per epoch day, then folded onto the day of the month
+            daily = pd.read_sql_query(
+                """
+                SELECT day, COUNT(*) AS count
+                FROM (
+                    SELECT day FROM workouts WHERE user_id=?
+                    UNION ALL
+                    SELECT day FROM journals WHERE user_id=?
+                )
+                WHERE day IS NOT NULL
+                GROUP BY day
+                """,
+                conn,
+                params=(uid, uid)
+            )
 
-        if df_heat.empty:
+        if daily.empty:
             st.info("No data for heatmap.")
         else:
-            df_heat["date"] = safe_to_datetime(df_heat["date"])
-            df_heat["day"] = df_heat["date"].dt.day
+            daily["day"] = pd.to_datetime(daily["day"], unit="D").dt.day
 
-            counts = df_heat.groupby("day").size().reset_index(name="count")
+            counts = daily.groupby("day")["count"].sum().reset_index()
 
             fig = px.density_heatmap(
                 counts,
@@ -131,4 +164,86 @@ def show_analytics(uid):
             fig.update_layout(template="plotly_dark")
             st.plotly_chart(fig, use_container_width=True)
 
-    conn.close()
+    # ==========================================================
+    # TAB 4 — SEASON HEART RATE ZONES
+    # ==========================================================
+    with tab4:
+
+        weeks_back = st.slider("Weeks", min_value=4, max_value=52, value=16)
+        with connection() as conn:
+            default_max_hr = int(user_max_hr(conn, uid))
+        max_hr = st.number_input(
+            "Max heart rate (bpm)", min_value=120, max_value=230,
+            value=default_max_hr
+        )
+
+        start = epoch_day(date.today() - timedelta(weeks=weeks_back))
+        with connection() as conn:
+            week_days, seconds = season_zone_seconds(conn, uid, start_day=start, max_hr=max_hr)
+
+        if not len(week_days):
+            st.info("Upload workouts recorded with a heart rate monitor to see zones.")
+        else:
+            zones = pd.DataFrame(seconds / 3600, columns=list(HR_ZONES))
+            zones["week"] = [str(date(1970, 1, 1) + timedelta(days=int(d))) for d in week_days]
+
+            st.subheader("Weekly Time in Zones (hours)")
+            fig = px.bar(zones, x="week", y=list(HR_ZONES))
+            fig.update_layout(template="plotly_dark")
+            st.plotly_chart(fig, use_container_width=True)
+
+            totals = seconds.sum(axis=0)
+            share = totals / max(totals.sum(), 1)
+            cols = st.columns(len(HR_ZONES))
+            for col, name, hours, pct in zip(cols, HR_ZONES, totals / 3600, share):
+                col.metric(name, f"{hours:.1f} h", f"{pct:.0%}", delta_color="off")
+
+    # ==========================================================
+    # TAB 5 — RECURRING ROUTES
+    # ==========================================================
+    with tab5:
+
+        with connection() as conn:
+            routes = user_routes(conn, uid)
+
+        if not routes:
+            st.info("Routes you repeat show up here once you have saved them twice.")
+        else:
+            labels = {f"{r['name']} ({r['workouts']} workouts)": r for r in routes}
+            route = labels[st.selectbox("Route", list(labels))]
+
+            st.subheader(f"Your {route['workouts']} workouts on {route['name']}")
+            st.caption(f"Average {route['avg_km']:.2f} km, last on {str(route['last_date'])[:10]}")
+
+            with connection() as conn:
+                history = pd.DataFrame(
+                    [dict(r) for r in route_history(conn, route["id"])]
+                ).dropna(subset=["ts", "distance_km", "duration_min"])
+            history = history[history["distance_km"] > 0]
+
+            if len(history) >= 2:
+                history["date"] = pd.to_datetime(history["ts"], unit="s")
+                history["pace"] = history["duration_min"] / history["distance_km"]
+
+                # Least-squares trend of pace over time
+                days = ((history["ts"] - history["ts"].min()) / 86400).to_numpy()
+                slope, intercept = np.polyfit(days, history["pace"], 1)
+
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=history["date"], y=history["pace"],
+                                         mode="markers", name="Pace (min/km)"))
+                fig.add_trace(go.Scatter(x=history["date"], y=intercept + slope * days,
+                                         mode="lines", name="Trend"))
+                fig.update_layout(template="plotly_dark", yaxis_title="min/km")
+                st.plotly_chart(fig, use_container_width=True)
+
+                st.metric("Pace trend", f"{slope * 30:+.2f} min/km per month",
+                          delta_color="off")
+
+            with st.expander("Rename this route"):
+                name = st.text_input("Route name", value=route["name"] or "")
+                if st.button("Save Name"):
+                    with connection() as conn:
+                        rename_route(conn, route["id"], name)
+                        conn.commit()
+                    st.rerun()
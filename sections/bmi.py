@@ -1,13 +1,12 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from db import get_conn
+from db import connection
+from utils import date_keys
 from datetime import date
 
 
 def show_bmi(uid):
-    conn = get_conn()
-
     st.title("📊 BMI & Health Calculator")
 
     tab1, tab2 = st.tabs(["BMI Calculator", "Health Insights"])
@@ -117,22 +116,26 @@ def show_bmi(uid):
 
         # Save BMI Record
         if st.button("Save BMI Record"):
-            conn.execute(
-                "INSERT INTO bmi_records (user_id, date, bmi, category) VALUES (?, ?, ?, ?)",
-                (uid, date.today().isoformat(), bmi_value, category)
-            )
-            conn.commit()
+            today = date.today()
+            day, ts = date_keys(today)
+            with connection() as conn:
+                conn.execute(
+                    "INSERT INTO bmi_records (user_id, date, day, ts, bmi, category) VALUES (?, ?, ?, ?, ?, ?)",
+                    (uid, today.isoformat(), day, ts, bmi_value, category)
+                )
+                conn.commit()
             st.success("BMI record saved.")
 
     # ==========================================================
     # TAB 2 — BMI History
     # ==========================================================
     with tab2:
-        df = pd.read_sql_query(
-            "SELECT * FROM bmi_records WHERE user_id=? ORDER BY date DESC",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM bmi_records WHERE user_id=? ORDER BY date DESC",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No BMI records yet.")
@@ -147,5 +150,3 @@ def show_bmi(uid):
             ))
             fig.update_layout(template="plotly_dark", title="BMI Trend")
             st.plotly_chart(fig, use_container_width=True)
-
-    conn.close()
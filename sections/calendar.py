@@ -3,13 +3,11 @@ import pandas as pd
 import calendar
 from datetime import date
 from collections import defaultdict
-from db import get_conn
-from utils import safe_to_datetime
+from db import connection
+from utils import date_keys, epoch_day
 
 
 def show_calendar(uid):
-    conn = get_conn()
-
     st.title("📅 Calendar")
 
     # ---------------------------------------------------------
@@ -47,23 +45,24 @@ def show_calendar(uid):
             submitted = st.form_submit_button("Save Event")
 
             if submitted:
-                conn.execute(
-                    """
-                    INSERT INTO events
-                    (user_id, title, date, start_time, end_time, location, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        uid,
-                        title,
-                        selected_date.isoformat(),
-                        start_time.strftime("%H:%M"),
-                        end_time.strftime("%H:%M"),
-                        location,
-                        notes
+                with connection() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO events
+                        (user_id, title, date, start_time, end_time, location, notes)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            uid,
+                            title,
+                            selected_date.isoformat(),
+                            start_time.strftime("%H:%M"),
+                            end_time.strftime("%H:%M"),
+                            location,
+                            notes
+                        )
                     )
-                )
-                conn.commit()
+                    conn.commit()
                 st.success("Event saved 📌")
 
     # ADD JOURNAL
@@ -81,23 +80,27 @@ def show_calendar(uid):
 
             if submitted:
                 sentiment_score = 0  # placeholder for future sentiment logic
-
-                conn.execute(
-                    """
-                    INSERT INTO journals
-                    (user_id, date, title, mood, content, sentiment)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        uid,
-                        selected_date.isoformat(),
-                        title,
-                        mood,
-                        content,
-                        sentiment_score
+                day, ts = date_keys(selected_date)
+
+                with connection() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO journals
+                        (user_id, date, day, ts, title, mood, content, sentiment)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            uid,
+                            selected_date.isoformat(),
+                            day,
+                            ts,
+                            title,
+                            mood,
+                            content,
+                            sentiment_score
+                        )
                     )
-                )
-                conn.commit()
+                    conn.commit()
                 st.success("Journal saved 📝")
 
     st.markdown("---")
@@ -113,17 +116,18 @@ def show_calendar(uid):
     month_start = date(year, month, 1).isoformat()
     month_end = date(year, month, calendar.monthrange(year, month)[1]).isoformat()
 
-    events = pd.read_sql_query(
-        "SELECT date, title FROM events WHERE user_id=? AND date BETWEEN ? AND ?",
-        conn,
-        params=(uid, month_start, month_end)
-    )
+    with connection() as conn:
+        events = pd.read_sql_query(
+            "SELECT date, title FROM events WHERE user_id=? AND date BETWEEN ? AND ?",
+            conn,
+            params=(uid, month_start, month_end)
+        )
 
-    journals = pd.read_sql_query(
-        "SELECT date, mood FROM journals WHERE user_id=? AND date BETWEEN ? AND ?",
-        conn,
-        params=(uid, month_start, month_end)
-    )
+        journals = pd.read_sql_query(
+            "SELECT date, mood FROM journals WHERE user_id=? AND day BETWEEN ? AND ?",
+            conn,
+            params=(uid, epoch_day(month_start), epoch_day(month_end))
+        )
 
     event_map = defaultdict(list)
     for _, row in events.iterrows():
@@ -168,17 +172,18 @@ def show_calendar(uid):
     # ---------------------------------------------------------
     st.subheader(f"Items on {selected_date}")
 
-    day_events = pd.read_sql_query(
-        "SELECT title, start_time, end_time FROM events WHERE user_id=? AND date=?",
-        conn,
-        params=(uid, selected_date.isoformat())
-    )
+    with connection() as conn:
+        day_events = pd.read_sql_query(
+            "SELECT title, start_time, end_time FROM events WHERE user_id=? AND date=?",
+            conn,
+            params=(uid, selected_date.isoformat())
+        )
 
-    day_journals = pd.read_sql_query(
-        "SELECT title, mood, content FROM journals WHERE user_id=? AND date=?",
-        conn,
-        params=(uid, selected_date.isoformat())
-    )
+        day_journals = pd.read_sql_query(
+            "SELECT title, mood, content FROM journals WHERE user_id=? AND day=?",
+            conn,
+            params=(uid, epoch_day(selected_date))
+        )
 
     if day_events.empty and day_journals.empty:
         st.info("No entries for this day.")
@@ -190,5 +195,3 @@ def show_calendar(uid):
         if not day_journals.empty:
             st.markdown("### 📝 Journals")
             st.dataframe(day_journals, use_container_width=True)
-
-    conn.close()
@@ -1,33 +1,65 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-from db import get_conn
-from utils import safe_to_datetime
+from datetime import date, timedelta
+from db import connection
+from insights import stored_forecast
+from utils import epoch_day
 
 
-def show_dashboard(uid):
-    conn = get_conn()
+# Months shown in the distance trend, including the current one
+TREND_MONTHS = 12
 
-    st.title("📊 Dashboard Overview")
 
-    # Fetch workouts
-    df = pd.read_sql_query(
-        "SELECT * FROM workouts WHERE user_id=? ORDER BY date DESC",
-        conn,
-        params=(uid,)
-    )
+def show_dashboard(uid):
+    st.title("📊 Dashboard Overview")
 
-    if df.empty:
+    today = date.today()
+    months = today.year * 12 + today.month - TREND_MONTHS
+    trend_start = date(months // 12, months % 12 + 1, 1)
+
+    with connection() as conn:
+        # Summed and grouped in SQL on the integer day keys
+        totals = conn.execute(
+            "SELECT COUNT(*), SUM(distance_km), SUM(duration_min) FROM workouts WHERE user_id=?",
+            (uid,)
+        ).fetchone()
+
+        monthly = pd.read_sql_query(
+            """
+            SELECT strftime('%Y-%m', day * 86400, 'unixepoch') AS month,
+                   SUM(distance_km) AS distance_km
+            FROM workouts
+            WHERE user_id=? AND day BETWEEN ? AND ?
+            GROUP BY month
+            ORDER BY month
+            """,
+            conn,
+            params=(uid, epoch_day(trend_start), epoch_day(today))
+        )
+
+        recent = pd.read_sql_query(
+            """
+            SELECT day, title, sport, distance_km, duration_min
+            FROM workouts
+            WHERE user_id=?
+            ORDER BY day DESC, ts DESC
+            LIMIT 5
+            """,
+            conn,
+            params=(uid,)
+        )
+
+        # Precomputed by the nightly forecast job; week 1 is the week it ran
+        forecast = stored_forecast(conn, uid)
+
+    if not totals[0]:
         st.info("No workouts logged yet.")
         return
 
-    # Safe datetime parsing
-    df["date"] = safe_to_datetime(df["date"])
-
     # Summary Metrics
-    total_workouts = len(df)
-    total_distance = df["distance_km"].fillna(0).sum()
-    total_duration = df["duration_min"].fillna(0).sum()
+    total_workouts = totals[0]
+    total_distance = totals[1] or 0
+    total_duration = totals[2] or 0
 
     col1, col2, col3 = st.columns(3)
 
@@ -35,13 +67,20 @@ def show_dashboard(uid):
     col2.metric("Total Distance (km)", f"{total_distance:.2f}")
     col3.metric("Total Duration (min)", f"{total_duration:.0f}")
 
+    if forecast:
+        week = forecast[0]
+        week_of = date(1970, 1, 1) + timedelta(days=week["week_start"])
+        st.caption(
+            f"🔮 Forecast for the week of {week_of}: "
+            f"{week['value']:.1f} km ({week['lower']:.1f}–{week['upper']:.1f} km)"
+        )
+
     st.markdown("---")
 
-    # Monthly Trend
-    st.subheader("📈 Monthly Distance Trend")
+    # Monthly Trend (plotly only loads once there is data to chart)
+    import plotly.express as px
 
-    df["month"] = df["date"].dt.to_period("M").astype(str)
-    monthly = df.groupby("month")["distance_km"].sum().reset_index()
+    st.subheader(f"📈 Monthly Distance Trend (last {TREND_MONTHS} months)")
 
     fig = px.bar(
         monthly,
@@ -59,9 +98,6 @@ def show_dashboard(uid):
     # Recent Workouts
     st.subheader("🕒 Recent Workouts")
 
-    recent = df.head(5)[["date", "title", "sport", "distance_km", "duration_min"]]
-    recent["date"] = recent["date"].dt.date
+    recent.insert(0, "date", pd.to_datetime(recent.pop("day"), unit="D").dt.date)
 
     st.dataframe(recent, use_container_width=True)
-
-    conn.close()
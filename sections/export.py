@@ -1,11 +1,9 @@
 import streamlit as st
 import pandas as pd
-from db import get_conn
+from db import connection
 
 
 def show_export(uid):
-    conn = get_conn()
-
     st.title("📦 Export Data")
 
     tab1, tab2, tab3 = st.tabs([
@@ -18,11 +16,12 @@ def show_export(uid):
     # EXPORT WORKOUTS
     # ==========================================================
     with tab1:
-        df = pd.read_sql_query(
-            "SELECT * FROM workouts WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM workouts WHERE user_id=?",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No workout data to export.")
@@ -39,11 +38,12 @@ def show_export(uid):
     # EXPORT NUTRITION
     # ==========================================================
     with tab2:
-        df = pd.read_sql_query(
-            "SELECT * FROM nutrition WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM nutrition WHERE user_id=?",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No nutrition data to export.")
@@ -60,11 +60,12 @@ def show_export(uid):
     # EXPORT SLEEP
     # ==========================================================
     with tab3:
-        df = pd.read_sql_query(
-            "SELECT * FROM sleep WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM sleep WHERE user_id=?",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No sleep data to export.")
@@ -76,5 +77,3 @@ def show_export(uid):
                 file_name="sleep_export.csv",
                 mime="text/csv"
             )
-
-    conn.close()
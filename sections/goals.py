@@ -1,12 +1,10 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn
+from db import connection
 
 
 def show_goals(uid):
-    conn = get_conn()
-
     st.title("🎯 Goals")
 
     tab1, tab2 = st.tabs(["➕ Set Goal", "📊 View Progress"])
@@ -27,21 +25,22 @@ def show_goals(uid):
             submitted = st.form_submit_button("Save Goal")
 
             if submitted:
-                conn.execute(
-                    """
-                    INSERT INTO goals
-                    (user_id, goal_type, target_value, start_date, end_date)
-                    VALUES (?, ?, ?, ?, ?)
-                    """,
-                    (
-                        uid,
-                        goal_type,
-                        target_value,
-                        start_date.isoformat(),
-                        end_date.isoformat()
+                with connection() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO goals
+                        (user_id, goal_type, target_value, start_date, end_date)
+                        VALUES (?, ?, ?, ?, ?)
+                        """,
+                        (
+                            uid,
+                            goal_type,
+                            target_value,
+                            start_date.isoformat(),
+                            end_date.isoformat()
+                        )
                     )
-                )
-                conn.commit()
+                    conn.commit()
                 st.success("Goal created successfully! 🎯")
 
     # ==========================================================
@@ -49,11 +48,12 @@ def show_goals(uid):
     # ==========================================================
     with tab2:
 
-        goals_df = pd.read_sql_query(
-            "SELECT * FROM goals WHERE user_id=? ORDER BY end_date DESC",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            goals_df = pd.read_sql_query(
+                "SELECT * FROM goals WHERE user_id=? ORDER BY end_date DESC",
+                conn,
+                params=(uid,)
+            )
 
         if goals_df.empty:
             st.info("No goals set yet.")
@@ -66,25 +66,28 @@ def show_goals(uid):
 
                 # Calculate current progress
                 if goal["goal_type"] == "Total Distance (km)":
-                    current = pd.read_sql_query(
-                        "SELECT SUM(distance_km) as total FROM workouts WHERE user_id=?",
-                        conn,
-                        params=(uid,)
-                    )["total"][0] or 0
+                    with connection() as conn:
+                        current = pd.read_sql_query(
+                            "SELECT SUM(distance_km) as total FROM workouts WHERE user_id=?",
+                            conn,
+                            params=(uid,)
+                        )["total"][0] or 0
 
                 elif goal["goal_type"] == "Total Workouts":
-                    current = pd.read_sql_query(
-                        "SELECT COUNT(*) as total FROM workouts WHERE user_id=?",
-                        conn,
-                        params=(uid,)
-                    )["total"][0]
+                    with connection() as conn:
+                        current = pd.read_sql_query(
+                            "SELECT COUNT(*) as total FROM workouts WHERE user_id=?",
+                            conn,
+                            params=(uid,)
+                        )["total"][0]
 
                 elif goal["goal_type"] == "Target Calories":
-                    current = pd.read_sql_query(
-                        "SELECT SUM(calories) as total FROM nutrition WHERE user_id=?",
-                        conn,
-                        params=(uid,)
-                    )["total"][0] or 0
+                    with connection() as conn:
+                        current = pd.read_sql_query(
+                            "SELECT SUM(calories) as total FROM nutrition WHERE user_id=?",
+                            conn,
+                            params=(uid,)
+                        )["total"][0] or 0
 
                 else:
                     current = 0
@@ -95,5 +98,3 @@ def show_goals(uid):
                 st.write(f"Current Progress: {current:.2f}")
 
                 st.markdown("---")
-
-    conn.close()
@@ -1,60 +1,154 @@
 import streamlit as st
-import gpxpy
-import folium
-from streamlit_folium import st_folium
-from db import get_conn
-from utils import haversine_km
-from datetime import datetime
+import numpy as np
+import pandas as pd
+from activities import (
+    clean_activity, file_sha256, find_by_sha256, parse_activity, save_activity
+)
+from db import connection
+from importer import import_upload
+from sensors import HR_ZONES, has_sensors, sensor_summary, time_in_zones, user_max_hr
+from track_store import cached_route_polyline, load_track, workouts_with_points
+from utils import fit_zoom
 
 
-def show_gpx(uid):
-    conn = get_conn()
+def route_map(points, zoom=13):
+    # folium is only needed once there is a route to draw
+    import folium
 
-    st.title("🗺 GPX Upload & Route Visualization")
+    m = folium.Map(location=points[0], zoom_start=zoom)
+    folium.PolyLine(points, color="blue", weight=4).add_to(m)
 
-    uploaded_file = st.file_uploader("Upload GPX File", type=["gpx"])
+    folium.Marker(points[0], tooltip="Start",
+                  icon=folium.Icon(color="green")).add_to(m)
 
-    if not uploaded_file:
-        st.info("Upload a GPX file to visualize your route.")
+    folium.Marker(points[-1], tooltip="End",
+                  icon=folium.Icon(color="red")).add_to(m)
+
+    return m
+
+
+def show_route_map(points, zoom):
+    from streamlit_folium import st_folium
+
+    st_folium(route_map(points, zoom), width=800, height=450)
+
+
+def show_past_routes(uid):
+    with connection() as conn:
+        past = workouts_with_points(conn, uid)
+    if not past:
         return
 
-    try:
-        gpx = gpxpy.parse(uploaded_file)
+    st.subheader("Saved Routes")
+    choice = st.selectbox(
+        "Show a saved route",
+        past,
+        format_func=lambda r: f"{r['title']} ({str(r['date'])[:10]})"
+    )
+
+    with connection() as conn:
+        track = load_track(conn, choice["id"])
+        zoom = fit_zoom(track.lat, track.lon)
+        points = cached_route_polyline(conn, choice["id"], track, zoom)
+        conn.commit()
+    show_route_map(points, zoom)
+    st.metric("Distance (km)", f"{track.distance_km:.2f}")
+
+
+def show_sensor_summary(uid, track):
+    st.subheader("Heart Rate & Power")
+    summary = sensor_summary(track)
+
+    col1, col2, col3, col4 = st.columns(4)
+    if np.isfinite(summary.avg_hr):
+        col1.metric("Avg HR (bpm)", f"{summary.avg_hr:.0f}")
+        col2.metric("Max HR (bpm)", f"{summary.max_hr:.0f}")
+    if np.isfinite(summary.avg_power):
+        col3.metric("Avg Power (W)", f"{summary.avg_power:.0f}")
+    if np.isfinite(summary.np_power):
+        col4.metric("Normalized Power (W)", f"{summary.np_power:.0f}")
+    if np.isfinite(summary.avg_cadence):
+        col1.metric("Avg Cadence", f"{summary.avg_cadence:.0f}")
+    if np.isfinite(summary.drift_pct):
+        col2.metric("Cardiac Drift", f"{summary.drift_pct:.1f}%")
+
+    if np.isfinite(summary.avg_hr):
+        with connection() as conn:
+            max_hr = max(user_max_hr(conn, uid), summary.max_hr)
+        zones = time_in_zones(summary.hr_seconds, max_hr) / 60
+        st.caption(f"Time in HR zones (min), max HR {max_hr:.0f} bpm")
+        st.bar_chart(pd.DataFrame({"minutes": zones}, index=list(HR_ZONES)))
+
+
+def show_bulk_import(uid):
+    with st.expander("Bulk Import (zip of GPX / TCX / FIT files)"):
+        archive = st.file_uploader("Upload Archive", type=["zip"], key="bulk_zip")
+        sport = st.selectbox(
+            "Sport Type for imported files",
+            ["Running", "Cycling", "Hiking", "Walking", "Trail"],
+            key="bulk_sport"
+        )
 
-        points = []
-        total_distance = 0
+        if not archive or not st.button("Import All"):
+            return
 
-        for track in gpx.tracks:
-            for segment in track.segments:
-                prev_point = None
-                for point in segment.points:
-                    latlon = (point.latitude, point.longitude)
-                    points.append(latlon)
+        bar = st.progress(0.0, text="Parsing files...")
 
-                    if prev_point:
-                        total_distance += haversine_km(prev_point, latlon)
+        def progress(done, total, label):
+            bar.progress(done / total, text=f"{done}/{total} {label}")
 
-                    prev_point = latlon
+        try:
+            report = import_upload(uid, archive, sport=sport, progress=progress)
+        except Exception as e:
+            st.error(f"Import failed: {e}")
+            return
 
-        if not points:
+        st.success(
+            f"Imported {report.imported} workouts in {report.seconds:.1f}s."
+        )
+        if report.duplicates:
+            st.info(f"{len(report.duplicates)} files were already imported and skipped.")
+        if report.errors:
+            st.warning(f"{len(report.errors)} files could not be imported.")
+            st.dataframe(
+                [{"File": name, "Error": error} for name, error in report.errors],
+                use_container_width=True
+            )
+
+
+def show_gpx(uid):
+    st.title("🗺 GPX Upload & Route Visualization")
+
+    show_bulk_import(uid)
+
+    uploaded_file = st.file_uploader("Upload GPX File", type=["gpx"])
+
+    if not uploaded_file:
+        st.info("Upload a GPX file to visualize your route.")
+        show_past_routes(uid)
+        return
+
+    try:
+        # Parsed once per distinct file; reruns hit the cache
+        data = uploaded_file.getvalue()
+        sha = file_sha256(data)
+        parsed = parse_activity(data, uploaded_file.name, sha)
+        track, metrics = parsed.track, parsed.metrics
+        total_distance = metrics.distance_km
+
+        if not len(track.lat):
             st.error("No valid GPS points found in file.")
             return
 
+        # Bounded payload however long the ride was
+        zoom, points = parsed.zoom, parsed.polyline
+
         # ---------------------------------------------------------
         # MAP VISUALIZATION
         # ---------------------------------------------------------
         st.subheader("Route Map")
 
-        m = folium.Map(location=points[0], zoom_start=13)
-        folium.PolyLine(points, color="blue", weight=4).add_to(m)
-
-        folium.Marker(points[0], tooltip="Start",
-                      icon=folium.Icon(color="green")).add_to(m)
-
-        folium.Marker(points[-1], tooltip="End",
-                      icon=folium.Icon(color="red")).add_to(m)
-
-        st_folium(m, width=800, height=450)
+        show_route_map(points, zoom)
 
         st.markdown("---")
 
@@ -63,42 +157,68 @@ def show_gpx(uid):
         # ---------------------------------------------------------
         st.subheader("Save As Workout")
 
+        with connection() as conn:
+            existing = find_by_sha256(conn, uid, sha)
+        if existing:
+            st.info(
+                f"This file is already saved as \"{existing['title']}\" "
+                f"({str(existing['date'])[:10]})."
+            )
+            return
+
         title = st.text_input("Workout Title", value="GPX Activity")
         sport = st.selectbox(
             "Sport Type",
             ["Running", "Cycling", "Hiking", "Walking", "Trail"]
         )
+        smooth = st.checkbox("Smooth GPS noise (Kalman filter)", value=False)
+
+        # Spikes and stop jitter removed for the chosen sport
+        cleaned = clean_activity(parsed, sport, smooth)
+        metrics = cleaned.metrics
+        dropped = len(track.lat) - len(cleaned.track.lat)
+        st.caption(
+            f"Raw GPS distance {total_distance:.2f} km; "
+            f"{dropped} outlier points removed."
+        )
 
+        # Prefill from the file's timestamps when it has them
+        recorded_min = metrics.elapsed_s / 60
         duration_min = st.number_input(
             "Duration (minutes)",
             min_value=1.0,
-            value=30.0
+            value=max(round(recorded_min, 1), 1.0) if recorded_min else 30.0
         )
 
-        st.metric("Calculated Distance (km)", f"{total_distance:.2f}")
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Calculated Distance (km)", f"{metrics.distance_km:.2f}")
+        col2.metric("Moving Time (min)", f"{metrics.moving_s / 60:.0f}")
+        col3.metric("Ascent (m)", f"{metrics.ascent_m:.0f}")
+
+        if len(metrics.splits_s):
+            st.caption("Splits (min/km): " + ", ".join(
+                f"{s / 60:.2f}" for s in metrics.splits_s
+            ))
+
+        if has_sensors(track):
+            show_sensor_summary(uid, track)
 
         if st.button("Save Workout"):
-            conn.execute(
-                """
-                INSERT INTO workouts
-                (user_id, title, sport, date, distance_km, duration_min, ascent_m, notes)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    uid,
-                    title,
-                    sport,
-                    datetime.now().isoformat(),
-                    round(total_distance, 2),
-                    duration_min,
-                    None,
-                    "Imported from GPX"
+            # Workout row and full point stream in one transaction
+            with connection() as conn:
+                save_activity(
+                    conn, uid, track,
+                    title=title,
+                    sport=sport,
+                    duration_min=duration_min,
+                    # Dated from the track's first timestamp, as bulk imports are
+                    started_at=None,
+                    metrics=metrics,
+                    cleaned=cleaned.track,
+                    file_sha256=sha
                 )
-            )
-            conn.commit()
+                conn.commit()
             st.success("Workout saved successfully.")
 
     except Exception as e:
         st.error(f"Error processing GPX file: {e}")
-
-    conn.close()
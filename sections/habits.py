@@ -1,15 +1,15 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn
+from db import connection, enqueue_write, wait_for_writes
+from utils import date_keys
 
 
 def show_habits(uid):
-    conn = get_conn()
-
     st.title("🧩 Habit Builder")
 
     today = date.today().isoformat()
+    day, ts = date_keys(today)
 
     tab1, tab2 = st.tabs(["➕ Add Habit", "✅ Today's Habits"])
 
@@ -21,11 +21,12 @@ def show_habits(uid):
 
         if st.button("Add Habit"):
             if habit_name.strip():
-                conn.execute(
-                    "INSERT INTO habits (user_id, date, habit_name, completed) VALUES (?, ?, ?, 0)",
-                    (uid, today, habit_name.strip())
-                )
-                conn.commit()
+                with connection() as conn:
+                    conn.execute(
+                        "INSERT INTO habits (user_id, date, day, ts, habit_name, completed) VALUES (?, ?, ?, ?, ?, 0)",
+                        (uid, today, day, ts, habit_name.strip())
+                    )
+                    conn.commit()
                 st.success("Habit added!")
                 st.rerun()
             else:
@@ -35,11 +36,13 @@ def show_habits(uid):
     # TODAY'S HABITS
     # ==========================================================
     with tab2:
-        habits_df = pd.read_sql_query(
-            "SELECT * FROM habits WHERE user_id=? AND date=?",
-            conn,
-            params=(uid, today)
-        )
+        wait_for_writes(uid)
+        with connection() as conn:
+            habits_df = pd.read_sql_query(
+                "SELECT * FROM habits WHERE user_id=? AND date=?",
+                conn,
+                params=(uid, today)
+            )
 
         if habits_df.empty:
             st.info("No habits added today.")
@@ -52,11 +55,11 @@ def show_habits(uid):
                 )
 
                 if checked != bool(row["completed"]):
-                    conn.execute(
+                    enqueue_write(
                         "UPDATE habits SET completed=? WHERE id=?",
-                        (int(checked), row["id"])
+                        (int(checked), int(row["id"])),
+                        key=uid
                     )
-                    conn.commit()
 
             st.markdown("---")
 
@@ -75,15 +78,15 @@ def show_habits(uid):
     st.markdown("---")
     st.subheader("📊 Habit History (Last 14 Days)")
 
-    history = pd.read_sql_query(
-        "SELECT date, habit_name, completed FROM habits WHERE user_id=? ORDER BY date DESC LIMIT 50",
-        conn,
-        params=(uid,)
-    )
+    wait_for_writes(uid)
+    with connection() as conn:
+        history = pd.read_sql_query(
+            "SELECT date, habit_name, completed FROM habits WHERE user_id=? ORDER BY date DESC LIMIT 50",
+            conn,
+            params=(uid,)
+        )
 
     if not history.empty:
         st.dataframe(history, use_container_width=True)
     else:
         st.info("No habit history yet.")
-
-    conn.close()
@@ -2,37 +2,25 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import date
-from db import get_conn
+from db import add_glasses, connection, wait_for_writes
 
 
 def show_hydration(uid):
-    conn = get_conn()
     st.title("💧 Hydration Tracker")
 
-    today = date.today().isoformat()
+    today = date.today()
 
-    # Get today's record
-    record = pd.read_sql_query(
-        "SELECT * FROM hydration WHERE user_id=? AND date=?",
-        conn,
-        params=(uid, today)
-    )
-
-    if record.empty:
-        conn.execute(
-            "INSERT INTO hydration (user_id, date, glasses) VALUES (?, ?, ?)",
-            (uid, today, 0)
-        )
-        conn.commit()
-        glasses = 0
-    else:
-        glasses = record["glasses"].iloc[0]
+    # Glass clicks go through the write-behind queue
+    wait_for_writes(uid)
 
-        # 🔥 FIX: convert bytes to int if needed
-        if isinstance(glasses, bytes):
-            glasses = int.from_bytes(glasses, byteorder="little")
+    # Get today's record
+    with connection() as conn:
+        record = conn.execute(
+            "SELECT glasses FROM hydration WHERE user_id=? AND date=?",
+            (uid, today.isoformat())
+        ).fetchone()
 
-        glasses = int(glasses or 0)
+    glasses = record["glasses"] if record else 0
 
     # ==========================================================
     # INTERACTIVE GLASSES
@@ -43,12 +31,7 @@ def show_hydration(uid):
 
     with col1:
         if st.button("➖ Remove Glass"):
-            glasses = max(int(glasses) - 1, 0)
-            conn.execute(
-                "UPDATE hydration SET glasses=? WHERE user_id=? AND date=?",
-                (int(glasses), uid, today)
-            )
-            conn.commit()
+            add_glasses(uid, today, -1)
             st.rerun()
 
     with col2:
@@ -56,12 +39,7 @@ def show_hydration(uid):
 
     with col3:
         if st.button("➕ Add Glass"):
-            glasses = int(glasses) + 1
-            conn.execute(
-                "UPDATE hydration SET glasses=? WHERE user_id=? AND date=?",
-                (int(glasses), uid, today)
-            )
-            conn.commit()
+            add_glasses(uid, today, 1)
             st.rerun()
 
     # Visual glasses
@@ -75,18 +53,14 @@ def show_hydration(uid):
     # ==========================================================
     st.subheader("📊 Weekly Hydration Trend")
 
-    df = pd.read_sql_query(
-        "SELECT * FROM hydration WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    if not df.empty:
-        # 🔥 Fix weekly data as well
-        df["glasses"] = df["glasses"].apply(
-            lambda x: int.from_bytes(x, "little") if isinstance(x, bytes) else int(x)
+    with connection() as conn:
+        df = pd.read_sql_query(
+            "SELECT * FROM hydration WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
         )
 
+    if not df.empty:
         fig = px.bar(
             df.sort_values("date"),
             x="date",
@@ -97,5 +71,3 @@ def show_hydration(uid):
         st.plotly_chart(fig, use_container_width=True)
     else:
         st.info("No hydration history yet.")
-
-    conn.close()
@@ -1,34 +1,33 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from db import get_conn
+from db import connection
+from segments import list_segments, segment_leaderboard
 
 
 def show_leaderboard(uid):
-    conn = get_conn()
-
     st.title("🏆 Leaderboard")
 
     # ---------------------------------------------------------
     # FETCH DATA
     # ---------------------------------------------------------
-    df = pd.read_sql_query(
-        """
-        SELECT u.username,
-               COUNT(w.id) as total_workouts,
-               SUM(w.distance_km) as total_distance,
-               SUM(w.duration_min) as total_duration
-        FROM users u
-        LEFT JOIN workouts w ON u.id = w.user_id
-        GROUP BY u.username
-        ORDER BY total_distance DESC
-        """,
-        conn
-    )
+    with connection() as conn:
+        df = pd.read_sql_query(
+            """
+            SELECT u.username,
+                   COUNT(w.id) as total_workouts,
+                   SUM(w.distance_km) as total_distance,
+                   SUM(w.duration_min) as total_duration
+            FROM users u
+            LEFT JOIN workouts w ON u.id = w.user_id
+            GROUP BY u.username
+            ORDER BY total_distance DESC
+            """,
+            conn
+        )
 
     if df.empty:
         st.info("No data available yet.")
-        conn.close()
         return
 
     df.fillna(0, inplace=True)
@@ -68,4 +67,44 @@ def show_leaderboard(uid):
     fig.update_layout(template="plotly_dark")
     st.plotly_chart(fig, use_container_width=True)
 
-    conn.close()
+    st.markdown("---")
+
+    # ---------------------------------------------------------
+    # SEGMENT LEADERBOARDS
+    # ---------------------------------------------------------
+    st.subheader("🏁 Segment Leaderboards")
+
+    with connection() as conn:
+        segments = list_segments(conn)
+    if not segments:
+        st.info("No segments yet. Create one from points on the Workout Map.")
+        return
+
+    segment = st.selectbox(
+        "Segment",
+        segments,
+        format_func=lambda r: f"{r['name']} ({r['length_km']:.2f} km)"
+    )
+
+    with connection() as conn:
+        board = segment_leaderboard(conn, segment["id"])
+    if not segment["backfilled"]:
+        st.caption("Past workouts are added to this board by the next segment backfill.")
+    if not board:
+        st.info("No efforts recorded on this segment yet.")
+        return
+
+    st.dataframe(
+        pd.DataFrame(
+            [
+                {
+                    "Rank": rank,
+                    "Athlete": row["username"],
+                    "Best Time": f"{int(row['best_s'] // 60)}:{int(row['best_s'] % 60):02d}",
+                    "Efforts": row["efforts"],
+                }
+                for rank, row in enumerate(board, 1)
+            ]
+        ),
+        use_container_width=True
+    )
@@ -2,13 +2,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import date
-from db import get_conn
-from utils import mood_to_score, safe_to_datetime
+from db import connection, enqueue_write, wait_for_writes
+from utils import date_keys, mood_to_score, safe_to_datetime
 
 
 def show_mood(uid):
-    conn = get_conn()
-
     st.title("🧘 Mood & Mental Wellness")
 
     tab1, tab2, tab3 = st.tabs([
@@ -33,34 +31,40 @@ def show_mood(uid):
 
             if submitted:
                 sentiment = mood_to_score(mood)
+                day, ts = date_keys(mood_date)
 
-                conn.execute(
+                enqueue_write(
                     """
                     INSERT INTO journals
-                    (user_id, date, title, mood, content, sentiment)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    (user_id, date, day, ts, title, mood, content, sentiment)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     """,
                     (
                         uid,
                         mood_date.isoformat(),
+                        day,
+                        ts,
                         "Mood Entry",
                         mood,
                         notes,
                         sentiment
-                    )
+                    ),
+                    key=uid
                 )
-                conn.commit()
                 st.success("Mood logged successfully.")
 
+    wait_for_writes(uid)
+
     # ==========================================================
     # TAB 2 — MOOD HISTORY
     # ==========================================================
     with tab2:
-        df = pd.read_sql_query(
-            "SELECT date, mood, content, sentiment FROM journals WHERE user_id=? ORDER BY date DESC",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT date, mood, content, sentiment FROM journals WHERE user_id=? ORDER BY date DESC",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No mood data yet.")
@@ -71,11 +75,12 @@ def show_mood(uid):
     # TAB 3 — MOOD ANALYTICS
     # ==========================================================
     with tab3:
-        df = pd.read_sql_query(
-            "SELECT date, mood, sentiment FROM journals WHERE user_id=?",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT date, mood, sentiment FROM journals WHERE user_id=?",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No mood analytics yet.")
@@ -104,5 +109,3 @@ def show_mood(uid):
                 st.info("Your mood is stable but can improve.")
             else:
                 st.success("You are maintaining a strong positive mindset.")
-
-    conn.close()
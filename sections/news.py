@@ -1,9 +1,10 @@
 import streamlit as st
-import requests
-from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 
 
 def show_news(uid):
+    import requests
+    from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
     st.title("📰 Health News & Sentiment Insights")
     st.markdown("Latest health news with AI-powered sentiment analysis.")
 
@@ -1,12 +1,11 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn
+from db import connection, enqueue_write, wait_for_writes
+from utils import date_keys
 
 
 def show_nutrition(uid):
-    conn = get_conn()
-
     st.title("🍎 Nutrition Tracker")
 
     tab1, tab2, tab3 = st.tabs([
@@ -29,26 +28,30 @@ def show_nutrition(uid):
             submitted = st.form_submit_button("Save Meal")
 
             if submitted:
-                conn.execute(
+                day, ts = date_keys(meal_date)
+                enqueue_write(
                     """
                     INSERT INTO nutrition
-                    (user_id, date, calories, protein, carbs, fat)
-                    VALUES (?, ?, ?, ?, ?, ?)
+                    (user_id, date, day, ts, calories, protein, carbs, fat)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
                     """,
-                    (uid, meal_date.isoformat(), calories, protein, carbs, fat)
+                    (uid, meal_date.isoformat(), day, ts, calories, protein, carbs, fat),
+                    key=uid
                 )
-                conn.commit()
                 st.success("Meal logged successfully! 🥗")
 
+    wait_for_writes(uid)
+
     # ==========================================================
     # DAILY SUMMARY
     # ==========================================================
     with tab2:
-        df = pd.read_sql_query(
-            "SELECT * FROM nutrition WHERE user_id=? ORDER BY date DESC",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM nutrition WHERE user_id=? ORDER BY date DESC",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No nutrition data yet.")
@@ -60,11 +63,12 @@ def show_nutrition(uid):
     # AI INSIGHTS
     # ==========================================================
     with tab3:
-        df = pd.read_sql_query(
-            "SELECT * FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("Log meals to see AI insights.")
@@ -82,5 +86,3 @@ def show_nutrition(uid):
                 st.info("⚡ Your calorie intake is relatively low. Ensure you are fueling your workouts.")
             else:
                 st.success("🥦 Your nutrition looks balanced this week!")
-
-    conn.close()
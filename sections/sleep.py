@@ -2,13 +2,11 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime, timedelta, date
-from db import get_conn
-from utils import safe_to_datetime
+from db import connection
+from utils import date_keys, safe_to_datetime
 
 
 def show_sleep(uid):
-    conn = get_conn()
-
     st.title("💤 Sleep Tracker")
 
     tab1, tab2 = st.tabs(["🛌 Log Sleep", "📊 Sleep Insights"])
@@ -38,34 +36,39 @@ def show_sleep(uid):
                 )
 
                 hours = round((wake_dt - bed_dt).total_seconds() / 3600, 2)
-
-                conn.execute(
-                    """
-                    INSERT INTO sleep
-                    (user_id, date, bedtime, waketime, hours, quality)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        uid,
-                        sleep_date.isoformat(),
-                        bedtime.strftime("%H:%M"),
-                        waketime.strftime("%H:%M"),
-                        hours,
-                        quality
+                day, ts = date_keys(sleep_date)
+
+                with connection() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO sleep
+                        (user_id, date, day, ts, bedtime, waketime, hours, quality)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            uid,
+                            sleep_date.isoformat(),
+                            day,
+                            ts,
+                            bedtime.strftime("%H:%M"),
+                            waketime.strftime("%H:%M"),
+                            hours,
+                            quality
+                        )
                     )
-                )
-                conn.commit()
+                    conn.commit()
                 st.success(f"Sleep logged: {hours} hrs 😴")
 
     # ==========================================================
     # SLEEP INSIGHTS
     # ==========================================================
     with tab2:
-        df = pd.read_sql_query(
-            "SELECT * FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 14",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 14",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No sleep data yet.")
@@ -96,5 +99,3 @@ def show_sleep(uid):
             fig.update_layout(template="plotly_dark")
 
             st.plotly_chart(fig, use_container_width=True)
-
-    conn.close()
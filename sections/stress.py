@@ -1,41 +1,40 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-from db import get_conn
+from db import connection
 from utils import mood_to_score
 
 
 def show_stress(uid):
-    conn = get_conn()
-
     st.title("💆 Stress & Recovery Index")
 
     # ---------------------------------------------------------
     # FETCH DATA
     # ---------------------------------------------------------
-    workouts = pd.read_sql_query(
-        "SELECT duration_min FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    journals = pd.read_sql_query(
-        "SELECT mood FROM journals WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    sleep = pd.read_sql_query(
-        "SELECT hours FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
-
-    nutrition = pd.read_sql_query(
-        "SELECT calories FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
-        conn,
-        params=(uid,)
-    )
+    with connection() as conn:
+        workouts = pd.read_sql_query(
+            "SELECT duration_min FROM workouts WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        journals = pd.read_sql_query(
+            "SELECT mood FROM journals WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        sleep = pd.read_sql_query(
+            "SELECT hours FROM sleep WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
+
+        nutrition = pd.read_sql_query(
+            "SELECT calories FROM nutrition WHERE user_id=? ORDER BY date DESC LIMIT 7",
+            conn,
+            params=(uid,)
+        )
 
     # ---------------------------------------------------------
     # CALCULATE COMPONENTS
@@ -106,5 +105,3 @@ def show_stress(uid):
     col2.metric("Sleep Avg (hrs)", f"{avg_sleep:.1f}")
     col3.metric("Mood Index", f"{avg_mood:.0f}")
     col4.metric("Calories Avg", f"{avg_cal:.0f}")
-
-    conn.close()
@@ -1,13 +1,12 @@
 import streamlit as st
 import pandas as pd
 from datetime import date
-from db import get_conn
-from utils import safe_to_datetime
+from db import connection
+from insights import record_workout
+from utils import date_keys, safe_to_datetime
 
 
 def show_workouts(uid):
-    conn = get_conn()
-
     st.title("🏋️ Workouts")
 
     tab1, tab2 = st.tabs(["➕ Add Workout", "📋 View Workouts"])
@@ -32,24 +31,30 @@ def show_workouts(uid):
             submitted = st.form_submit_button("Save Workout")
 
             if submitted:
-                conn.execute(
-                    """
-                    INSERT INTO workouts
-                    (user_id, title, sport, date, distance_km, duration_min, ascent_m, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    (
-                        uid,
-                        title,
-                        sport,
-                        workout_date.isoformat(),
-                        distance,
-                        duration,
-                        ascent,
-                        notes
+                day, ts = date_keys(workout_date)
+                with connection() as conn:
+                    conn.execute(
+                        """
+                        INSERT INTO workouts
+                        (user_id, title, sport, date, day, ts, distance_km, duration_min, ascent_m, notes)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        (
+                            uid,
+                            title,
+                            sport,
+                            workout_date.isoformat(),
+                            day,
+                            ts,
+                            distance,
+                            duration,
+                            ascent,
+                            notes
+                        )
                     )
-                )
-                conn.commit()
+                    record_workout(conn, uid, day,
+                                   {"distance_km": distance, "duration_min": duration})
+                    conn.commit()
                 st.success("Workout saved successfully! 💪")
 
     # ==========================================================
@@ -57,11 +62,12 @@ def show_workouts(uid):
     # ==========================================================
     with tab2:
 
-        df = pd.read_sql_query(
-            "SELECT * FROM workouts WHERE user_id=? ORDER BY date DESC",
-            conn,
-            params=(uid,)
-        )
+        with connection() as conn:
+            df = pd.read_sql_query(
+                "SELECT * FROM workouts WHERE user_id=? ORDER BY date DESC",
+                conn,
+                params=(uid,)
+            )
 
         if df.empty:
             st.info("No workouts logged yet.")
@@ -83,5 +89,3 @@ def show_workouts(uid):
                     if row["distance_km"] and row["duration_min"]:
                         pace = row["duration_min"] / row["distance_km"]
                         col2.metric("Avg Pace (min/km)", f"{pace:.2f}")
-
-    conn.close()
@@ -0,0 +1,320 @@
+import argparse
+import json
+import math
+import sys
+import time as timer
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from utils import EARTH_RADIUS_KM, segment_distances_km
+
+
+# A pass must start and finish within this distance of the
+# segment's endpoints, and hug the segment in between.
+MATCH_TOLERANCE_M = 25
+MAX_DEVIATION_M = 50
+MIN_ON_SEGMENT = 0.9      # share of effort points within MAX_DEVIATION_M
+
+# Workouts handed to one backfill worker task
+BACKFILL_CHUNK = 50
+
+M_PER_DEG = math.pi * EARTH_RADIUS_KM * 1000 / 180
+
+
+# ==========================================================
+# SEGMENTS
+# ==========================================================
+def create_segment(conn, user_id, name, points):
+    """Store a segment from [(lat, lon), ...] (no commit); returns its id."""
+    if len(points) < 2:
+        raise ValueError("A segment needs at least a start and an end point")
+
+    lat = np.array([p[0] for p in points], dtype=np.float64)
+    lon = np.array([p[1] for p in points], dtype=np.float64)
+
+    cur = conn.execute(
+        "INSERT INTO segments (user_id, name, points, length_km) VALUES (?, ?, ?, ?)",
+        (user_id, name, json.dumps([[a, b] for a, b in zip(lat.tolist(), lon.tolist())]),
+         float(segment_distances_km(lat, lon).sum()))
+    )
+    segment_id = cur.lastrowid
+    conn.execute(
+        "INSERT INTO segment_rtree VALUES (?, ?, ?, ?, ?)",
+        (segment_id, lat.min(), lat.max(), lon.min(), lon.max())
+    )
+    return segment_id
+
+
+def load_segment(conn, segment_id):
+    row = conn.execute(
+        "SELECT id, name, points, length_km FROM segments WHERE id=?", (segment_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {"id": row["id"], "name": row["name"],
+            "points": json.loads(row["points"]), "length_km": row["length_km"]}
+
+
+def list_segments(conn):
+    return conn.execute(
+        "SELECT id, name, length_km, backfilled FROM segments ORDER BY name"
+    ).fetchall()
+
+
+# ==========================================================
+# MATCHING
+# Everything is projected to local metres around the segment,
+# then checked with vectorized point-to-polyline distances.
+# ==========================================================
+def _project(lat, lon, lat0):
+    x = np.asarray(lon, dtype=np.float64) * math.cos(math.radians(lat0)) * M_PER_DEG
+    y = np.asarray(lat, dtype=np.float64) * M_PER_DEG
+    return x, y
+
+
+def _resample(x, y, step):
+    # Evenly spaced samples along a polyline, ends included
+    d = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    at = np.linspace(0, d[-1], max(int(d[-1] // step) + 2, 2))
+    return np.interp(at, d, x), np.interp(at, d, y)
+
+
+def _polyline_distance(px, py, sx, sy):
+    """Distance from each point to the nearest part of polyline (sx, sy)."""
+    ax, ay = sx[:-1], sy[:-1]
+    dx, dy = np.diff(sx), np.diff(sy)
+    length2 = np.maximum(dx * dx + dy * dy, 1e-12)
+
+    t = ((px[:, None] - ax) * dx + (py[:, None] - ay) * dy) / length2
+    t = np.clip(t, 0, 1)
+    return np.hypot(px[:, None] - (ax + t * dx), py[:, None] - (ay + t * dy)).min(axis=1)
+
+
+def _closest_per_pass(dist, tolerance):
+    # Index of the closest point in each run of points within tolerance
+    near = np.concatenate(([0], (dist <= tolerance).view(np.int8), [0]))
+    edges = np.diff(near)
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    return [a + int(np.argmin(dist[a:b])) for a, b in zip(starts, stops)]
+
+
+def find_efforts(segment, track):
+    """[(start_idx, end_idx, elapsed_s, start_ts)] for each pass over the segment."""
+    points = np.asarray(segment["points"], dtype=np.float64)
+    timed = np.isfinite(track.time)
+    if len(track.lat) < 2 or not timed.any():
+        return []
+
+    lat0 = float(points[:, 0].mean())
+    sx, sy = _project(points[:, 0], points[:, 1], lat0)
+    tx, ty = _project(track.lat, track.lon, lat0)
+
+    to_start = np.hypot(tx - sx[0], ty - sy[0])
+    to_end = np.hypot(tx - sx[-1], ty - sy[-1])
+    starts = _closest_per_pass(to_start, MATCH_TOLERANCE_M)
+    ends = np.array(_closest_per_pass(to_end, MATCH_TOLERANCE_M), dtype=np.int64)
+    if not starts or not len(ends):
+        return []
+
+    # Dense samples along the segment must all be passed by the effort
+    qx, qy = _resample(sx, sy, MATCH_TOLERANCE_M)
+
+    efforts = []
+    last_end = -1
+    for s in starts:
+        if s <= last_end:
+            continue
+        later = ends[ends > s]
+        if not len(later):
+            break
+        e = int(later[0])
+
+        ex, ey = tx[s:e + 1], ty[s:e + 1]
+        on_segment = _polyline_distance(ex, ey, sx, sy) <= MAX_DEVIATION_M
+        if on_segment.mean() < MIN_ON_SEGMENT:
+            continue
+        if len(ex) < 2 or _polyline_distance(qx, qy, ex, ey).max() > MAX_DEVIATION_M:
+            continue
+
+        elapsed = track.time[e] - track.time[s]
+        if not np.isfinite(elapsed) or elapsed <= 0:
+            continue
+
+        efforts.append((s, e, round(float(elapsed), 1), float(track.time[s])))
+        last_end = e
+
+    return efforts
+
+
+def _store_efforts(conn, segment_id, workout_id, user_id, efforts):
+    conn.executemany(
+        """
+        INSERT OR IGNORE INTO segment_efforts
+        (segment_id, workout_id, user_id, start_idx, end_idx, elapsed_s, start_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        [(segment_id, workout_id, user_id, *effort) for effort in efforts]
+    )
+
+
+def _bounds(lat, lon, pad_m):
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    dlat = pad_m / M_PER_DEG
+    dlon = dlat / max(math.cos(math.radians(float(np.mean(lat[ok])))), 1e-6)
+    return (float(lat[ok].min()) - dlat, float(lat[ok].max()) + dlat,
+            float(lon[ok].min()) - dlon, float(lon[ok].max()) + dlon)
+
+
+def match_workout(conn, user_id, workout_id, track):
+    """Record efforts of a newly saved track on every segment inside its bounds (no commit)."""
+    if not np.isfinite(track.lat).any() or not np.isfinite(track.time).any():
+        return 0
+
+    # A segment can only be ridden if it lies inside the route's box
+    min_lat, max_lat, min_lon, max_lon = _bounds(track.lat, track.lon, MATCH_TOLERANCE_M)
+    candidates = conn.execute(
+        """
+        SELECT id FROM segment_rtree
+        WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?
+        """,
+        (min_lat, max_lat, min_lon, max_lon)
+    ).fetchall()
+
+    found = 0
+    for (segment_id,) in candidates:
+        efforts = find_efforts(load_segment(conn, segment_id), track)
+        _store_efforts(conn, segment_id, workout_id, user_id, efforts)
+        found += len(efforts)
+    return found
+
+
+def candidate_workouts(conn, segment):
+    """(workout_id, user_id, sport) of every stored route whose box covers the segment."""
+    points = np.asarray(segment["points"], dtype=np.float64)
+    min_lat, max_lat, min_lon, max_lon = _bounds(points[:, 0], points[:, 1], -MATCH_TOLERANCE_M)
+    return conn.execute(
+        """
+        SELECT r.id, r.user_id, w.sport FROM workout_rtree r
+        JOIN workouts w ON w.id = r.id
+        WHERE r.min_lat <= ? AND r.max_lat >= ? AND r.min_lon <= ? AND r.max_lon >= ?
+        """,
+        (min_lat, max_lat, min_lon, max_lon)
+    ).fetchall()
+
+
+# ==========================================================
+# BACKFILL
+# A new segment is matched against history once, by this batch
+# job rather than the page that created it. Tracks are cleaned
+# first, as for new workouts and PRs. Workers read tracks on
+# their own connections; the parent does all writes.
+# ==========================================================
+def _match_chunk(db_path, segment, workouts):
+    import db
+    from track_clean import clean_track
+    from track_store import load_track
+
+    db.DB_PATH = db_path
+    rows = []
+    with db.connection() as conn:
+        for workout_id, user_id, sport in workouts:
+            track = clean_track(load_track(conn, workout_id), sport)
+            for effort in find_efforts(segment, track):
+                rows.append((workout_id, user_id, effort))
+    return rows
+
+
+def backfill_segments(workers=None, rematch=False, progress=None):
+    """Match every not-yet-backfilled segment against all history in a process pool.
+
+    Each segment commits on its own, so an interrupted run resumes
+    with the segments it had not finished.
+    """
+    import db
+
+    with db.connection() as conn:
+        if rematch:
+            # Efforts are re-found from scratch, so indices into
+            # re-cleaned tracks never sit beside stale ones
+            conn.execute("DELETE FROM segment_efforts")
+            conn.execute("UPDATE segments SET backfilled=0")
+            conn.commit()
+
+        pending = [r[0] for r in conn.execute("SELECT id FROM segments WHERE backfilled=0")]
+    found = 0
+
+    with db.process_pool(workers) as pool:
+        for segment_id in pending:
+            with db.connection() as conn:
+                segment = load_segment(conn, segment_id)
+                workouts = [tuple(r) for r in candidate_workouts(conn, segment)]
+            futures = [
+                pool.submit(_match_chunk, db.DB_PATH, segment, workouts[i:i + BACKFILL_CHUNK])
+                for i in range(0, len(workouts), BACKFILL_CHUNK)
+            ]
+
+            efforts = []
+            for future in as_completed(futures):
+                efforts.extend(future.result())
+
+            with db.connection() as conn:
+                for workout_id, user_id, effort in efforts:
+                    _store_efforts(conn, segment_id, workout_id, user_id, [effort])
+                conn.execute("UPDATE segments SET backfilled=1 WHERE id=?", (segment_id,))
+                conn.commit()
+            found += len(efforts)
+            if progress:
+                progress(segment["name"], len(workouts))
+
+    return found
+
+
+# ==========================================================
+# LEADERBOARDS
+# ==========================================================
+def segment_leaderboard(conn, segment_id, limit=20):
+    """Best effort per user on a segment, fastest first."""
+    return conn.execute(
+        """
+        SELECT u.username,
+               MIN(e.elapsed_s) AS best_s,
+               COUNT(*) AS efforts
+        FROM segment_efforts e
+        JOIN users u ON u.id = e.user_id
+        WHERE e.segment_id = ?
+        GROUP BY e.user_id
+        ORDER BY best_s
+        LIMIT ?
+        """,
+        (segment_id, limit)
+    ).fetchall()
+
+
+# ==========================================================
+# CLI
+#   python segments.py backfill [--workers N] [--rematch]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Segment effort matching")
+    sub = parser.add_subparsers(dest="command", required=True)
+    backfill = sub.add_parser("backfill", help="match segments against stored history")
+    backfill.add_argument("--workers", type=int, default=None)
+    backfill.add_argument("--rematch", action="store_true",
+                          help="re-scan segments that were already backfilled")
+    args = parser.parse_args(argv)
+
+    import db
+
+    db.ensure_schema()
+    start = timer.perf_counter()
+    found = backfill_segments(
+        args.workers, args.rematch,
+        progress=lambda name, n: print(f"{name}: {n} candidate workouts")
+    )
+    print(f"{found} efforts recorded in {timer.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
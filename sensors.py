@@ -0,0 +1,302 @@
+import struct
+import zlib
+from typing import NamedTuple
+
+import numpy as np
+
+from utils import segment_distances_km
+
+
+# Heart-rate zone lower bounds as a share of max HR; Z1 also
+# takes everything below 60 %
+HR_ZONES = {
+    "Z1 Recovery": 0.0,
+    "Z2 Endurance": 0.6,
+    "Z3 Tempo": 0.7,
+    "Z4 Threshold": 0.8,
+    "Z5 VO2max": 0.9,
+}
+DEFAULT_MAX_HR = 190
+
+# Gaps longer than this (pauses, dropouts) count as no time at all
+MAX_GAP_S = 30
+
+NP_WINDOW_S = 30          # normalized power rolling window
+DRIFT_MIN_S = 20 * 60     # cardiac drift needs a steady effort this long
+
+HR_BINS = 256             # per-workout seconds at each whole bpm
+
+
+class SensorSummary(NamedTuple):
+    avg_hr: float
+    max_hr: float
+    avg_cadence: float
+    avg_power: float
+    np_power: float
+    drift_pct: float
+    hr_seconds: np.ndarray   # float32[HR_BINS], seconds spent at each bpm
+
+
+def has_sensors(track):
+    return any(s is not None for s in (track.hr, track.cadence, track.power))
+
+
+# ==========================================================
+# METRICS
+# Every sample is weighted by the seconds until the next one,
+# so irregular recording intervals and pauses don't skew them.
+# ==========================================================
+def sample_seconds(time):
+    dt = np.zeros(len(time))
+    if len(time) > 1:
+        dt[:-1] = np.diff(time)
+    dt[~np.isfinite(dt) | (dt < 0) | (dt > MAX_GAP_S)] = 0
+    return dt
+
+
+def _weighted_mean(values, dt):
+    ok = np.isfinite(values) & (dt > 0)
+    total = dt[ok].sum()
+    return float((values[ok] * dt[ok]).sum() / total) if total else float("nan")
+
+
+def hr_histogram(hr, dt):
+    """Seconds spent at each whole bpm."""
+    ok = np.isfinite(hr) & (dt > 0)
+    bpm = np.clip(np.round(hr[ok]).astype(np.int64), 0, HR_BINS - 1)
+    return np.bincount(bpm, weights=dt[ok], minlength=HR_BINS).astype(np.float32)
+
+
+def zone_matrix(max_hr):
+    """HR_BINS x zones one-hot map from bpm to zone."""
+    bounds = np.array(list(HR_ZONES.values())[1:]) * max_hr
+    zone = np.searchsorted(bounds, np.arange(HR_BINS), side="right")
+    return np.eye(len(HR_ZONES), dtype=np.float32)[zone]
+
+
+def time_in_zones(hr_seconds, max_hr=DEFAULT_MAX_HR):
+    """Seconds per zone from one histogram or a stack of them (last axis = bpm)."""
+    return np.asarray(hr_seconds, dtype=np.float32) @ zone_matrix(max_hr)
+
+
+def normalized_power(time, power):
+    """(avg, normalized) power over a 1 s resampling of the stream.
+
+    Each contiguous block (split at gaps over MAX_GAP_S or clock
+    jumps backwards) is resampled and windowed on its own, so pauses
+    neither allocate a grid nor get interpolated power.
+    """
+    ok = np.isfinite(time) & np.isfinite(power)
+    if ok.sum() < 2:
+        return float("nan"), float("nan")
+
+    t, p = time[ok], power[ok]
+    step = np.diff(t)
+    cuts = np.flatnonzero((step < 0) | (step > MAX_GAP_S)) + 1
+
+    total = seconds = 0.0
+    rolling = []
+    for bt, bp in zip(np.split(t, cuts), np.split(p, cuts)):
+        if len(bt) < 2:
+            continue
+        watts = np.interp(np.arange(bt[0], bt[-1] + 1), bt, bp)
+        total += watts.sum()
+        seconds += len(watts)
+        if len(watts) >= NP_WINDOW_S:
+            cum = np.concatenate(([0.0], np.cumsum(watts)))
+            rolling.append((cum[NP_WINDOW_S:] - cum[:-NP_WINDOW_S]) / NP_WINDOW_S)
+
+    if not seconds:
+        return float("nan"), float("nan")
+    avg = float(total / seconds)
+    if not rolling:
+        return avg, float("nan")
+    return avg, float(np.mean(np.concatenate(rolling) ** 4) ** 0.25)
+
+
+def cardiac_drift(track, dt):
+    """Aerobic decoupling in % between the two halves of the effort.
+
+    Output per heartbeat (power if recorded, otherwise speed) in
+    the second half vs the first; positive means HR drifted up.
+    """
+    if track.hr is None or dt.sum() < DRIFT_MIN_S:
+        return float("nan")
+
+    elapsed = np.cumsum(dt)
+    first = elapsed <= elapsed[-1] / 2
+
+    if track.power is not None:
+        output = track.power
+    else:
+        step_km = np.zeros(len(track.lat))
+        step_km[:-1] = segment_distances_km(track.lat, track.lon, track.segment)
+        output = np.where(dt > 0, step_km * 1000 / np.where(dt > 0, dt, 1), np.nan)
+
+    ratios = []
+    for half in (first, ~first):
+        hr = _weighted_mean(track.hr[half], dt[half])
+        out = _weighted_mean(output[half], dt[half])
+        ratios.append(out / hr if hr > 0 else float("nan"))
+
+    if not np.isfinite(ratios).all() or ratios[0] <= 0:
+        return float("nan")
+    return float((ratios[0] - ratios[1]) / ratios[0] * 100)
+
+
+def sensor_summary(track):
+    dt = sample_seconds(track.time)
+    nan = float("nan")
+
+    avg_hr = max_hr = avg_cadence = avg_power = np_power = nan
+    hr_seconds = np.zeros(HR_BINS, dtype=np.float32)
+    if track.hr is not None:
+        avg_hr = _weighted_mean(track.hr, dt)
+        max_hr = float(np.nanmax(track.hr))
+        hr_seconds = hr_histogram(track.hr, dt)
+    if track.cadence is not None:
+        avg_cadence = _weighted_mean(track.cadence, dt)
+    if track.power is not None:
+        avg_power, np_power = normalized_power(track.time, track.power)
+
+    return SensorSummary(avg_hr, max_hr, avg_cadence, avg_power, np_power,
+                         cardiac_drift(track, dt), hr_seconds)
+
+
+# ==========================================================
+# ENCODED LAYOUT (workout_sensors.data)
+# Header, then one little-endian uint16 column of n values per
+# stream present (bit i of the mask = SENSOR_COLUMNS[i]), whole
+# units, SENSOR_MISSING where the sample had no reading. Index
+# aligned with the workout's stored point stream.
+# ==========================================================
+SENSOR_MAGIC = b"FTS1"
+SENSOR_HEADER = struct.Struct("<4sBBxxI")  # magic, flags, column mask, n
+SENSOR_COLUMNS = ("hr", "cadence", "power")
+SENSOR_MISSING = 0xFFFF
+FLAG_ZLIB = 1
+
+
+def encode_sensors(track, compress=True):
+    mask, columns = 0, []
+    for bit, name in enumerate(SENSOR_COLUMNS):
+        values = getattr(track, name)
+        if values is None:
+            continue
+        mask |= 1 << bit
+        out = np.clip(np.round(np.nan_to_num(values)), 0, SENSOR_MISSING - 1)
+        out[~np.isfinite(values)] = SENSOR_MISSING
+        columns.append(out.astype("<u2"))
+
+    body = np.concatenate(columns).tobytes() if columns else b""
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+    return SENSOR_HEADER.pack(SENSOR_MAGIC, flags, mask, len(track.lat)) + body
+
+
+def decode_sensors(blob):
+    """{name: float array or None} for SENSOR_COLUMNS."""
+    magic, flags, mask, n = SENSOR_HEADER.unpack_from(blob)
+    if magic != SENSOR_MAGIC:
+        raise ValueError("not an encoded sensor stream")
+
+    body = memoryview(blob)[SENSOR_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    present = [name for bit, name in enumerate(SENSOR_COLUMNS) if mask >> bit & 1]
+    raw = np.frombuffer(body, dtype="<u2", count=len(present) * n).reshape(-1, n)
+
+    streams = dict.fromkeys(SENSOR_COLUMNS)
+    for name, column in zip(present, raw):
+        values = column.astype(np.float64)
+        values[column == SENSOR_MISSING] = np.nan
+        streams[name] = values
+    return streams
+
+
+# ==========================================================
+# STORAGE
+# ==========================================================
+def save_sensors(conn, user_id, workout_id, track):
+    """Store a workout's sensor streams and summary (no commit)."""
+    if not has_sensors(track):
+        conn.execute("DELETE FROM workout_sensors WHERE workout_id=?", (workout_id,))
+        return None
+
+    summary = sensor_summary(track)
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO workout_sensors
+        (workout_id, user_id, n_points, data, hr_seconds,
+         avg_hr, max_hr, avg_cadence, avg_power, np_power, drift_pct)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        (workout_id, user_id, len(track.lat), encode_sensors(track),
+         zlib.compress(summary.hr_seconds.astype("<f4").tobytes()),
+         *(_sql(v) for v in summary[:6]))
+    )
+    return summary
+
+
+def _sql(value):
+    return value if np.isfinite(value) else None
+
+
+def load_sensors(conn, workout_id):
+    row = conn.execute(
+        "SELECT data FROM workout_sensors WHERE workout_id=?", (workout_id,)
+    ).fetchone()
+    return decode_sensors(row[0]) if row else dict.fromkeys(SENSOR_COLUMNS)
+
+
+def user_max_hr(conn, user_id):
+    row = conn.execute(
+        "SELECT MAX(max_hr) FROM workout_sensors WHERE user_id=?", (user_id,)
+    ).fetchone()
+    return row[0] or DEFAULT_MAX_HR
+
+
+# ==========================================================
+# SEASON ZONES
+# Per-workout bpm histograms are stacked into one 2D array and
+# mapped to zones with a single matrix product, so a season is
+# summed without touching individual samples.
+# ==========================================================
+def season_zone_seconds(conn, user_id, start_day=None, end_day=None, max_hr=None):
+    """(week_start_days, seconds[weeks, zones]) for the user's workouts.
+
+    Days are epoch days (workouts.day); weeks start on Monday.
+    """
+    sql = """
+        SELECT w.day, s.hr_seconds
+        FROM workout_sensors s
+        JOIN workouts w ON w.id = s.workout_id
+        WHERE s.user_id=? AND w.day IS NOT NULL AND s.avg_hr IS NOT NULL
+    """
+    params = [user_id]
+    if start_day is not None:
+        sql += " AND w.day >= ?"
+        params.append(start_day)
+    if end_day is not None:
+        sql += " AND w.day <= ?"
+        params.append(end_day)
+
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.zeros((0, len(HR_ZONES)), dtype=np.float32)
+
+    days = np.array([r[0] for r in rows], dtype=np.int64)
+    hist = np.frombuffer(
+        b"".join(zlib.decompress(r[1]) for r in rows), dtype="<f4"
+    ).reshape(len(rows), HR_BINS)
+
+    per_workout = time_in_zones(hist, max_hr or user_max_hr(conn, user_id))
+
+    # Epoch day 0 was a Thursday
+    weeks, inverse = np.unique((days + 3) // 7, return_inverse=True)
+    seconds = np.zeros((len(weeks), len(HR_ZONES)), dtype=np.float32)
+    np.add.at(seconds, inverse, per_workout)
+    return weeks * 7 - 3, seconds
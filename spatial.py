@@ -0,0 +1,81 @@
+import math
+
+import numpy as np
+
+from track_store import load_track
+from utils import EARTH_RADIUS_KM, haversine_pairs_km
+
+
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Widest search nearest_workouts will expand to
+NEAREST_MAX_RADIUS_KM = 200
+
+
+# ==========================================================
+# BOUNDING BOX QUERIES (R*Tree over per-workout bounds)
+# The index holds one box per workout, so queries cost
+# log(workouts), independent of how many points are stored.
+# ==========================================================
+def workouts_in_bbox(conn, user_id, south, west, north, east, limit=None):
+    """The user's workouts whose route bounds intersect the box, newest first."""
+    sql = """
+        SELECT w.id, w.title, w.sport, w.date, w.distance_km
+        FROM workout_rtree r
+        JOIN workouts w ON w.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ?
+          AND r.max_lon >= ? AND r.min_lon <= ?
+          AND r.user_id = ?
+        ORDER BY w.ts DESC
+    """
+    params = [south, north, west, east, user_id]
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def radius_bbox(lat, lon, radius_km):
+    """(south, west, north, east) of a box enclosing the circle."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return lat - dlat, lon - min(dlon, 180), lat + dlat, lon + min(dlon, 180)
+
+
+def _closest_km(conn, workout_id, lat, lon):
+    track = load_track(conn, workout_id)
+    if not len(track.lat):
+        return math.inf
+    d = haversine_pairs_km(lat, lon, track.lat, track.lon)
+    return float(np.nanmin(d))
+
+
+# ==========================================================
+# RADIUS / NEAREST
+# The index prunes to candidates whose box reaches the circle;
+# only those tracks are loaded for an exact vectorized check.
+# ==========================================================
+def workouts_near(conn, user_id, lat, lon, radius_km, _closest=None):
+    """[(workout row, closest approach km)] for routes passing within radius_km."""
+    closest = {} if _closest is None else _closest
+    hits = []
+    for row in workouts_in_bbox(conn, user_id, *radius_bbox(lat, lon, radius_km)):
+        if row["id"] not in closest:
+            closest[row["id"]] = _closest_km(conn, row["id"], lat, lon)
+        if closest[row["id"]] <= radius_km:
+            hits.append((row, closest[row["id"]]))
+
+    hits.sort(key=lambda hit: hit[1])
+    return hits
+
+
+def nearest_workouts(conn, user_id, lat, lon, k=5, start_km=0.5,
+                     max_km=NEAREST_MAX_RADIUS_KM):
+    """The k routes passing closest to (lat, lon), by doubling search radius."""
+    radius = start_km
+    closest = {}  # exact distances survive each widening
+    while True:
+        hits = workouts_near(conn, user_id, lat, lon, radius, closest)
+        if len(hits) >= k or radius >= max_km:
+            return hits[:k]
+        radius *= 2
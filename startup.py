@@ -0,0 +1,97 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from sections import SECTIONS
+
+
+# What a logged-out rerun of app.py imports before show_auth()
+LOGIN_MODULES = ("streamlit", "db", "sections", "sections.auth")
+
+
+# ==========================================================
+# IMPORT-TIME BENCHMARK
+# Each run is a fresh interpreter under `python -X importtime`,
+# so nothing is already in sys.modules. Its stderr has one line
+# per module: "import time: self | cumulative | name", nested
+# imports indented under their parent. Summing the cumulative
+# column of top-level entries (minus the interpreter's own
+# startup imports) gives the cost of the import statement.
+# ==========================================================
+def _run_importtime(modules):
+    code = "; ".join(f"import {m}" for m in modules) or "pass"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    top = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Skip the header and anything indented under another import
+        if not cumulative.strip().isdigit() or name[1:2] == " ":
+            continue
+        top[name.strip()] = int(cumulative)
+    return top
+
+
+def import_cost(modules, runs=5):
+    """(median total µs, {top-level module: median µs}) over fresh runs."""
+    startup = set(_run_importtime(()))
+    samples = []
+    for _ in range(runs):
+        top = _run_importtime(modules)
+        samples.append({k: v for k, v in top.items() if k not in startup})
+
+    names = set().union(*samples)
+    per_module = {k: statistics.median(s.get(k, 0) for s in samples) for k in names}
+    total = statistics.median(sum(s.values()) for s in samples)
+    return total, per_module
+
+
+def eager_modules():
+    # Every page module, as app.py imported them before the registry
+    return LOGIN_MODULES + tuple(module for module, _ in SECTIONS.values())
+
+
+# ==========================================================
+# CLI
+#   python startup.py importtime [--runs N] [--top N]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="App startup measurements")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("importtime", help="login page vs all-pages import cost")
+    bench.add_argument("--runs", type=int, default=5, help="fresh interpreters per case")
+    bench.add_argument("--top", type=int, default=8, help="heaviest imports to list")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for label, modules in (("login page", LOGIN_MODULES), ("all pages", eager_modules())):
+        try:
+            results[label] = import_cost(modules, args.runs)
+        except RuntimeError as e:
+            print(f"{label}: import failed: {e}", file=sys.stderr)
+            return 1
+
+    for label, (total, per_module) in results.items():
+        print(f"{label}: {total / 1000:.0f} ms")
+        heaviest = sorted(per_module.items(), key=lambda kv: -kv[1])[:args.top]
+        for name, us in heaviest:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+
+    login, eager = results["login page"][0], results["all pages"][0]
+    print(f"login page imports {eager / max(login, 1):.1f}x less than loading every page "
+          f"({(eager - login) / 1000:.0f} ms saved per cold start)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
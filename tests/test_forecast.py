@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from forecast import (
+    FORECAST_WEEKS, MIN_WEEKS, backtest_mae, fit_holt, forecast_weekly, week_start,
+    weekly_matrix,
+)
+from insights import trend_add, trend_fit, trend_line, trend_predict
+
+
+MONDAY = 19_723  # 2024-01-01
+
+
+def linear(weeks, intercept=10.0, slope=2.0, noise=0.0, seed=0):
+    y = intercept + slope * np.arange(weeks)
+    if noise:
+        y = y + np.random.default_rng(seed).normal(0, noise, weeks)
+    return y[None, :]
+
+
+# ==========================================================
+# WEEKLY SERIES
+# ==========================================================
+def test_week_start_is_monday():
+    assert week_start(MONDAY) == MONDAY
+    assert week_start(MONDAY + 6) == MONDAY
+    assert week_start(MONDAY + 7) == MONDAY + 7
+    assert week_start(MONDAY - 1) == MONDAY - 7
+
+
+def test_weekly_matrix_sums_full_weeks_only():
+    series = [0, 0, 0, 1, 1]
+    days = [MONDAY, MONDAY + 3, MONDAY + 14, MONDAY + 7, MONDAY + 22]
+    values = [1.0, 2.0, 4.0, 8.0, 16.0]
+
+    # MONDAY + 22 falls in the end day's week, which is still running
+    weeks, Y = weekly_matrix(series, days, values, 2, MONDAY + 23)
+
+    np.testing.assert_array_equal(weeks, [MONDAY, MONDAY + 7, MONDAY + 14])
+    np.testing.assert_array_equal(Y, [[3.0, 0.0, 4.0], [np.nan, 8.0, 0.0]])
+
+
+# ==========================================================
+# HOLT FORECAST
+# ==========================================================
+def test_forecast_reproduces_a_linear_trend():
+    forecast, lower, upper, alpha, beta, fitted = fit_holt(linear(30))
+
+    assert forecast.shape == (1, FORECAST_WEEKS)
+    np.testing.assert_allclose(np.diff(forecast[0]), 2.0, atol=1e-3)
+    np.testing.assert_allclose(forecast[0], 10 + 2 * np.arange(30, 30 + FORECAST_WEEKS), atol=1e-3)
+    assert 0 < beta[0] <= alpha[0]
+
+
+def test_forecast_follows_a_noisy_linear_trend():
+    forecast = fit_holt(linear(40, noise=0.3))[0][0]
+    slope = np.polyfit(np.arange(FORECAST_WEEKS), forecast, 1)[0]
+    assert slope == pytest.approx(2.0, abs=0.25)
+    np.testing.assert_allclose(forecast, 10 + 2 * np.arange(40, 40 + FORECAST_WEEKS), atol=2.0)
+
+
+def test_intervals_widen_with_horizon():
+    forecast, lower, upper = fit_holt(linear(40, noise=1.0))[:3]
+
+    width = (upper - lower)[0]
+    assert (np.diff(width) > 0).all()
+    assert (lower <= forecast).all() and (forecast <= upper).all()
+
+
+def test_forecast_never_negative():
+    forecast, lower = fit_holt(linear(20, intercept=40.0, slope=-2.0, noise=0.5))[:2]
+    assert (forecast >= 0).all() and (lower >= 0).all()
+
+
+def test_series_are_fitted_independently():
+    Y = np.vstack([linear(30), linear(30, intercept=50.0, slope=-1.0)])
+    forecast = fit_holt(Y)[0]
+    np.testing.assert_allclose(np.diff(forecast, axis=1), [[2.0] * 4, [-1.0] * 4], atol=1e-3)
+
+
+def test_too_little_history_gives_no_forecast():
+    Y = np.vstack([linear(MIN_WEEKS + 5), linear(MIN_WEEKS + 5)])
+    Y[1, :-(MIN_WEEKS - 1)] = np.nan  # second series started later
+
+    forecast, lower, upper = fit_holt(Y)[:3]
+    assert np.isfinite(forecast[0]).all()
+    for out in (forecast, lower, upper):
+        assert np.isnan(out[1]).all()
+
+    assert np.isnan(fit_holt(linear(MIN_WEEKS - 1))[0]).all()
+
+
+# ==========================================================
+# BACKTEST
+# ==========================================================
+def test_backtest_error_of_a_linear_series_is_small():
+    mae = backtest_mae(linear(30))
+    assert mae[0] == pytest.approx(0.0, abs=0.01)
+
+
+def test_backtest_shorter_than_the_window():
+    # Not even one week to fit before the held-out horizon
+    assert np.isnan(backtest_mae(linear(FORECAST_WEEKS))).all()
+    # Some weeks left to fit, but fewer than MIN_WEEKS
+    assert np.isnan(backtest_mae(linear(FORECAST_WEEKS + MIN_WEEKS - 1))).all()
+    assert np.isfinite(backtest_mae(linear(FORECAST_WEEKS + MIN_WEEKS))).all()
+
+
+def test_forecast_weekly_from_workouts():
+    # One workout a week, growing 2 km a week, for two users
+    weeks = 30
+    days = MONDAY + 7 * np.arange(weeks)
+    series = np.repeat([0, 1], weeks)
+    values = np.concatenate([10 + 2.0 * np.arange(weeks), np.full(weeks, 5.0)])
+
+    f = forecast_weekly(series, np.tile(days + 2, 2), values, 2, int(days[-1]) + 7)
+
+    assert f.history.shape == (2, weeks)
+    np.testing.assert_allclose(np.diff(f.forecast[0]), 2.0, atol=1e-3)
+    np.testing.assert_allclose(f.forecast[1], 5.0, atol=1e-6)
+    assert np.isfinite(f.backtest_mae).all()
+
+
+def test_forecast_weekly_without_workouts():
+    f = forecast_weekly([], [], [], 1, MONDAY)
+    assert np.isnan(f.history).all()
+    assert np.isnan(f.forecast).all()
+    assert np.isnan(f.backtest_mae).all()
+
+
+# ==========================================================
+# ONLINE TREND
+# ==========================================================
+@pytest.mark.parametrize("half_life", [0, 28])
+def test_trend_add_recovers_a_linear_series(half_life):
+    days = MONDAY + np.arange(0, 60, 3)
+    y = 5.0 + 0.25 * (days - days[0])
+
+    state = None
+    for day, value in zip(days, y):
+        state = trend_add(state, int(day), float(value), half_life)
+
+    slope, intercept = trend_line(state)
+    assert slope == pytest.approx(0.25)
+    assert intercept == pytest.approx(5.0)
+    assert trend_predict(state, [days[-1] + 10])[0] == pytest.approx(y[-1] + 2.5)
+
+
+@pytest.mark.parametrize("half_life", [0, 28])
+def test_trend_add_matches_batch_fit_in_any_order(half_life):
+    rng = np.random.default_rng(3)
+    days = MONDAY + rng.integers(0, 120, 40)
+    y = rng.normal(10, 3, 40)
+
+    state = None
+    for day, value in zip(days, y):
+        state = trend_add(state, int(day), float(value), half_life)
+
+    # Sums are kept relative to the first day added, not the earliest,
+    # so compare the fitted lines rather than the raw sums
+    batch = trend_fit(days, y, half_life)
+    np.testing.assert_allclose(trend_line(state)[0], trend_line(batch)[0], rtol=1e-9)
+    np.testing.assert_allclose(
+        trend_predict(state, [MONDAY + 200]), trend_predict(batch, [MONDAY + 200]), rtol=1e-9
+    )
+
+
+def test_trend_short_series_is_flat():
+    assert trend_line(None) is None
+
+    one = trend_add(None, MONDAY, 7.0)
+    assert trend_line(one) == (0.0, 7.0)
+
+    # Several values but all on one day: no slope to fit
+    same_day = trend_add(trend_add(one, MONDAY, 9.0), MONDAY, 11.0)
+    assert trend_line(same_day) == (0.0, pytest.approx(9.0))
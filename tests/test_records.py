@@ -0,0 +1,92 @@
+import numpy as np
+import pytest
+
+from records import best_efforts
+from track_reader import Track
+from utils import EARTH_RADIUS_KM
+
+
+def northbound(steps_m, dt_s, lat0=0.0, t0=1.7e9):
+    """Track due north along a meridian: steps_m metres per hop, dt_s seconds per hop."""
+    steps_m = np.asarray(steps_m, dtype=np.float64)
+    dt_s = np.broadcast_to(np.asarray(dt_s, dtype=np.float64), steps_m.shape)
+    lat = lat0 + np.degrees(np.concatenate(([0.0], np.cumsum(steps_m))) / 1000 / EARTH_RADIUS_KM)
+    time = t0 + np.concatenate(([0.0], np.cumsum(dt_s)))
+    n = len(lat)
+    return Track(lat, np.zeros(n), np.full(n, np.nan), time, np.zeros(n, dtype=np.int32),
+                 distance_km=float(steps_m.sum()) / 1000)
+
+
+@pytest.mark.parametrize("lat0", [0.0, 47.3, -33.9])
+@pytest.mark.parametrize("hops", [1, 3, 7, 40])
+def test_window_of_exactly_the_target_distance(lat0, hops):
+    # 400 m in equal hops, so the only 400 m window is the whole track
+    efforts = best_efforts(northbound(np.full(hops, 400 / hops), 2.0, lat0))
+
+    kind, target, seconds, i, j, start_ts = efforts["400 m"]
+    assert (kind, target) == ("distance", 0.4)
+    assert seconds == pytest.approx(2.0 * hops)
+    assert (i, j) == (0, hops)
+    assert start_ts == 1.7e9
+    assert "1 km" not in efforts
+
+
+def test_exact_boundary_inside_longer_track():
+    # 100 m hops: the 1 km window spans exactly ten of them
+    efforts = best_efforts(northbound(np.full(25, 100.0), [30.0] * 12 + [20.0] * 13))
+
+    _, _, seconds, i, j, _ = efforts["1 km"]
+    assert seconds == pytest.approx(200.0)
+    assert j - i == 10
+    assert i >= 12
+
+
+def test_track_shorter_than_every_target():
+    efforts = best_efforts(northbound(np.full(30, 10.0), 5.0))  # 300 m in 150 s
+    assert efforts == {}
+
+
+def test_track_shorter_than_some_targets():
+    efforts = best_efforts(northbound(np.full(60, 100.0), 20.0))  # 6 km in 20 min
+
+    assert {"400 m", "1 km", "5 km", "5 min", "20 min"} <= set(efforts)
+    assert not {"10 km", "Half Marathon", "Marathon", "60 min"} & set(efforts)
+    assert efforts["20 min"][2] == pytest.approx(6.0)
+
+
+def test_too_few_timed_points():
+    track = northbound(np.full(10, 100.0), 20.0)
+    assert best_efforts(track._replace(time=np.full(11, np.nan))) == {}
+    assert best_efforts(northbound([], 1.0)) == {}
+
+
+def test_pause_inside_the_only_window_counts_as_elapsed():
+    # 600 m, a 10 minute stop without moving, then 600 m more; the
+    # only 1 km window spans the stop
+    steps = np.concatenate((np.full(6, 100.0), [0.0], np.full(6, 100.0)))
+    dt = np.concatenate((np.full(6, 20.0), [600.0], np.full(6, 20.0)))
+    efforts = best_efforts(northbound(steps, dt))
+
+    assert efforts["1 km"][2] == pytest.approx(10 * 20.0 + 600.0)
+    assert efforts["400 m"][2] == pytest.approx(80.0)
+    # No 5 minutes of moving, so the best 5 min includes part of the stop
+    assert efforts["5 min"][2] == pytest.approx(0.6)
+
+
+def test_best_window_avoids_a_pause():
+    # Steady 5 m/s with a 10 minute stop after the first 500 m
+    steps = np.concatenate((np.full(5, 100.0), [0.0], np.full(15, 100.0)))
+    dt = np.concatenate((np.full(5, 20.0), [600.0], np.full(15, 20.0)))
+    efforts = best_efforts(northbound(steps, dt))
+
+    _, _, seconds, i, j, _ = efforts["1 km"]
+    assert seconds == pytest.approx(200.0)
+    assert i >= 6  # starts after the stop
+    assert efforts["5 min"][2] == pytest.approx(1.5)
+
+
+def test_clock_stepping_backwards_never_gives_negative_times():
+    dt = np.full(20, 20.0)
+    dt[10] = -100.0
+    efforts = best_efforts(northbound(np.full(20, 100.0), dt))
+    assert all(value > 0 for _, _, value, _, _, _ in efforts.values())
@@ -0,0 +1,177 @@
+import numpy as np
+import pytest
+
+from track_reader import Track
+from track_store import decode_track, encode_track
+from utils import geohash_encode, rdp_importance, segment_distances_km, simplify_track
+
+
+def make_track(lat, lon, ele=None, time=None, segment=None):
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = len(lat)
+    ele = np.full(n, np.nan) if ele is None else np.asarray(ele, dtype=np.float64)
+    time = np.full(n, np.nan) if time is None else np.asarray(time, dtype=np.float64)
+    segment = np.zeros(n, dtype=np.int32) if segment is None else np.asarray(segment)
+    return Track(lat, lon, ele, time, segment,
+                 distance_km=float(segment_distances_km(lat, lon, segment).sum()))
+
+
+def assert_round_trip(track, compress):
+    out = decode_track(encode_track(track, compress))
+
+    assert len(out.lat) == len(track.lat)
+    np.testing.assert_allclose(out.lat, track.lat, rtol=0, atol=1e-7)
+    np.testing.assert_allclose(out.lon, track.lon, rtol=0, atol=1e-7)
+    # assert_allclose treats NaN == NaN, so missing values must stay missing
+    np.testing.assert_allclose(out.ele, track.ele, rtol=0, atol=0.05)
+    np.testing.assert_allclose(out.time, track.time, rtol=0, atol=0.05)
+    np.testing.assert_array_equal(out.segment, track.segment)
+    assert out.distance_km == pytest.approx(track.distance_km, abs=1e-3)
+    return out
+
+
+# ==========================================================
+# ENCODED TRACK BLOB
+# ==========================================================
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_empty(compress):
+    out = assert_round_trip(make_track([], []), compress)
+    assert out.distance_km == 0
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_single_point(compress):
+    assert_round_trip(make_track([47.3769], [8.5417], [408.2], [1.7e9]), compress)
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_multi_segment(compress):
+    rng = np.random.default_rng(0)
+    n = 500
+    track = make_track(
+        47 + np.cumsum(rng.normal(0, 1e-4, n)),
+        8 + np.cumsum(rng.normal(0, 1e-4, n)),
+        ele=400 + np.cumsum(rng.normal(0, 0.5, n)),
+        time=1.7e9 + np.cumsum(rng.uniform(0.5, 3, n)),
+        segment=np.repeat([0, 1, 2], [200, 150, 150]),
+    )
+    out = assert_round_trip(track, compress)
+
+    # No distance is counted across a segment break
+    assert out.distance_km < float(segment_distances_km(out.lat, out.lon).sum())
+
+
+@pytest.mark.parametrize("compress", [True, False])
+def test_round_trip_missing_elevation_and_time(compress):
+    ele = np.array([400.0, np.nan, np.nan, 402.5, np.nan])
+    time = np.array([1.7e9, 1.7e9 + 1, np.nan, 1.7e9 + 3, 1.7e9 + 4])
+    out = assert_round_trip(
+        make_track([47.0, 47.0001, 47.0002, 47.0003, 47.0004], [8.0] * 5, ele, time),
+        compress
+    )
+
+    np.testing.assert_array_equal(np.isnan(out.ele), np.isnan(ele))
+    np.testing.assert_array_equal(np.isnan(out.time), np.isnan(time))
+
+
+def test_round_trip_all_missing_time():
+    out = assert_round_trip(make_track([47.0, 47.001], [8.0, 8.001]), True)
+    assert np.isnan(out.time).all()
+
+
+def test_round_trip_across_antimeridian():
+    # Fixed-point lon jumps by ~3.6e9, which only fits int32 deltas
+    # through wrapping arithmetic
+    assert_round_trip(make_track([-17.0, -17.0, -17.0], [179.9999, -179.9999, 179.9999]), True)
+
+
+def test_decode_rejects_other_blobs():
+    blob = bytearray(encode_track(make_track([47.0], [8.0])))
+    blob[:4] = b"XXXX"
+    with pytest.raises(ValueError):
+        decode_track(bytes(blob))
+
+
+# ==========================================================
+# RDP SIMPLIFICATION
+# ==========================================================
+def peak_line(height_m, n=21):
+    # Due east along the equator, rising in a straight line to a peak
+    # height_m north at the middle point and straight back down
+    lon = np.linspace(0, 0.01, n)
+    lat = height_m / 111_195 * (1 - np.abs(np.linspace(-1, 1, n)))
+    return lat, lon
+
+
+def test_rdp_endpoints_always_kept():
+    lat, lon = peak_line(10)
+    importance = rdp_importance(lat, lon)
+    assert np.isinf(importance[[0, -1]]).all()
+    np.testing.assert_array_equal(simplify_track(lat, lon, 1e9), [0, len(lat) - 1])
+
+
+def test_rdp_short_tracks():
+    assert np.isinf(rdp_importance([47.0], [8.0])).all()
+    assert np.isinf(rdp_importance([47.0, 47.1], [8.0, 8.1])).all()
+    assert len(simplify_track(np.array([]), np.array([]), 5)) == 0
+
+
+def test_rdp_tolerance_keeps_deviations_above_it():
+    lat, lon = peak_line(10)
+    importance = rdp_importance(lat, lon)
+    assert importance[10] == pytest.approx(10, rel=1e-3)
+
+    np.testing.assert_array_equal(simplify_track(lat, lon, 5), [0, 10, 20])
+    np.testing.assert_array_equal(simplify_track(lat, lon, 15), [0, 20])
+
+
+def test_rdp_collinear_points_dropped():
+    lat, lon = peak_line(0)
+    np.testing.assert_allclose(rdp_importance(lat, lon)[1:-1], 0, atol=1e-6)
+    np.testing.assert_array_equal(simplify_track(lat, lon, 0.01), [0, 20])
+
+
+def test_rdp_tolerances_nest():
+    rng = np.random.default_rng(1)
+    lat = 47 + np.cumsum(rng.normal(0, 1e-4, 400))
+    lon = 8 + np.cumsum(rng.normal(0, 1e-4, 400))
+    importance = rdp_importance(lat, lon)
+
+    previous = None
+    for tolerance in (0, 1, 5, 20, 100):
+        keep = set(simplify_track(lat, lon, tolerance, importance=importance).tolist())
+        assert {0, len(lat) - 1} <= keep
+        if previous is not None:
+            assert keep <= previous
+        previous = keep
+
+
+def test_rdp_max_points_keeps_most_important():
+    rng = np.random.default_rng(2)
+    lat = 47 + np.cumsum(rng.normal(0, 1e-4, 300))
+    lon = 8 + np.cumsum(rng.normal(0, 1e-4, 300))
+    importance = rdp_importance(lat, lon)
+
+    keep = simplify_track(lat, lon, max_points=50, importance=importance)
+    assert len(keep) == 50
+    assert (np.diff(keep) > 0).all()
+    dropped = np.setdiff1d(np.arange(len(lat)), keep)
+    assert importance[keep].min() >= importance[dropped].max()
+
+
+# ==========================================================
+# GEOHASH
+# ==========================================================
+def test_geohash_known_cells():
+    np.testing.assert_array_equal(
+        geohash_encode([57.64911, -25.382708], [10.40744, -49.265506]),
+        ["u4pruyd", "6gkzwgj"]
+    )
+
+
+def test_geohash_precision_and_clamping():
+    assert geohash_encode([42.6], [-5.6], precision=5).tolist() == ["ezs42"]
+    # The +90 / +180 edges stay inside the last cell
+    assert geohash_encode([90.0], [180.0]).tolist() == ["zzzzzzz"]
+    assert geohash_encode([-90.0], [-180.0]).tolist() == ["0000000"]
@@ -0,0 +1,368 @@
+import argparse
+import math
+import sys
+import time as timer
+from concurrent.futures import as_completed
+
+import numpy as np
+
+from track_reader import Track
+from utils import EARTH_RADIUS_KM, haversine_pairs_km, segment_distances_km
+
+
+# Bump when cleaning changes so the batch job re-cleans history
+CLEAN_VERSION = 1
+
+# Fastest plausible speed per sport (m/s); anything quicker is a GPS jump
+MAX_SPEED_MS = {
+    "Running": 12.5,
+    "Trail": 10.0,
+    "Walking": 4.0,
+    "Hiking": 4.5,
+    "Cycling": 30.0,
+}
+DEFAULT_MAX_SPEED_MS = 15.0
+
+# Longest run of fixes a single GPS jump may last
+MAX_EXCURSION = 10
+
+# Fixes that get no further than this over STOP_WINDOW_S are a stop
+STATIONARY_RADIUS_M = 12
+STOP_WINDOW_S = 20
+
+# Kalman smoother: GPS noise and how hard speed may change
+GPS_SIGMA_M = 5.0
+ACCEL_NOISE = 0.5          # m/s^2
+KALMAN_RESET_S = 60        # gaps longer than this restart the filter
+
+# Workouts handed to one batch worker task
+RECLEAN_CHUNK = 50
+
+M_PER_DEG = math.pi * EARTH_RADIUS_KM * 1000 / 180
+
+
+# ==========================================================
+# OUTLIER REJECTION
+# A GPS jump is a hop at impossible speed. When another fast
+# hop follows within a few fixes and lands somewhere reachable
+# from before the first one, the fixes between were a detour
+# that never happened and are dropped.
+# ==========================================================
+def _plausible(lat, lon, time, i, j, max_speed_ms):
+    dt = time[j] - time[i]
+    d_m = haversine_pairs_km(lat[i], lon[i], lat[j], lon[j]) * 1000
+    return np.isfinite(dt) and dt > 0 and d_m / dt <= max_speed_ms
+
+
+def speed_outliers(lat, lon, time, segment, max_speed_ms, max_excursion=MAX_EXCURSION):
+    """Boolean mask of points to keep."""
+    n = len(lat)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+
+    d_m = haversine_pairs_km(lat[:-1], lon[:-1], lat[1:], lon[1:]) * 1000
+    dt = np.diff(time)
+    timed = np.isfinite(dt) & (dt > 0)
+    speed = np.divide(d_m, dt, out=np.zeros_like(d_m), where=timed)
+    jumps = np.flatnonzero((segment[1:] == segment[:-1]) & timed & (speed > max_speed_ms))
+
+    # Only the few jump hops are walked in Python
+    k = 0
+    while k < len(jumps):
+        a = jumps[k]
+        back = None
+        for m in range(k + 1, len(jumps)):
+            b = jumps[m]
+            if b - a > max_excursion:
+                break
+            if _plausible(lat, lon, time, a, b + 1, max_speed_ms):
+                back = m
+                break
+
+        if back is not None:
+            keep[a + 1:jumps[back] + 1] = False
+            k = back + 1
+            continue
+
+        # Unpaired jump near either end: the short end piece is the glitch
+        if a < max_excursion:
+            keep[:a + 1] = False
+        elif a >= n - 1 - max_excursion:
+            keep[a + 1:] = False
+        k += 1
+
+    return keep
+
+
+# ==========================================================
+# STATIONARY CLUSTERS
+# Standing still, fixes wander a few metres every second, so
+# hop speeds look like movement. A stop is instead a stretch
+# where the net displacement over STOP_WINDOW_S stays inside
+# the radius; its fixes are moved onto their centroid.
+# ==========================================================
+def collapse_stationary(lat, lon, time, segment, radius_m=STATIONARY_RADIUS_M,
+                        window_s=STOP_WINDOW_S):
+    """Copies of lat/lon with each stop's jitter moved onto its centroid."""
+    lat, lon = lat.copy(), lon.copy()
+    n = len(lat)
+    if n < 3 or not np.isfinite(time).all():
+        return lat, lon
+
+    t = np.maximum.accumulate(time)
+    ahead = np.minimum(np.searchsorted(t, t + window_s), n - 1)
+    moved = haversine_pairs_km(lat, lon, lat[ahead], lon[ahead]) * 1000
+    still = (
+        (t[ahead] - t >= window_s / 2)
+        & (segment[ahead] == segment)
+        & (moved < radius_m)
+    )
+
+    # Every fix inside a still window is stopped
+    cover = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(cover, np.flatnonzero(still), 1)
+    np.add.at(cover, ahead[still] + 1, -1)
+    stopped = np.cumsum(cover[:n]) > 0
+
+    edges = np.diff(np.concatenate(([0], stopped.view(np.int8), [0])))
+    starts, stops = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    if not len(starts):
+        return lat, lon
+
+    sizes = stops - starts
+    cluster = np.repeat(np.arange(len(starts)), sizes)
+    members = np.flatnonzero(stopped)
+
+    c_lat = np.bincount(cluster, lat[members]) / sizes
+    c_lon = np.bincount(cluster, lon[members]) / sizes
+
+    # A slow out-and-back returns to its start too; real stops stay
+    # tightly bunched around their centroid
+    spread = haversine_pairs_km(lat[members], lon[members], c_lat[cluster], c_lon[cluster]) * 1000
+    rms = np.sqrt(np.bincount(cluster, spread ** 2) / sizes)
+    ok = (rms <= radius_m / 2)[cluster]
+
+    lat[members[ok]] = c_lat[cluster[ok]]
+    lon[members[ok]] = c_lon[cluster[ok]]
+    return lat, lon
+
+
+# ==========================================================
+# KALMAN SMOOTHER
+# Constant-velocity model per axis in local metres, forward
+# filter plus Rauch-Tung-Striebel pass. Both axes share one
+# covariance, so the 2x2 algebra is done once per point.
+# Unlike the stages above this is a sequential per-point loop
+# (~0.4 s per 100k points): the gain depends on each step's dt
+# and resets, so it is opt-in (smooth=True) rather than default.
+# ==========================================================
+def kalman_smooth(lat, lon, time, segment):
+    n = len(lat)
+    if n < 3:
+        return lat.copy(), lon.copy()
+
+    lat0 = float(np.nanmean(lat))
+    kx = math.cos(math.radians(lat0)) * M_PER_DEG
+    zx, zy = lon * kx, lat * M_PER_DEG
+
+    dt = np.diff(time)
+    dt = np.where(np.isfinite(dt) & (dt > 0), dt, 1.0)
+    reset = np.concatenate(([True], (dt > KALMAN_RESET_S) | (segment[1:] != segment[:-1])))
+    dt = np.concatenate(([1.0], dt)).tolist()
+    reset = reset.tolist()
+    zx, zy = zx.tolist(), zy.tolist()
+
+    r = GPS_SIGMA_M ** 2
+    q = ACCEL_NOISE ** 2
+
+    # Filtered state (px, vx, py, vy), covariance (a, b, d) = [[a, b], [b, d]],
+    # and the predicted covariance each step was updated from
+    fx, fvx, fy, fvy = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+    fa, fb, fd = [0.0] * n, [0.0] * n, [0.0] * n
+    pa, pb, pd = [0.0] * n, [0.0] * n, [0.0] * n
+
+    for k in range(n):
+        h = dt[k]
+        if reset[k]:
+            px, vx, py, vy = zx[k], 0.0, zy[k], 0.0
+            a, b, d = r, 0.0, 100.0
+            fx[k], fvx[k], fy[k], fvy[k] = px, vx, py, vy
+            fa[k], fb[k], fd[k] = a, b, d
+            pa[k], pb[k], pd[k] = a, b, d
+            continue
+
+        # Predict
+        px, py = px + h * vx, py + h * vy
+        a, b, d = (a + 2 * h * b + h * h * d + q * h ** 3 / 3,
+                   b + h * d + q * h * h / 2,
+                   d + q * h)
+        pa[k], pb[k], pd[k] = a, b, d
+
+        # Update with the position fix
+        s = a + r
+        g0, g1 = a / s, b / s
+        ex, ey = zx[k] - px, zy[k] - py
+        px, vx = px + g0 * ex, vx + g1 * ex
+        py, vy = py + g0 * ey, vy + g1 * ey
+        a, b, d = (1 - g0) * a, (1 - g0) * b, d - g1 * b
+
+        fx[k], fvx[k], fy[k], fvy[k] = px, vx, py, vy
+        fa[k], fb[k], fd[k] = a, b, d
+
+    sx, sy = fx[:], fy[:]
+    svx, svy = fvx[:], fvy[:]
+    for k in range(n - 2, -1, -1):
+        if reset[k + 1]:
+            continue
+        h = dt[k + 1]
+        a, b, d = fa[k], fb[k], fd[k]
+        # C = P F^T Pp^-1 with F = [[1, h], [0, 1]]
+        m00, m01 = a + h * b, b
+        m10, m11 = b + h * d, d
+        qa, qb, qd = pa[k + 1], pb[k + 1], pd[k + 1]
+        det = qa * qd - qb * qb
+        if det <= 0:
+            continue
+        i00, i01, i11 = qd / det, -qb / det, qa / det
+        c00, c01 = m00 * i00 + m01 * i01, m00 * i01 + m01 * i11
+        c10, c11 = m10 * i00 + m11 * i01, m10 * i01 + m11 * i11
+
+        ex = sx[k + 1] - (fx[k] + h * fvx[k])
+        evx = svx[k + 1] - fvx[k]
+        ey = sy[k + 1] - (fy[k] + h * fvy[k])
+        evy = svy[k + 1] - fvy[k]
+        sx[k] = fx[k] + c00 * ex + c01 * evx
+        svx[k] = fvx[k] + c10 * ex + c11 * evx
+        sy[k] = fy[k] + c00 * ey + c01 * evy
+        svy[k] = fvy[k] + c10 * ey + c11 * evy
+
+    return np.array(sy) / M_PER_DEG, np.array(sx) / kx
+
+
+# ==========================================================
+# PIPELINE
+# ==========================================================
+def clean_track(track, sport=None, smooth=False):
+    """Track with spikes removed, stops collapsed and optionally smoothed."""
+    if len(track.lat) < 3:
+        return track
+
+    max_speed = MAX_SPEED_MS.get(sport, DEFAULT_MAX_SPEED_MS)
+    keep = speed_outliers(track.lat, track.lon, track.time, track.segment, max_speed)
+    lat, lon = track.lat[keep], track.lon[keep]
+    ele, time, segment = track.ele[keep], track.time[keep], track.segment[keep]
+
+    lat, lon = collapse_stationary(lat, lon, time, segment)
+    if smooth:
+        lat, lon = kalman_smooth(lat, lon, time, segment)
+
+    return Track(
+        lat, lon, ele, time, segment,
+        float(segment_distances_km(lat, lon, segment).sum()),
+        *(None if s is None else s[keep] for s in (track.hr, track.cadence, track.power))
+    )
+
+
+# ==========================================================
+# BATCH RE-CLEAN
+# Re-derives stored workout metrics from the raw point streams
+# for every workout cleaned by an older CLEAN_VERSION (or never).
+# Each chunk commits, so the job resumes where it stopped.
+# ==========================================================
+def _reclean_chunk(db_path, workouts):
+    import db
+    from track_store import load_track
+    from utils import track_metrics
+
+    db.DB_PATH = db_path
+    rows = []
+    with db.connection() as conn:
+        for workout_id, sport in workouts:
+            raw = load_track(conn, workout_id)
+            cleaned = clean_track(raw, sport)
+            metrics = track_metrics(cleaned.lat, cleaned.lon, cleaned.ele,
+                                    cleaned.time, cleaned.segment)
+            rows.append((round(metrics.distance_km, 2), round(metrics.ascent_m, 1),
+                         round(raw.distance_km, 2), CLEAN_VERSION, workout_id))
+    return rows
+
+
+def reclean_workouts(user_id=None, workers=None, force=False, progress=None):
+    import db
+
+    with db.connection() as conn:
+        sql = """
+            SELECT w.id, w.sport FROM workouts w
+            WHERE (EXISTS (SELECT 1 FROM workout_tracks t WHERE t.workout_id = w.id)
+                OR EXISTS (SELECT 1 FROM workout_points p WHERE p.workout_id = w.id))
+        """
+        params = []
+        if not force:
+            sql += " AND (w.clean_version IS NULL OR w.clean_version < ?)"
+            params.append(CLEAN_VERSION)
+        if user_id is not None:
+            sql += " AND w.user_id = ?"
+            params.append(user_id)
+        workouts = [tuple(r) for r in conn.execute(sql, params)]
+
+    chunks = [workouts[i:i + RECLEAN_CHUNK] for i in range(0, len(workouts), RECLEAN_CHUNK)]
+    with db.process_pool(workers) as pool:
+        futures = [pool.submit(_reclean_chunk, db.DB_PATH, chunk) for chunk in chunks]
+        for done, future in enumerate(as_completed(futures), 1):
+            with db.connection() as conn:
+                conn.executemany(
+                    """
+                    UPDATE workouts
+                    SET distance_km=?, ascent_m=?, raw_distance_km=?, clean_version=?
+                    WHERE id=?
+                    """,
+                    future.result()
+                )
+                conn.commit()
+            if progress:
+                progress(done, len(chunks))
+
+    return len(workouts)
+
+
+# ==========================================================
+# CLI
+#   python track_clean.py reclean [--user NAME] [--workers N] [--force]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="GPS track cleaning")
+    sub = parser.add_subparsers(dest="command", required=True)
+    reclean = sub.add_parser("reclean", help="re-clean stored workouts")
+    reclean.add_argument("--user", help="username (default: everyone)")
+    reclean.add_argument("--workers", type=int, default=None)
+    reclean.add_argument("--force", action="store_true",
+                         help="re-clean workouts already at the current version")
+    args = parser.parse_args(argv)
+
+    import db
+    from records import recompute_records
+
+    db.ensure_schema()
+    user_id = None
+    if args.user:
+        user = db.get_user(args.user)
+        if user is None:
+            print(f"No such user: {args.user}", file=sys.stderr)
+            return 1
+        user_id = user["id"]
+
+    start = timer.perf_counter()
+    n = reclean_workouts(user_id, args.workers, args.force,
+                         progress=lambda done, total: print(f"\r{done}/{total} chunks", end=""))
+    print(f"\nRe-cleaned {n} workouts in {timer.perf_counter() - start:.1f}s")
+
+    # Distances changed, so best efforts may have too
+    if n:
+        recompute_records(user_id, args.workers)
+        print("Personal records recomputed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
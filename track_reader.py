@@ -0,0 +1,417 @@
+import math
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import numpy as np
+
+from utils import segment_distances_km
+
+
+# Points buffered before a chunk of arrays is emitted. Parsing memory
+# stays at roughly this many points no matter how long the file is.
+CHUNK_SIZE = 4096
+
+
+class TrackChunk(NamedTuple):
+    lat: np.ndarray       # degrees, float64
+    lon: np.ndarray       # degrees, float64
+    ele: np.ndarray       # metres, NaN when missing
+    time: np.ndarray      # epoch seconds, NaN when missing
+    segment: np.ndarray   # int32 segment number, distance never spans two
+    hr: np.ndarray        # beats per minute, NaN when missing
+    cadence: np.ndarray   # steps or revolutions per minute, NaN when missing
+    power: np.ndarray     # watts, NaN when missing
+
+
+class Track(NamedTuple):
+    lat: np.ndarray
+    lon: np.ndarray
+    ele: np.ndarray
+    time: np.ndarray
+    segment: np.ndarray
+    distance_km: float
+    # Sensor streams, None when the file carries none
+    hr: np.ndarray = None
+    cadence: np.ndarray = None
+    power: np.ndarray = None
+
+
+# Sensor element names (namespace stripped) in GPX extensions,
+# e.g. Garmin TrackPointExtension <gpxtpx:hr>, and in TCX
+GPX_SENSOR_TAGS = {
+    "hr": "hr", "heartrate": "hr",
+    "cad": "cadence", "cadence": "cadence",
+    "power": "power", "PowerInWatts": "power", "Watts": "power",
+}
+
+
+# ==========================================================
+# HELPERS
+# ==========================================================
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _parse_time(text):
+    if not text:
+        return math.nan
+    try:
+        value = datetime.fromisoformat(text.strip())
+    except ValueError:
+        return math.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _parse_float(text):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+class _ChunkBuffer:
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.rows = []
+
+    def add(self, lat, lon, ele, time, segment,
+            hr=math.nan, cadence=math.nan, power=math.nan):
+        self.rows.append((lat, lon, ele, time, segment, hr, cadence, power))
+        return len(self.rows) >= self.chunk_size
+
+    def take(self):
+        rows, self.rows = self.rows, []
+        if not rows:
+            return None
+        lat, lon, ele, time, segment, hr, cadence, power = zip(*rows)
+        return TrackChunk(
+            np.array(lat, dtype=np.float64),
+            np.array(lon, dtype=np.float64),
+            np.array(ele, dtype=np.float64),
+            np.array(time, dtype=np.float64),
+            np.array(segment, dtype=np.int32),
+            np.array(hr, dtype=np.float64),
+            np.array(cadence, dtype=np.float64),
+            np.array(power, dtype=np.float64),
+        )
+
+
+def _sensor_values(elem):
+    # hr / cadence / power anywhere below a point's <extensions>
+    values = {}
+    for child in elem.iter():
+        key = GPX_SENSOR_TAGS.get(_local(child.tag))
+        if key and key not in values:
+            values[key] = _parse_float(child.text)
+    return values
+
+
+# ==========================================================
+# STREAMING GPX READER
+# ==========================================================
+def iter_gpx_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield TrackChunk arrays from a GPX path or binary file object.
+
+    Track segments (trkseg) and routes (rte) each get their own segment
+    number. Elements are cleared as soon as they are read, so no
+    document tree is ever built.
+    """
+    buffer = _ChunkBuffer(chunk_size)
+    segment = -1
+    container = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _local(elem.tag)
+
+        if event == "start":
+            if tag in ("trkseg", "rte"):
+                segment += 1
+                container = elem
+            continue
+
+        if tag in ("trkpt", "rtept"):
+            ele = time = None
+            sensors = {}
+            for child in elem:
+                name = _local(child.tag)
+                if name == "ele":
+                    ele = child.text
+                elif name == "time":
+                    time = child.text
+                elif name == "extensions":
+                    sensors = _sensor_values(child)
+
+            lat = _parse_float(elem.get("lat"))
+            lon = _parse_float(elem.get("lon"))
+            full = False
+            if math.isfinite(lat) and math.isfinite(lon):
+                full = buffer.add(lat, lon, _parse_float(ele),
+                                  _parse_time(time), max(segment, 0), **sensors)
+
+            # Drop the finished point from its parent as well
+            if container is not None:
+                container.clear()
+            else:
+                elem.clear()
+
+            if full:
+                yield buffer.take()
+
+        elif tag in ("trkseg", "rte", "wpt", "metadata"):
+            elem.clear()
+
+    chunk = buffer.take()
+    if chunk is not None:
+        yield chunk
+
+
+def _iter_gpxpy_chunks(source, chunk_size=CHUNK_SIZE):
+    # Fallback for files the strict XML parser rejects
+    import gpxpy
+
+    if hasattr(source, "read"):
+        gpx = gpxpy.parse(source)
+    else:
+        with open(source, encoding="utf-8", errors="replace") as f:
+            gpx = gpxpy.parse(f)
+
+    buffer = _ChunkBuffer(chunk_size)
+    segments = [s for t in gpx.tracks for s in t.segments]
+    segments += [r for r in gpx.routes]
+
+    for number, seg in enumerate(segments):
+        for p in getattr(seg, "points", []):
+            time = p.time.timestamp() if getattr(p, "time", None) else math.nan
+            ele = p.elevation if p.elevation is not None else math.nan
+            sensors = {}
+            for ext in getattr(p, "extensions", None) or []:
+                sensors.update(_sensor_values(ext))
+            if buffer.add(p.latitude, p.longitude, ele, time, number, **sensors):
+                yield buffer.take()
+
+    chunk = buffer.take()
+    if chunk is not None:
+        yield chunk
+
+
+def iter_track_chunks(source, chunk_size=CHUNK_SIZE):
+    """Stream a GPX file, falling back to gpxpy if it is not well-formed XML."""
+    emitted = False
+    try:
+        for chunk in iter_gpx_chunks(source, chunk_size):
+            emitted = True
+            yield chunk
+        return
+    except ET.ParseError:
+        # Points already handed out cannot be taken back
+        if emitted:
+            raise
+
+    if hasattr(source, "seek"):
+        source.seek(0)
+    yield from _iter_gpxpy_chunks(source, chunk_size)
+
+
+# ==========================================================
+# TCX / FIT READERS
+# ==========================================================
+def iter_tcx_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield TrackChunk arrays from a Garmin TCX file; each <Track> is a segment."""
+    buffer = _ChunkBuffer(chunk_size)
+    segment = -1
+    container = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        tag = _local(elem.tag)
+
+        if event == "start":
+            if tag == "Track":
+                segment += 1
+                container = elem
+            continue
+
+        if tag == "Trackpoint":
+            lat = lon = ele = time = hr = cadence = power = None
+            in_hr = False
+            for child in elem.iter():
+                name = _local(child.tag)
+                if name == "LatitudeDegrees":
+                    lat = child.text
+                elif name == "LongitudeDegrees":
+                    lon = child.text
+                elif name == "AltitudeMeters":
+                    ele = child.text
+                elif name == "Time":
+                    time = child.text
+                elif name == "HeartRateBpm":
+                    in_hr = True
+                elif name == "Value" and in_hr:
+                    hr, in_hr = child.text, False
+                elif name in ("Cadence", "RunCadence"):
+                    cadence = child.text
+                elif name == "Watts":
+                    power = child.text
+
+            lat, lon = _parse_float(lat), _parse_float(lon)
+            full = False
+            if math.isfinite(lat) and math.isfinite(lon):
+                full = buffer.add(lat, lon, _parse_float(ele),
+                                  _parse_time(time), max(segment, 0),
+                                  _parse_float(hr), _parse_float(cadence),
+                                  _parse_float(power))
+
+            if container is not None:
+                container.clear()
+            else:
+                elem.clear()
+
+            if full:
+                yield buffer.take()
+
+    chunk = buffer.take()
+    if chunk is not None:
+        yield chunk
+
+
+SEMICIRCLES_TO_DEG = 180 / 2 ** 31
+
+
+def iter_fit_chunks(source, chunk_size=CHUNK_SIZE):
+    """Yield TrackChunk arrays from a binary FIT file's record messages."""
+    try:
+        import fitdecode
+    except ImportError:
+        raise ValueError("FIT import needs the optional fitdecode package") from None
+
+    buffer = _ChunkBuffer(chunk_size)
+    segment = 0
+    recorded = False
+
+    with fitdecode.FitReader(source) as fit:
+        for frame in fit:
+            if frame.frame_type != fitdecode.FIT_FRAME_DATA:
+                continue
+            if frame.name == "event" and frame.get_value("event_type", fallback=None) == "start":
+                # Resuming after a pause starts a new segment
+                if recorded:
+                    segment += 1
+                continue
+            if frame.name != "record":
+                continue
+
+            lat = frame.get_value("position_lat", fallback=None)
+            lon = frame.get_value("position_long", fallback=None)
+            if lat is None or lon is None:
+                continue
+
+            ele = frame.get_value("enhanced_altitude", fallback=None)
+            if ele is None:
+                ele = frame.get_value("altitude", fallback=None)
+            stamp = frame.get_value("timestamp", fallback=None)
+            hr = frame.get_value("heart_rate", fallback=None)
+            cadence = frame.get_value("cadence", fallback=None)
+            power = frame.get_value("power", fallback=None)
+
+            recorded = True
+            if buffer.add(
+                lat * SEMICIRCLES_TO_DEG,
+                lon * SEMICIRCLES_TO_DEG,
+                math.nan if ele is None else float(ele),
+                stamp.timestamp() if stamp is not None else math.nan,
+                segment,
+                math.nan if hr is None else float(hr),
+                math.nan if cadence is None else float(cadence),
+                math.nan if power is None else float(power),
+            ):
+                yield buffer.take()
+
+    chunk = buffer.take()
+    if chunk is not None:
+        yield chunk
+
+
+ACTIVITY_FORMATS = {
+    ".gpx": iter_track_chunks,
+    ".tcx": iter_tcx_chunks,
+    ".fit": iter_fit_chunks,
+}
+
+
+def activity_format(name):
+    """'.gpx', '.tcx' or '.fit' for a file name (a trailing .gz is ignored)."""
+    name = name.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    for ext in ACTIVITY_FORMATS:
+        if name.endswith(ext):
+            return ext
+    return None
+
+
+def iter_activity_chunks(source, name, chunk_size=CHUNK_SIZE):
+    """Stream any supported activity file, picking the reader by file name."""
+    ext = activity_format(name)
+    if ext is None:
+        raise ValueError(f"unsupported activity file: {name}")
+
+    if name.lower().endswith(".gz"):
+        import gzip
+        # Closed when the stream is exhausted or the generator is closed
+        with gzip.open(source) as unzipped:
+            yield from ACTIVITY_FORMATS[ext](unzipped, chunk_size)
+        return
+
+    yield from ACTIVITY_FORMATS[ext](source, chunk_size)
+
+
+# ==========================================================
+# INCREMENTAL DISTANCE
+# ==========================================================
+def chunk_distance_km(chunk, previous=None):
+    """Distance within a chunk, plus the hop from the previous chunk's last point.
+
+    previous is (lat, lon, segment) of the last point seen, or None.
+    """
+    lat, lon, seg = chunk.lat, chunk.lon, chunk.segment
+    if previous is not None:
+        lat = np.concatenate(([previous[0]], lat))
+        lon = np.concatenate(([previous[1]], lon))
+        seg = np.concatenate(([previous[2]], seg))
+
+    return float(segment_distances_km(lat, lon, seg).sum())
+
+
+def stream_distance_km(source, chunk_size=CHUNK_SIZE):
+    """Total distance in constant memory; points are never accumulated."""
+    total = 0.0
+    previous = None
+    for chunk in iter_track_chunks(source, chunk_size):
+        total += chunk_distance_km(chunk, previous)
+        previous = (chunk.lat[-1], chunk.lon[-1], chunk.segment[-1])
+    return total
+
+
+def read_track(source, chunk_size=CHUNK_SIZE, name=".gpx"):
+    """Parse a whole file into compact arrays, summing distance as chunks arrive."""
+    chunks = []
+    total = 0.0
+    previous = None
+    for chunk in iter_activity_chunks(source, name, chunk_size):
+        total += chunk_distance_km(chunk, previous)
+        previous = (chunk.lat[-1], chunk.lon[-1], chunk.segment[-1])
+        chunks.append(chunk)
+
+    if not chunks:
+        empty = np.empty(0)
+        return Track(empty, empty, empty, empty, np.empty(0, np.int32), 0.0)
+
+    lat, lon, ele, time, segment, hr, cadence, power = (
+        np.concatenate(column) for column in zip(*chunks)
+    )
+    return Track(
+        lat, lon, ele, time, segment, total,
+        *(s if np.isfinite(s).any() else None for s in (hr, cadence, power))
+    )
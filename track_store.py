@@ -0,0 +1,434 @@
+import argparse
+import os
+import struct
+import sys
+import tempfile
+import time as timer
+import zlib
+
+import numpy as np
+
+from sensors import load_sensors
+from track_reader import Track
+from utils import (
+    MAP_POINT_BUDGET, geohash_encode, rdp_importance, route_polyline,
+    segment_distances_km,
+)
+
+
+# "blob" stores one encoded row per workout in workout_tracks,
+# "rows" keeps the original one-row-per-point workout_points layout.
+TRACK_STORAGE = os.environ.get("FITTRACK_TRACK_STORAGE", "blob")
+
+# Rows per executemany call when writing a point stream
+INSERT_CHUNK_ROWS = 5000
+
+
+# ==========================================================
+# ROW LAYOUT (workout_points)
+# ==========================================================
+def save_track_points(conn, user_id, workout_id, track):
+    """Bulk insert a track's points for workout_id.
+
+    Runs on the caller's connection and does not commit, so the
+    workout row and its points land in the same transaction.
+    """
+    n = len(track.lat)
+    columns = (
+        track.lat.tolist(),
+        track.lon.tolist(),
+        track.ele.tolist(),
+        track.time.tolist(),
+        track.segment.tolist(),
+        geohash_encode(track.lat, track.lon).tolist(),
+    )
+
+    for start in range(0, n, INSERT_CHUNK_ROWS):
+        stop = min(start + INSERT_CHUNK_ROWS, n)
+        conn.executemany(
+            """
+            INSERT INTO workout_points
+            (user_id, workout_id, latitude, longitude, elevation, ts, segment, geohash)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            zip(
+                [user_id] * (stop - start),
+                [workout_id] * (stop - start),
+                *(col[start:stop] for col in columns)
+            )
+        )
+    return n
+
+
+def load_track_points(conn, workout_id):
+    """Stored points of a workout as a Track of NumPy arrays (NULL -> NaN)."""
+    rows = conn.execute(
+        """
+        SELECT latitude, longitude, elevation, ts, COALESCE(segment, 0)
+        FROM workout_points
+        WHERE workout_id=?
+        ORDER BY id
+        """,
+        (workout_id,)
+    ).fetchall()
+
+    data = np.array(rows, dtype=np.float64).reshape(-1, 5)
+    lat, lon, ele, time = data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+    segment = data[:, 4].astype(np.int32)
+
+    return _track(lat, lon, ele, time, segment)
+
+
+def _track(lat, lon, ele, time, segment):
+    return Track(
+        lat, lon, ele, time, segment,
+        distance_km=float(segment_distances_km(lat, lon, segment).sum())
+    )
+
+
+# ==========================================================
+# ENCODED LAYOUT (workout_tracks)
+# Header, then five little-endian int32 columns of n values:
+#   lat, lon   1e-7 degree fixed point (~1 cm)
+#   ele        decimetres
+#   time       deciseconds after t0
+#   segment    segment number
+# Each column is delta encoded with wrapping int32 arithmetic,
+# so np.cumsum(dtype=int32) restores it exactly. Missing ele or
+# time values are stored as MISSING before delta encoding.
+# ==========================================================
+MAGIC = b"FTK1"
+HEADER = struct.Struct("<4sBIxxxd")  # magic, flags, n, t0
+FLAG_ZLIB = 1
+
+COORD_SCALE = 1e7
+ELE_SCALE = 10
+TIME_SCALE = 10
+MISSING = np.iinfo(np.int32).min
+
+
+def _fixed(values, scale, offset=0.0):
+    missing = ~np.isfinite(values)
+    out = np.round((np.nan_to_num(values) - offset) * scale).astype(np.int64)
+    out[missing] = MISSING
+    return out
+
+
+def _delta(values):
+    out = np.empty(len(values), dtype=np.int64)
+    out[:1] = values[:1]
+    out[1:] = np.diff(values)
+    return out.astype(np.int32)  # wraps modulo 2**32 on purpose
+
+
+def _undelta(deltas):
+    return np.cumsum(deltas, dtype=np.int32)
+
+
+def _float(values, scale, offset=0.0):
+    out = values / scale + offset
+    out[values == MISSING] = np.nan
+    return out
+
+
+def encode_track(track, compress=True):
+    n = len(track.lat)
+    timed = np.isfinite(track.time)
+    t0 = float(track.time[timed][0]) if timed.any() else 0.0
+
+    columns = np.concatenate([
+        _delta(_fixed(track.lat, COORD_SCALE)),
+        _delta(_fixed(track.lon, COORD_SCALE)),
+        _delta(_fixed(track.ele, ELE_SCALE)),
+        _delta(_fixed(track.time, TIME_SCALE, t0)),
+        _delta(track.segment.astype(np.int64)),
+    ]).astype("<i4").tobytes()
+
+    flags = 0
+    if compress:
+        columns = zlib.compress(columns, 6)
+        flags |= FLAG_ZLIB
+
+    return HEADER.pack(MAGIC, flags, n, t0) + columns
+
+
+def decode_track(blob):
+    magic, flags, n, t0 = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("not an encoded track")
+
+    body = memoryview(blob)[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+
+    # Zero-copy view over the (decompressed) buffer
+    deltas = np.frombuffer(body, dtype="<i4", count=5 * n).reshape(5, n)
+    lat, lon, ele, time, segment = (_undelta(d) for d in deltas)
+
+    return _track(
+        lat / COORD_SCALE,
+        lon / COORD_SCALE,
+        _float(ele, ELE_SCALE),
+        _float(time, TIME_SCALE, t0),
+        segment,
+    )
+
+
+def save_track_blob(conn, user_id, workout_id, track, compress=True):
+    conn.execute(
+        """
+        INSERT OR REPLACE INTO workout_tracks (workout_id, user_id, n_points, data)
+        VALUES (?, ?, ?, ?)
+        """,
+        (workout_id, user_id, len(track.lat), encode_track(track, compress))
+    )
+    return len(track.lat)
+
+
+def load_track_blob(conn, workout_id):
+    row = conn.execute(
+        "SELECT data FROM workout_tracks WHERE workout_id=?", (workout_id,)
+    ).fetchone()
+    return decode_track(row[0]) if row else None
+
+
+# ==========================================================
+# PUBLIC API
+# ==========================================================
+def index_track_bounds(conn, user_id, workout_id, lat, lon):
+    """Keep the workout's bounding box in the spatial index current."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    ok = np.isfinite(lat) & np.isfinite(lon)
+    if not ok.any():
+        conn.execute("DELETE FROM workout_rtree WHERE id=?", (workout_id,))
+        return
+
+    conn.execute(
+        "INSERT OR REPLACE INTO workout_rtree VALUES (?, ?, ?, ?, ?, ?)",
+        (workout_id, lat[ok].min(), lat[ok].max(),
+         lon[ok].min(), lon[ok].max(), user_id)
+    )
+
+
+def save_track(conn, user_id, workout_id, track):
+    """Store a workout's points in the configured layout (no commit).
+
+    Only storage and its indexes; features derived from the track
+    are updated by activities.save_activity.
+    """
+    conn.execute("DELETE FROM workout_geometry WHERE workout_id=?", (workout_id,))
+    index_track_bounds(conn, user_id, workout_id, track.lat, track.lon)
+    if TRACK_STORAGE == "rows":
+        # Replace, as the blob's INSERT OR REPLACE does; a blob left
+        # from the other layout would shadow the rows in load_track
+        conn.execute("DELETE FROM workout_points WHERE workout_id=?", (workout_id,))
+        conn.execute("DELETE FROM workout_tracks WHERE workout_id=?", (workout_id,))
+        return save_track_points(conn, user_id, workout_id, track)
+    return save_track_blob(conn, user_id, workout_id, track)
+
+
+def load_track(conn, workout_id, sensors=False):
+    """Points of a workout from whichever layout holds them.
+
+    sensors=True also attaches its heart rate / cadence / power.
+    """
+    track = load_track_blob(conn, workout_id)
+    if track is None:
+        track = load_track_points(conn, workout_id)
+    if sensors:
+        track = track._replace(**load_sensors(conn, workout_id))
+    return track
+
+
+# ==========================================================
+# SIMPLIFIED GEOMETRY CACHE
+# RDP importance is computed once per workout and stored, so any
+# zoom level or point budget is a threshold, not a re-simplify.
+# ==========================================================
+def route_importance(conn, workout_id, track=None):
+    """Stored RDP importance, computed and cached on first use (no commit)."""
+    row = conn.execute(
+        "SELECT importance FROM workout_geometry WHERE workout_id=?",
+        (workout_id,)
+    ).fetchone()
+    if row:
+        return np.frombuffer(zlib.decompress(row[0]), dtype="<f4")
+
+    if track is None:
+        track = load_track(conn, workout_id)
+    importance = rdp_importance(track.lat, track.lon).astype("<f4")
+
+    conn.execute(
+        "INSERT OR REPLACE INTO workout_geometry (workout_id, importance) VALUES (?, ?)",
+        (workout_id, zlib.compress(importance.tobytes()))
+    )
+    return importance
+
+
+def cached_route_polyline(conn, workout_id, track=None, zoom=None,
+                          max_points=MAP_POINT_BUDGET):
+    if track is None:
+        track = load_track(conn, workout_id)
+    importance = route_importance(conn, workout_id, track)
+    return route_polyline(track.lat, track.lon, importance, zoom, max_points)
+
+
+def workouts_with_points(conn, user_id):
+    return conn.execute(
+        """
+        SELECT w.id, w.title, w.date, w.distance_km
+        FROM workouts w
+        WHERE w.user_id=?
+          AND (
+            EXISTS (SELECT 1 FROM workout_tracks t WHERE t.workout_id = w.id)
+            OR EXISTS (SELECT 1 FROM workout_points p WHERE p.workout_id = w.id)
+          )
+        ORDER BY w.date DESC
+        """,
+        (user_id,)
+    ).fetchall()
+
+
+# ==========================================================
+# MIGRATION TOOL
+# ==========================================================
+def migrate_points_to_blobs(conn, delete_rows=False, progress=None):
+    """Encode every workout that still only has workout_points rows.
+
+    Commits per workout, so an interrupted run resumes where it
+    stopped. Returns the number of workouts converted.
+    """
+    pending = conn.execute(
+        """
+        SELECT p.workout_id, MIN(p.user_id)
+        FROM workout_points p
+        LEFT JOIN workout_tracks t ON t.workout_id = p.workout_id
+        WHERE t.workout_id IS NULL AND p.workout_id IS NOT NULL
+        GROUP BY p.workout_id
+        """
+    ).fetchall()
+
+    for done, (workout_id, user_id) in enumerate(pending, 1):
+        save_track_blob(conn, user_id, workout_id,
+                        load_track_points(conn, workout_id))
+        if delete_rows:
+            conn.execute("DELETE FROM workout_points WHERE workout_id=?",
+                         (workout_id,))
+        conn.commit()
+
+        if progress:
+            progress(done, len(pending))
+
+    return len(pending)
+
+
+# ==========================================================
+# BENCHMARK
+# Row layout vs encoded layout on a synthetic 1 Hz track
+# ==========================================================
+def synthetic_track(n, seed=0):
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.05, n))
+    step = 3e-5  # ~3 m per second
+    lat = 47.0 + np.cumsum(step * np.cos(heading))
+    lon = 8.0 + np.cumsum(step * np.sin(heading))
+    ele = 400 + np.cumsum(rng.normal(0, 0.2, n))
+    time = 1.7e9 + np.arange(n, dtype=np.float64)
+    return _track(lat, lon, ele, time, np.zeros(n, dtype=np.int32))
+
+
+def benchmark(n_points=100_000, n_workouts=10):
+    import db
+
+    track = synthetic_track(n_points)
+    results = []
+
+    for layout in ("rows", "blob", "blob-raw"):
+        with tempfile.TemporaryDirectory() as tmp:
+            db.close_pool()
+            old_path, db.DB_PATH = db.DB_PATH, os.path.join(tmp, "bench.db")
+            try:
+                db.ensure_schema()
+                with db.connection() as conn:
+                    ids = []
+                    for _ in range(n_workouts):
+                        cur = conn.execute(
+                            "INSERT INTO workouts (user_id, title) VALUES (1, 'bench')"
+                        )
+                        ids.append(cur.lastrowid)
+
+                    before = os.path.getsize(db.DB_PATH)
+                    start = timer.perf_counter()
+                    for workout_id in ids:
+                        if layout == "rows":
+                            save_track_points(conn, 1, workout_id, track)
+                        else:
+                            save_track_blob(conn, 1, workout_id, track,
+                                            compress=layout == "blob")
+                    conn.commit()
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                    write_s = timer.perf_counter() - start
+                    size = os.path.getsize(db.DB_PATH) - before
+
+                    start = timer.perf_counter()
+                    for workout_id in ids:
+                        if layout == "rows":
+                            load_track_points(conn, workout_id)
+                        else:
+                            load_track_blob(conn, workout_id)
+                    read_s = timer.perf_counter() - start
+            finally:
+                db.close_pool()
+                db.DB_PATH = old_path
+
+        total = n_points * n_workouts
+        results.append((layout, size / total, write_s, read_s / n_workouts))
+
+    print(f"{n_workouts} workouts x {n_points} points")
+    print(f"{'layout':<10}{'bytes/pt':>10}{'write s':>10}{'read ms':>10}")
+    for layout, per_point, write_s, read_s in results:
+        print(f"{layout:<10}{per_point:>10.1f}{write_s:>10.2f}{read_s * 1000:>10.1f}")
+    return results
+
+
+# ==========================================================
+# CLI
+#   python track_store.py migrate [--delete-rows]
+#   python track_store.py benchmark [--points N] [--workouts N]
+# ==========================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="FitTrack track storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    migrate = sub.add_parser("migrate", help="encode workout_points into workout_tracks")
+    migrate.add_argument("--delete-rows", action="store_true",
+                         help="drop workout_points rows once encoded")
+
+    bench = sub.add_parser("benchmark", help="compare row and encoded layouts")
+    bench.add_argument("--points", type=int, default=100_000)
+    bench.add_argument("--workouts", type=int, default=10)
+
+    args = parser.parse_args(argv)
+
+    if args.command == "benchmark":
+        benchmark(args.points, args.workouts)
+        return 0
+
+    import db
+
+    db.ensure_schema()
+    with db.connection() as conn:
+        count = migrate_points_to_blobs(
+            conn,
+            delete_rows=args.delete_rows,
+            progress=lambda done, total: print(f"\r{done}/{total}", end="")
+        )
+        if args.delete_rows and count:
+            conn.execute("VACUUM")
+    print(f"\nConverted {count} workouts")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,7 @@
-import pandas as pd
+import numpy as np
 import math
+from datetime import date, datetime, time, timezone
+from typing import NamedTuple
 
 
 # ==========================================================
@@ -7,30 +9,293 @@ import math
 # Handles mixed formats safely
 # ==========================================================
 def safe_to_datetime(series):
+    # pandas is imported here so db/utils stay light for the login
+    # page and for batch workers
+    import pandas as pd
+
     return pd.to_datetime(series, errors="coerce")
 
 
+# ==========================================================
+# INTEGER DATE KEYS
+# (epoch day, epoch seconds) stored next to every ISO "date"
+# so range filters and group-bys run on indexed integers.
+# Naive values are treated as UTC, matching SQLite strftime('%s').
+# ==========================================================
+def date_keys(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    elif isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time())
+
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+
+    ts = math.floor(value.timestamp())
+    return ts // 86400, ts
+
+
+def epoch_day(value):
+    return date_keys(value)[0]
+
+
 # ==========================================================
 # HAVERSINE DISTANCE (KM)
+# Vectorized: lat/lon may be scalars or NumPy arrays.
 # ==========================================================
-def haversine_km(a, b):
-    lat1, lon1 = a
-    lat2, lon2 = b
+EARTH_RADIUS_KM = 6371
 
-    R = 6371  # Earth radius in km
+# Hops slower than this count as standing still for moving time
+MOVING_MIN_SPEED_MS = 0.5
 
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
 
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
+def haversine_pairs_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
 
     x = (
-        math.sin(dphi / 2) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(x, 0, 1)))
+
+
+def haversine_km(a, b):
+    return float(haversine_pairs_km(a[0], a[1], b[0], b[1]))
+
+
+def segment_distances_km(lat, lon, segment=None):
+    """Length of each hop between consecutive points (n - 1 values).
+
+    Hops that cross from one track segment to the next are zero.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    if len(lat) < 2:
+        return np.zeros(0)
+
+    d = haversine_pairs_km(lat[:-1], lon[:-1], lat[1:], lon[1:])
+    if segment is not None:
+        segment = np.asarray(segment)
+        d[segment[1:] != segment[:-1]] = 0.0
+    return np.nan_to_num(d)
+
+
+# ==========================================================
+# TRACK METRICS
+# One pass over the point arrays for everything the GPX and
+# map pages show. ele and time (epoch seconds) are optional
+# and may contain NaN.
+# ==========================================================
+class TrackMetrics(NamedTuple):
+    segment_km: np.ndarray
+    cumulative_km: np.ndarray
+    distance_km: float
+    elapsed_s: float
+    moving_s: float
+    ascent_m: float
+    descent_m: float
+    splits_s: np.ndarray  # seconds taken for each full kilometre
+
+
+def track_metrics(lat, lon, ele=None, time=None, segment=None):
+    seg_km = segment_distances_km(lat, lon, segment)
+    cum_km = np.concatenate(([0.0], np.cumsum(seg_km)))
+
+    same = np.ones(len(seg_km), dtype=bool)
+    if segment is not None and len(seg_km):
+        segment = np.asarray(segment)
+        same = segment[1:] == segment[:-1]
+
+    ascent = descent = 0.0
+    if ele is not None and len(seg_km):
+        de = np.diff(np.asarray(ele, dtype=np.float64))
+        de = np.where(same & np.isfinite(de), de, 0.0)
+        ascent = float(de[de > 0].sum())
+        descent = float(-de[de < 0].sum())
+
+    elapsed = moving = 0.0
+    splits = np.zeros(0)
+    if time is not None and len(seg_km):
+        time = np.asarray(time, dtype=np.float64)
+        dt = np.diff(time)
+        ok = same & np.isfinite(dt) & (dt > 0)
+
+        elapsed = float(dt[ok].sum())
+        speed_ms = np.divide(seg_km * 1000, dt, out=np.zeros_like(dt), where=ok)
+        moving = float(dt[ok & (speed_ms >= MOVING_MIN_SPEED_MS)].sum())
+
+        timed = np.isfinite(time)
+        full_km = int(cum_km[-1])
+        if full_km and timed.sum() >= 2:
+            marks = np.arange(full_km + 1, dtype=np.float64)
+            at = np.interp(marks, cum_km[timed], time[timed])
+            splits = np.diff(at)
+
+    return TrackMetrics(
+        segment_km=seg_km,
+        cumulative_km=cum_km,
+        distance_km=float(cum_km[-1]),
+        elapsed_s=elapsed,
+        moving_s=moving,
+        ascent_m=ascent,
+        descent_m=descent,
+        splits_s=splits,
     )
 
-    return 2 * R * math.atan2(math.sqrt(x), math.sqrt(1 - x))
+
+# ==========================================================
+# ROUTE SIMPLIFICATION
+# Ramer-Douglas-Peucker run once per track to rank every point
+# by the tolerance (metres) at which it would be dropped. Any
+# zoom tolerance or point budget is then a cheap threshold.
+# ==========================================================
+WEB_MERCATOR_M_PER_PX = 156543.03392
+
+# Upper bound on vertices sent to the browser per route
+MAP_POINT_BUDGET = 2000
+
+
+def _project_m(lat, lon):
+    # Local equirectangular projection, fine for a single route
+    lat0 = np.radians(np.nanmean(lat))
+    x = np.radians(lon) * np.cos(lat0) * EARTH_RADIUS_KM * 1000
+    y = np.radians(lat) * EARTH_RADIUS_KM * 1000
+    return x, y
+
+
+def rdp_importance(lat, lon):
+    """Per-point RDP significance in metres; endpoints are inf.
+
+    Splits every open interval of one recursion level in a single
+    vectorized pass. A point never outranks the point whose split
+    created its interval, so thresholds give nested simplifications.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    n = len(lat)
+    importance = np.full(n, np.inf)
+    if n <= 2:
+        return importance
+
+    x, y = _project_m(lat, lon)
+    kept = np.array([0, n - 1])
+    interior = np.ones(n, dtype=bool)
+    interior[kept] = False
+
+    while True:
+        idx = np.flatnonzero(interior)
+        if not len(idx):
+            return importance
+
+        seg = np.searchsorted(kept, idx) - 1
+        a, b = kept[seg], kept[seg + 1]
+
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        px, py = x[idx] - x[a], y[idx] - y[a]
+        norm = np.hypot(dx, dy)
+        d = np.where(
+            norm > 0,
+            np.abs(dy * px - dx * py) / np.where(norm > 0, norm, 1),
+            np.hypot(px, py)
+        )
+
+        # Farthest point of every interval (first one on ties); idx is
+        # sorted, so each interval's points are contiguous
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(seg)) + 1))
+        longest = np.maximum.reduceat(d, starts)
+        counts = np.diff(np.append(starts, len(d)))
+        hits = np.flatnonzero(d == np.repeat(longest, counts))
+        pick = hits[np.concatenate(([True], np.diff(seg[hits]) != 0))]
+
+        winners = idx[pick]
+        parent = np.minimum(importance[a[pick]], importance[b[pick]])
+        importance[winners] = np.minimum(d[pick], parent)
+
+        interior[winners] = False
+        kept = np.flatnonzero(~interior)
+
+
+def simplify_track(lat, lon, tolerance_m=0.0, max_points=None, importance=None):
+    """Indices of the points to keep, in track order."""
+    if importance is None:
+        importance = rdp_importance(lat, lon)
+
+    keep = np.flatnonzero(importance > tolerance_m)
+    if max_points is not None and len(keep) > max_points:
+        top = np.argpartition(-importance[keep], max_points - 1)[:max_points]
+        keep = np.sort(keep[top])
+    return keep
+
+
+def route_polyline(lat, lon, importance=None, zoom=None, max_points=MAP_POINT_BUDGET):
+    """[[lat, lon], ...] for folium, bounded by max_points.
+
+    Detail finer than one pixel at the given zoom (default: the zoom
+    that fits the whole route) is dropped first.
+    """
+    if not len(lat):
+        return []
+    if zoom is None:
+        zoom = fit_zoom(lat, lon)
+    tolerance = zoom_tolerance_m(zoom, float(np.nanmean(lat)))
+    keep = simplify_track(lat, lon, tolerance, max_points, importance)
+    return np.column_stack([lat[keep], lon[keep]]).tolist()
+
+
+def zoom_tolerance_m(zoom, lat, pixels=1.0):
+    """Ground distance covered by a few screen pixels at a web map zoom."""
+    return pixels * WEB_MERCATOR_M_PER_PX * math.cos(math.radians(lat)) / 2 ** zoom
+
+
+def fit_zoom(lat, lon, width_px=800, height_px=450, max_zoom=18):
+    """Zoom level at which the track's bounding box fills the map."""
+    lat_span = max(float(np.nanmax(lat) - np.nanmin(lat)), 1e-6)
+    lon_span = max(float(np.nanmax(lon) - np.nanmin(lon)), 1e-6)
+    zoom_x = math.log2(width_px * 360 / (256 * lon_span))
+    zoom_y = math.log2(height_px * 180 / (256 * lat_span))
+    return int(max(0, min(max_zoom, zoom_x, zoom_y)))
+
+
+# ==========================================================
+# GEOHASH
+# Vectorized standard geohash (base32, longitude bit first).
+# Precision 7 cells are about 153 m x 153 m at the equator.
+# ==========================================================
+GEOHASH_BASE32 = np.frombuffer(b"0123456789bcdefghjkmnpqrstuvwxyz", dtype=np.uint8)
+GEOHASH_PRECISION = 7
+
+
+def geohash_code(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash cells as int64 (the 5 * precision interleaved bits)."""
+    lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+    lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+
+    # Cell index along each axis, clamped so +90 / +180 stay in range
+    x = np.clip(((lon + 180) / 360 * (1 << lon_bits)).astype(np.int64), 0, (1 << lon_bits) - 1)
+    y = np.clip(((lat + 90) / 180 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+
+    # Interleave, most significant first: even bits from lon, odd from lat
+    code = np.zeros(len(lat), dtype=np.int64)
+    for i in range(bits):
+        if i % 2 == 0:
+            bit = (x >> (lon_bits - 1 - i // 2)) & 1
+        else:
+            bit = (y >> (lat_bits - 1 - i // 2)) & 1
+        code = (code << 1) | bit
+    return code
+
+
+def geohash_encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Geohash strings for coordinate arrays (numpy array of str)."""
+    code = geohash_code(lat, lon, precision)
+    shifts = 5 * np.arange(precision - 1, -1, -1)
+    chars = GEOHASH_BASE32[(code[:, None] >> shifts) & 31]
+    return np.frombuffer(chars.tobytes(), dtype=f"S{precision}").astype(str)
 
 
 # ==========================================================